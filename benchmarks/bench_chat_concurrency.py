@@ -0,0 +1,61 @@
+"""Benchmark: concurrent chat throughput against the local stub model backend.
+
+Runs entirely offline by setting MODEL_BACKEND=stub before the app is imported.
+
+Usage:
+    python benchmarks/bench_chat_concurrency.py --requests 200 --concurrency 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def run(requests, concurrency):
+    import httpx
+    from main import app
+    from pdf_routes import pdf_storage
+
+    pdf_storage["bench_pdf"] = {
+        "filename": "bench.pdf",
+        "text": "Benchmark document text. " * 200,
+        "page_count": 1
+    }
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i):
+            async with semaphore:
+                # Distinct queries so the response cache is never hit
+                response = await client.post(
+                    "/v1/chat/bench_pdf", json={"query": f"question {i}", "full_context": True})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    os.environ["MODEL_BACKEND"] = "stub"
+    os.environ["STUB_MODEL_LATENCY"] = str(args.latency)
+
+    elapsed = asyncio.run(run(args.requests, args.concurrency))
+    serial = args.requests * args.latency
+    print(f"requests={args.requests} concurrency={args.concurrency} model latency={args.latency}s")
+    print(f"elapsed {elapsed:.2f}s, {args.requests / elapsed:.1f} req/s "
+          f"(fully serialized would take {serial:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
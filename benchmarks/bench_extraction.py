@@ -0,0 +1,79 @@
+"""Benchmark: legacy serial extraction vs. the page-parallel extraction engine.
+
+Usage:
+    python benchmarks/bench_extraction.py --pages 300 --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_processing import extract_pdf_pages  # noqa: E402
+from text_normalization import normalize_text  # noqa: E402
+
+
+def generate_pdf(path, pages, lines_per_page=45):
+    c = canvas.Canvas(path, pagesize=letter)
+    _, height = letter
+    for page in range(pages):
+        for line in range(lines_per_page):
+            c.drawString(40, height - 40 - line * 15,
+                         f"Page {page + 1} line {line + 1}: the quick brown fox jumps over the lazy dog.")
+        c.showPage()
+    c.save()
+
+
+def legacy_extract(path):
+    """The original implementation: extract_text() is called twice per page."""
+    with pdfplumber.open(path) as pdf:
+        full_text = ''.join([page.extract_text()
+                            for page in pdf.pages if page.extract_text()])
+        return normalize_text(full_text)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--pages-per-task", type=int, default=25)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        generate_pdf(path, args.pages)
+
+        legacy_time, _ = timed(legacy_extract, path)
+        serial_time, (_, serial_text) = timed(
+            extract_pdf_pages, path, pages_per_task=args.pages_per_task)
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            executor.submit(int).result()  # start the workers outside the timing
+            parallel_time, (_, parallel_text) = timed(
+                extract_pdf_pages, path, executor, pages_per_task=args.pages_per_task)
+
+        assert serial_text == parallel_text
+
+        print(f"pages={args.pages} workers={args.workers}")
+        print(f"legacy (2x extract_text)  {legacy_time:8.2f}s")
+        print(f"single pass, serial       {serial_time:8.2f}s  ({legacy_time / serial_time:.2f}x)")
+        print(f"single pass, parallel     {parallel_time:8.2f}s  ({legacy_time / parallel_time:.2f}x)")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark: per-request logging cost on the calling thread, before and after the queue pipeline.
+
+"Before" is the original setup: a synchronous RotatingFileHandler at DEBUG
+with eager f-string messages. "After" is logging_config's queue handler with
+%-style arguments, at INFO, formatted and written on the listener thread.
+
+Usage:
+    python benchmarks/bench_logging.py --requests 20000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+METHOD, URL, PDF_ID = "POST", "http://127.0.0.1:8000/v1/chat/3f1c", "3f1c9a2e-5b7d-4c1e-9f00-1a2b3c4d5e6f"
+
+
+def legacy_logger(path):
+    formatter = logging.Formatter(json.dumps({
+        "level": "%(levelname)s",
+        "time": "%(asctime)s",
+        "message": "%(message)s",
+        "path": "%(pathname)s",
+        "line": "%(lineno)d"
+    }))
+    handler = RotatingFileHandler(path, maxBytes=1000000, backupCount=3)
+    handler.setFormatter(formatter)
+    logger = logging.getLogger("bench_legacy")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    logger.propagate = False
+    return logger
+
+
+def legacy_request(logger, i):
+    logger.info(f"Received request: {METHOD} {URL}")
+    logger.info(f"Received chat request for PDF ID: {PDF_ID}")
+    logger.debug(f"Uploaded file details: filename=file{i}.pdf, content_type=application/pdf")
+    logger.info(f"Completed request: {METHOD} {URL} with status 200")
+
+
+def queued_request(logger, i):
+    sampled = {"sampled": True}
+    logger.info("Received request: %s %s", METHOD, URL, extra=sampled)
+    logger.info("Received chat request for PDF ID: %s", PDF_ID)
+    logger.debug("Uploaded file details: filename=%s, content_type=%s", f"file{i}.pdf",
+                 "application/pdf")
+    logger.info("Completed request: %s %s with status %s", METHOD, URL, 200, extra=sampled)
+
+
+def measure(request_fn, logger, requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        request_fn(logger, i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["LOG_FILE"] = os.path.join(directory, "queued.log")
+    os.environ.setdefault("LOG_LEVEL", "INFO")
+    # Room for every record, so none are dropped and the comparison is fair
+    os.environ["LOG_QUEUE_SIZE"] = str(args.requests * 4 + 1)
+    from logging_config import logger, queue_handler, stop_logging
+
+    logger.propagate = False
+    before = measure(legacy_request, legacy_logger(os.path.join(directory, "legacy.log")),
+                     args.requests)
+    after = measure(queued_request, logger, args.requests)
+    stop_logging()
+
+    print(f"requests={args.requests} (4 log calls each)")
+    print(f"before: sync file handler, f-strings, DEBUG   {before:7.1f} us/request")
+    print(f"after:  queue handler, lazy args, {os.environ['LOG_LEVEL']:<5}        {after:7.1f} us/request"
+          f"  ({before / after:.1f}x, {queue_handler.dropped} records dropped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Deterministic synthetic PDF corpus for the benchmark suite.
+
+Every document is generated from a fixed seed, so the same spec always
+produces the same text (and a cached file can be reused between runs).
+expected_words() regenerates a document's words without the PDF, as ground
+truth for extraction fidelity. raw_page_texts() generates extractor-like
+page text with non-ASCII scripts, for text normalization benchmarks.
+"""
+import os
+import random
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter, A6
+from reportlab.pdfgen import canvas
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, PageBreak
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".corpus")
+
+WORDS = ("contract party agreement payment term notice liability warranty service delivery "
+         "invoice refund policy schedule clause section annex obligation period renewal "
+         "termination confidential information provider customer fee data report").split()
+
+# German and Turkish words, including ligatures and characters outside Latin-1
+# that the standard PDF fonts cannot draw
+MULTILINGUAL_WORDS = ("Vertragspartei Kündigung Gewährleistung Lieferung Rückerstattung Frist "
+                      "Geschäftsbedingungen Haftung Zahlungsfrist Straße \ufb01nanziell o\ufb00en "
+                      "sözleşme taraf ödeme süre fesih garanti teslimat iade ücret müşteri "
+                      "bilgi hizmet yükümlülük gizlilik ışık ağaç").split()
+
+# (name, kind, pages)
+PROFILES = {
+    "quick": [
+        ("text-1", "text", 1),
+        ("text-20", "text", 20),
+        ("table-10", "table", 10),
+        ("small-50", "small", 50),
+    ],
+    "full": [
+        ("text-1", "text", 1),
+        ("text-100", "text", 100),
+        ("text-500", "text", 500),
+        ("text-2000", "text", 2000),
+        ("table-100", "table", 100),
+        ("table-500", "table", 500),
+        ("small-1000", "small", 1000),
+        ("small-2000", "small", 2000),
+    ],
+}
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _text_content(pages, rng):
+    return [[f"Section {page + 1}"] + [_sentence(rng) for _ in range(48)] for page in range(pages)]
+
+
+def _text_pdf(path, content):
+    c = canvas.Canvas(path, pagesize=letter, invariant=1)
+    _, height = letter
+    for heading, *lines in content:
+        c.drawString(40, height - 40, heading)
+        for line, sentence in enumerate(lines):
+            c.drawString(40, height - 70 - line * 14, sentence)
+        c.showPage()
+    c.save()
+
+
+def _table_content(pages, rng):
+    content = []
+    for page in range(pages):
+        rows = [["Item", "Description", "Qty", "Unit price", "Total"]]
+        for row in range(35):
+            qty, price = rng.randint(1, 99), rng.randint(100, 99999) / 100
+            rows.append([f"{page + 1}-{row + 1}", " ".join(rng.choice(WORDS) for _ in range(4)),
+                         str(qty), f"{price:.2f}", f"{qty * price:.2f}"])
+        content.append(rows)
+    return content
+
+
+def _table_pdf(path, content):
+    doc = SimpleDocTemplate(path, pagesize=letter, invariant=1)
+    style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ])
+    elements = []
+    for rows in content:
+        table = Table(rows)
+        table.setStyle(style)
+        elements.extend([table, PageBreak()])
+    doc.build(elements)
+
+
+def _small_content(pages, rng):
+    return [[f"Slide {page + 1}", _sentence(rng, words=6)] for page in range(pages)]
+
+
+def _small_pdf(path, content):
+    c = canvas.Canvas(path, pagesize=A6, invariant=1)
+    _, height = A6
+    for heading, sentence in content:
+        c.drawString(20, height - 30, heading)
+        c.drawString(20, height - 50, sentence)
+        c.showPage()
+    c.save()
+
+
+# kind -> (content(pages, rng), render(path, content)); content is a list of
+# pages, each a list of lines (or table rows)
+GENERATORS = {
+    "text": (_text_content, _text_pdf),
+    "table": (_table_content, _table_pdf),
+    "small": (_small_content, _small_pdf),
+}
+
+
+def _content(name, kind, pages):
+    make_content, _ = GENERATORS[kind]
+    return make_content(pages, random.Random(f"{name}:{kind}:{pages}"))
+
+
+def expected_words(name, kind, pages):
+    """Returns the words drawn on each page of the document, in reading order."""
+    words = []
+    for page in _content(name, kind, pages):
+        for line in page:
+            words.extend(" ".join(line).split() if isinstance(line, list) else line.split())
+    return words
+
+
+def raw_page_texts(pages, words=WORDS, seed="raw"):
+    """Page texts as an extractor returns them: lines broken with newlines,
+    some words hyphenated across lines and irregular spacing."""
+    rng = random.Random(f"{seed}:{pages}")
+    texts = []
+    for page in range(pages):
+        lines = []
+        for _ in range(48):
+            line = "  ".join(rng.choice(words) for _ in range(12))
+            if rng.random() < 0.2:
+                word = rng.choice(words)
+                line += f" {word[:len(word) // 2]}-\n{word[len(word) // 2:]}"
+            lines.append(line)
+        texts.append(f"Page {page + 1}\n" + "\n".join(lines) + "\n")
+    return texts
+
+
+def build_document(name, kind, pages, directory=CORPUS_DIR):
+    """Returns the path of the corpus document, generating it if it is not cached."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.pdf")
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        GENERATORS[kind][1](partial, _content(name, kind, pages))
+        os.replace(partial, path)
+    return path
+
+
+def build_corpus(profile="quick", directory=CORPUS_DIR):
+    """Returns [(name, kind, pages, path)] for every document in the profile."""
+    return [(name, kind, pages, build_document(name, kind, pages, directory))
+            for name, kind, pages in PROFILES[profile]]
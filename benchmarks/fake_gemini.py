@@ -0,0 +1,211 @@
+"""Local stand-in for the Gemini REST API, for load tests.
+
+Serves generateContent and streamGenerateContent with a configurable latency,
+token rate and error/429 injection. Point the app at it with:
+
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8090 GEMINI_TRANSPORT=rest GEMINI_API_KEY=fake
+
+Usage:
+    python benchmarks/fake_gemini.py --port 8090 --latency 0.3 --tokens-per-second 200 \\
+        --output-tokens 150 --rate-limit-rpm 600 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FakeGeminiSettings:
+    def __init__(self, latency=0.3, tokens_per_second=200.0, output_tokens=150,
+                 error_rate=0.0, throttle_rate=0.0, rate_limit_rpm=0, retry_after=1,
+                 seed=None):
+        self.latency = latency                      # seconds before the first token
+        self.tokens_per_second = tokens_per_second  # generation speed after the first token
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate                # fraction of requests answered with 500
+        self.throttle_rate = throttle_rate          # fraction of requests answered with 429
+        self.rate_limit_rpm = rate_limit_rpm        # 429 beyond this many requests per minute (0 = off)
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+
+class FakeGeminiStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"ok": 0, "throttled": 0, "errors": 0, "streams": 0}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def add(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.counts, "in_flight": self.in_flight, "max_in_flight": self.max_in_flight}
+
+
+def _error(code, status, message, headers=None):
+    return JSONResponse({"error": {"code": code, "message": message, "status": status}},
+                        status_code=code, headers=headers)
+
+
+def _chunk(text, prompt_tokens, output_tokens, finished):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+    }
+
+
+def _prompt_text(body):
+    return "".join(part.get("text", "")
+                   for content in body.get("contents", [])
+                   for part in content.get("parts", []))
+
+
+def _json_answer(body, words):
+    """Structured-output requests (packed batch questions) get one answer per numbered question."""
+    questions = re.findall(r"^\d+\. ", _prompt_text(body).rsplit("Questions:", 1)[-1], re.MULTILINE)
+    return json.dumps([" ".join(words)] * len(questions))
+
+
+def create_app(settings=None):
+    settings = settings or FakeGeminiSettings()
+    stats = FakeGeminiStats()
+    window = deque()
+    window_lock = threading.Lock()
+    app = FastAPI(title="Fake Gemini")
+    app.state.settings = settings
+    app.state.stats = stats
+
+    def rejection():
+        """Returns an error response for this request, or None to serve it."""
+        if settings.rate_limit_rpm:
+            now = time.monotonic()
+            with window_lock:
+                while window and window[0] <= now - 60:
+                    window.popleft()
+                if len(window) >= settings.rate_limit_rpm:
+                    limited = True
+                else:
+                    window.append(now)
+                    limited = False
+            if limited:
+                return _error(429, "RESOURCE_EXHAUSTED", "Quota exceeded (requests per minute).",
+                              {"Retry-After": str(settings.retry_after)})
+        roll = settings.random.random()
+        if roll < settings.throttle_rate:
+            return _error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted.",
+                          {"Retry-After": str(settings.retry_after)})
+        if roll < settings.throttle_rate + settings.error_rate:
+            return _error(500, "INTERNAL", "Injected server error.")
+        return None
+
+    def words():
+        return [f"token{i}" for i in range(settings.output_tokens)]
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.snapshot()
+
+    @app.post("/v1beta/models/{target}")
+    async def model_method(target: str, request: Request):
+        model, _, method = target.partition(":")
+        if method not in ("generateContent", "streamGenerateContent"):
+            return _error(404, "NOT_FOUND", f"Unknown method {method!r}.")
+        body = await request.json()
+        prompt_tokens = max(1, len(_prompt_text(body)) // 4)
+
+        rejected = rejection()
+        if rejected is not None:
+            stats.add("throttled" if rejected.status_code == 429 else "errors")
+            return rejected
+
+        if method == "generateContent":
+            stats.enter()
+            try:
+                await asyncio.sleep(settings.latency
+                                    + settings.output_tokens / settings.tokens_per_second)
+            finally:
+                stats.leave()
+            stats.add("ok")
+            if body.get("generationConfig", {}).get("responseMimeType") == "application/json":
+                return _chunk(_json_answer(body, words()), prompt_tokens, settings.output_tokens, True)
+            return _chunk(" ".join(words()), prompt_tokens, settings.output_tokens, True)
+
+        async def stream():
+            # The REST transport reads streamed responses as one JSON array
+            stats.enter()
+            try:
+                await asyncio.sleep(settings.latency)
+                tokens = words()
+                yield "["
+                for i, word in enumerate(tokens):
+                    if i:
+                        await asyncio.sleep(1 / settings.tokens_per_second)
+                        yield ",\n"
+                    text = word if i == 0 else " " + word
+                    yield json.dumps(_chunk(text, prompt_tokens, i + 1, i == len(tokens) - 1))
+                yield "]"
+                stats.add("ok")
+            finally:
+                stats.leave()
+
+        stats.add("streams")
+        return StreamingResponse(stream(), media_type="application/json")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--output-tokens", type=int, default=150)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 429 regardless of load")
+    parser.add_argument("--rate-limit-rpm", type=int, default=0,
+                        help="answer 429 beyond this many requests per minute (0 = unlimited)")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    settings = FakeGeminiSettings(
+        latency=args.latency, tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, rate_limit_rpm=args.rate_limit_rpm,
+        retry_after=args.retry_after, seed=args.seed)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Load generator for a running PdfChat server.
+
+Drives /v1/pdf or /v1/chat/{pdf_id} at a series of concurrency levels and
+reports throughput, p50/p95/p99 latency and status codes per level.
+
+With --start, it launches the fake Gemini server (benchmarks/fake_gemini.py)
+and the app under uvicorn pointed at it, so no API key or quota is used.
+
+Usage:
+    # Against a server you started yourself
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8000 --mode chat --concurrency 1 8 32 64
+    # Self-contained, with a 429 storm from the fake model
+    python benchmarks/load_test.py --start --mode chat --concurrency 8 32 --fake-throttle-rate 0.3
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import build_document  # noqa: E402
+
+MODES = ("chat", "stream", "upload", "upload-async")
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def unique_pdf(data):
+    # Bytes after %%EOF are ignored by PDF readers but change the content hash,
+    # so duplicate detection never short-circuits an upload.
+    return data + f"\n% {uuid.uuid4().hex}\n".encode()
+
+
+async def upload_document(client, data, name="load.pdf"):
+    response = await client.post("/v1/pdf", files={"file": (name, data, "application/pdf")})
+    response.raise_for_status()
+    return response.json()["pdf_id"]
+
+
+async def one_request(client, mode, pdf_id, pdf_data, index):
+    """Runs one request and returns (status, latency, time_to_first_byte)."""
+    start = time.perf_counter()
+    first = None
+    if mode == "chat":
+        response = await client.post(f"/v1/chat/{pdf_id}",
+                                     json={"query": f"Question {index} ({uuid.uuid4().hex[:8]})?"})
+        status = response.status_code
+    elif mode == "stream":
+        async with client.stream("POST", f"/v1/chat/{pdf_id}/stream",
+                                 json={"query": f"Question {index} ({uuid.uuid4().hex[:8]})?"}) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if first is None and line.startswith("event: token"):
+                    first = time.perf_counter() - start
+                if line.startswith("event: error"):
+                    status = "stream-error"
+    elif mode == "upload":
+        response = await client.post(
+            "/v1/pdf", files={"file": ("load.pdf", unique_pdf(pdf_data), "application/pdf")})
+        status = response.status_code
+    else:  # upload-async: submit, then poll until the job finishes
+        response = await client.post(
+            "/v1/pdf", params={"async": "true"},
+            files={"file": ("load.pdf", unique_pdf(pdf_data), "application/pdf")})
+        status = response.status_code
+        if status == 202:
+            first = time.perf_counter() - start
+            job_id = response.json()["pdf_id"]
+            while True:
+                job = (await client.get(f"/v1/pdf/{job_id}/status")).json()
+                if job["status"] in ("completed", "failed"):
+                    status = 200 if job["status"] == "completed" else "job-failed"
+                    break
+                await asyncio.sleep(0.05)
+    return status, time.perf_counter() - start, first
+
+
+async def run_level(client, mode, pdf_id, pdf_data, concurrency, requests):
+    statuses = Counter()
+    latencies = []
+    first_bytes = []
+    next_index = iter(range(requests))
+
+    async def worker():
+        for index in next_index:
+            try:
+                status, latency, first = await one_request(client, mode, pdf_id, pdf_data, index)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(latency)
+                if first is not None:
+                    first_bytes.append(first)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(latencies) / elapsed,
+        "latency_p50_s": percentile(latencies, 0.50),
+        "latency_p95_s": percentile(latencies, 0.95),
+        "latency_p99_s": percentile(latencies, 0.99),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+    if first_bytes:
+        result["first_byte_p50_s"] = percentile(first_bytes, 0.50)
+        result["first_byte_p95_s"] = percentile(first_bytes, 0.95)
+    return result
+
+
+def _format(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+async def run(args, pdf_data):
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 8)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+        pdf_id = None
+        if args.mode in ("chat", "stream"):
+            pdf_id = await upload_document(client, unique_pdf(pdf_data))
+
+        results = []
+        print(f"mode={args.mode} document={args.document} pages={args.pages}")
+        print(f"{'conc':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}  statuses")
+        for concurrency in args.concurrency:
+            requests = args.requests or concurrency * args.requests_per_worker
+            result = await run_level(client, args.mode, pdf_id, pdf_data, concurrency, requests)
+            results.append(result)
+            print(f"{concurrency:>5} {result['throughput_per_s']:>8.1f} "
+                  f"{_format(result['latency_p50_s']):>8} {_format(result['latency_p95_s']):>8} "
+                  f"{_format(result['latency_p99_s']):>8}  {result['statuses']}")
+        return results
+
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_servers(args):
+    """Starts the fake Gemini server and the app pointed at it. Returns the processes."""
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_gemini.py"),
+        "--port", str(args.fake_port),
+        "--latency", str(args.fake_latency),
+        "--tokens-per-second", str(args.fake_tokens_per_second),
+        "--output-tokens", str(args.fake_output_tokens),
+        "--error-rate", str(args.fake_error_rate),
+        "--throttle-rate", str(args.fake_throttle_rate),
+        "--rate-limit-rpm", str(args.fake_rate_limit_rpm),
+    ])
+    _wait_until_up(f"http://127.0.0.1:{args.fake_port}/stats", fake)
+
+    env = {
+        **os.environ,
+        "MODEL_BACKEND": "gemini",
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "fake"),
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_ENDPOINT": f"http://127.0.0.1:{args.fake_port}",
+        # Every load-test question is distinct; keep the caches out of the measurement
+        "SIMILARITY_CACHE_ENABLED": "false",
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env)
+    _wait_until_up(f"http://127.0.0.1:{args.app_port}/metrics", app)
+    return [app, fake]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mode", choices=MODES, default="chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, help="requests per level (default: concurrency x --requests-per-worker)")
+    parser.add_argument("--requests-per-worker", type=int, default=10)
+    parser.add_argument("--document", choices=["text", "table", "small"], default="text")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="write results JSON to this path")
+
+    start = parser.add_argument_group("self-contained run (--start)")
+    start.add_argument("--start", action="store_true",
+                       help="launch the fake Gemini server and the app before the run")
+    start.add_argument("--app-port", type=int, default=8001)
+    start.add_argument("--fake-port", type=int, default=8090)
+    start.add_argument("--fake-latency", type=float, default=0.3)
+    start.add_argument("--fake-tokens-per-second", type=float, default=200.0)
+    start.add_argument("--fake-output-tokens", type=int, default=150)
+    start.add_argument("--fake-error-rate", type=float, default=0.0)
+    start.add_argument("--fake-throttle-rate", type=float, default=0.0)
+    start.add_argument("--fake-rate-limit-rpm", type=int, default=0)
+    args = parser.parse_args()
+
+    path = build_document(f"{args.document}-{args.pages}", args.document, args.pages)
+    with open(path, "rb") as f:
+        pdf_data = f.read()
+
+    processes = []
+    try:
+        if args.start:
+            processes = start_servers(args)
+            args.base_url = f"http://127.0.0.1:{args.app_port}"
+        results = asyncio.run(run(args, pdf_data))
+        if args.start:
+            print("fake gemini:", httpx.get(f"http://127.0.0.1:{args.fake_port}/stats").json())
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"mode": args.mode, "document": args.document, "pages": args.pages,
+                       "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
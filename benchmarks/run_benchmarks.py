@@ -0,0 +1,370 @@
+"""Benchmark suite: extraction/cleaning throughput, extraction backend
+throughput and fidelity, text normalization throughput, app import time,
+upload latency and chat latency.
+
+Results are written as JSON. With --compare, the run fails (exit code 1) when
+any metric is worse than the baseline by more than --threshold.
+
+Usage:
+    python benchmarks/run_benchmarks.py --profile quick --output results.json
+    python benchmarks/run_benchmarks.py --profile quick --compare results.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Chat latency is measured against the local stub model, never the real API
+os.environ.setdefault("MODEL_BACKEND", "stub")
+os.environ.setdefault("STUB_MODEL_LATENCY", "0.05")
+# Near-duplicate questions would otherwise be answered by the similarity cache
+os.environ.setdefault("SIMILARITY_CACHE_ENABLED", "false")
+
+from corpus import build_corpus, expected_words, raw_page_texts, MULTILINGUAL_WORDS  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def _extraction_case(path, workers=0):
+    """Runs in a fresh process so ru_maxrss is the peak of this case alone.
+
+    Extracts with the upload path's extract_pdf_document: serially in this
+    process, or page-parallel over a pool of `workers` processes. Serial runs
+    also time normalizing the raw text of the whole document.
+    """
+    import pdfplumber
+    from pdf_processing import extract_pdf_document
+    from text_normalization import normalize_text
+
+    raw_text = ""
+    clean_seconds = 0.0
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pool.submit(int).result()  # start the pool before timing
+            start = time.perf_counter()
+            text, page_count = extract_pdf_document(path, pool)
+            extract_seconds = time.perf_counter() - start
+    else:
+        start = time.perf_counter()
+        text, page_count = extract_pdf_document(path)
+        extract_seconds = time.perf_counter() - start
+
+        with pdfplumber.open(path) as pdf:
+            raw_text = ''.join(page.extract_text() or '' for page in pdf.pages)
+        start = time.perf_counter()
+        normalize_text(raw_text)
+        clean_seconds = time.perf_counter() - start
+
+    return {
+        "page_count": page_count,
+        "text_bytes": len(text.encode("utf-8")),
+        "raw_text_bytes": len(raw_text.encode("utf-8")),
+        "extract_seconds": extract_seconds,
+        "clean_seconds": clean_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        # The largest pool worker; 0 for serial runs
+        "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def bench_extraction(corpus, workers):
+    """extract/ cases run extract_pdf_document serially, extract_pooled/ cases
+    over a pool of `workers` processes."""
+    results = {}
+    for name, kind, pages, path in corpus:
+        file_mb = os.path.getsize(path) / MB
+        for prefix, case_workers in (("extract", 0), ("extract_pooled", workers)):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                case = executor.submit(_extraction_case, path, case_workers).result()
+            metrics = {
+                "extract_pages_per_s": case["page_count"] / case["extract_seconds"],
+                "extract_mb_per_s": file_mb / case["extract_seconds"],
+                "peak_rss_mb": case["peak_rss_mb"],
+            }
+            if case_workers:
+                metrics["worker_peak_rss_mb"] = case["worker_peak_rss_mb"]
+            else:
+                metrics["clean_mb_per_s"] = (case["raw_text_bytes"] / MB) / max(case["clean_seconds"], 1e-9)
+            results[f"{prefix}/{name}"] = metrics
+            print(f"{prefix}/{name}: {metrics}")
+    return results
+
+
+def _tokens(text):
+    # Table-aware output adds brackets and separators; fidelity only counts words
+    return re.findall(r"[\w.-]+", text)
+
+
+def _backend_case(path, backend):
+    from pdf_processing import get_extractor
+    from text_normalization import normalize_text
+
+    start = time.perf_counter()
+    raw_pages = list(get_extractor(backend).iter_pages(path))
+    seconds = time.perf_counter() - start
+    return len(raw_pages), seconds, " ".join(normalize_text(text) for text in raw_pages)
+
+
+def bench_backends(corpus, backends):
+    """Extraction throughput per backend, and fidelity against the words the
+    corpus generator drew: word_f1 compares the bags of words, bigram_recall
+    the share of adjacent word pairs kept in order."""
+    results = {}
+    for name, kind, pages, path in corpus:
+        expected = _tokens(" ".join(expected_words(name, kind, pages)))
+        expected_bigrams = Counter(zip(expected, expected[1:]))
+        for backend in backends:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                page_count, seconds, text = executor.submit(_backend_case, path, backend).result()
+            words = _tokens(text)
+            common = sum((Counter(expected) & Counter(words)).values())
+            precision = common / len(words) if words else 0.0
+            recall = common / len(expected) if expected else 0.0
+            bigrams_kept = sum((expected_bigrams & Counter(zip(words, words[1:]))).values())
+            results[f"backend/{backend}/{name}"] = {
+                "extract_pages_per_s": page_count / seconds,
+                "word_f1": 2 * precision * recall / (precision + recall) if common else 0.0,
+                "bigram_recall": bigrams_kept / max(1, sum(expected_bigrams.values())),
+            }
+            print(f"backend/{backend}/{name}: {results[f'backend/{backend}/{name}']}")
+    return results
+
+
+def legacy_clean_text(text):
+    """The cleaning used before text_normalization: two whole-text regex
+    passes, the first of which drops every non-ASCII character."""
+    text = re.sub(r'[^\x00-\x7F]+', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _letters(text):
+    return sum(char.isalpha() for char in text)
+
+
+def bench_normalization(pages, repeats=5):
+    """Cleaning throughput (MB/s of raw page text) of the legacy regexes and
+    the normalizer, page by page, on ASCII and German/Turkish text.
+    letters_kept is the share of the raw text's letters (ligatures expanded)
+    left after cleaning."""
+    from text_normalization import normalize_text
+
+    results = {}
+    for name, words in (("ascii", None), ("multilingual", MULTILINGUAL_WORDS)):
+        texts = raw_page_texts(pages, words) if words else raw_page_texts(pages)
+        size_mb = sum(len(text.encode("utf-8")) for text in texts) / MB
+        letters = _letters(unicodedata.normalize("NFKC", "".join(texts)))
+        case = {}
+        for label, clean in (("legacy_", legacy_clean_text), ("", normalize_text)):
+            seconds = min(_timed_pages(clean, texts) for _ in range(repeats))
+            case[f"{label}mb_per_s"] = size_mb / max(seconds, 1e-9)
+            case[f"{label}letters_kept"] = sum(_letters(clean(text)) for text in texts) / letters
+        results[f"normalize/{name}"] = case
+        print(f"normalize/{name}: {case}")
+    return results
+
+
+def _timed_pages(clean, texts):
+    start = time.perf_counter()
+    for text in texts:
+        clean(text)
+    return time.perf_counter() - start
+
+
+# Run in a fresh interpreter: imports the app, then creates the Gemini client
+# (the SDK import and configuration deferred to the first model call)
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sdk_loaded = "google.generativeai" in sys.modules
+from model_client import get_model_client
+get_model_client(backend="gemini")
+print(json.dumps({"import_seconds": imported - started,
+                  "client_seconds": time.perf_counter() - imported,
+                  "sdk_loaded_at_import": sdk_loaded,
+                  "peak_rss_mb": rss_kb / 1024}))
+"""
+
+
+def bench_startup(repeats):
+    """Cold import time of the app (what a new worker pays before serving),
+    and the deferred cost of creating the first Gemini client."""
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-W", "ignore", "-c", STARTUP_SCRIPT], cwd=ROOT,
+                                check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    if any(run["sdk_loaded_at_import"] for run in runs):
+        print("warning: importing the app imported google.generativeai")
+    results = {
+        "startup/import": {
+            "import_seconds": statistics.median(run["import_seconds"] for run in runs),
+            "peak_rss_mb": statistics.median(run["peak_rss_mb"] for run in runs),
+        },
+        "startup/first_gemini_client": {
+            "client_seconds": statistics.median(run["client_seconds"] for run in runs),
+        },
+    }
+    for case in results:
+        print(f"{case}: {results[case]}")
+    return results
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def bench_upload(corpus, repeats, max_pages):
+    from fastapi.testclient import TestClient
+    from main import app
+    from pdf_routes import pdf_storage
+
+    results = {}
+    with TestClient(app) as client:
+        for name, kind, pages, path in corpus:
+            if pages > max_pages:
+                continue
+            samples = []
+            for _ in range(repeats):
+                pdf_storage.clear()  # otherwise duplicate detection skips extraction
+                with open(path, "rb") as file:
+                    start = time.perf_counter()
+                    response = client.post(
+                        "/v1/pdf", files={"file": (f"{name}.pdf", file, "application/pdf")})
+                    samples.append(time.perf_counter() - start)
+                response.raise_for_status()
+            results[f"upload/{name}"] = {
+                "latency_p50_s": statistics.median(samples),
+                "latency_max_s": max(samples),
+            }
+            print(f"upload/{name}: {results[f'upload/{name}']}")
+    return results
+
+
+def bench_chat(corpus, requests):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    name, _, _, path = corpus[-1]
+    results = {}
+    with TestClient(app) as client:
+        with open(path, "rb") as file:
+            pdf_id = client.post(
+                "/v1/pdf", files={"file": (f"{name}.pdf", file, "application/pdf")}).json()["pdf_id"]
+
+        for mode, full_context in (("retrieval", False), ("full_context", True)):
+            samples = []
+            for i in range(requests):
+                # Distinct questions so every request reaches the (stub) model
+                payload = {"query": f"What does clause {i} say about the {mode} refund policy?",
+                           "full_context": full_context}
+                start = time.perf_counter()
+                client.post(f"/v1/chat/{pdf_id}", json=payload).raise_for_status()
+                samples.append(time.perf_counter() - start)
+            results[f"chat/{mode}"] = {
+                "latency_p50_s": statistics.median(samples),
+                "latency_p95_s": _percentile(samples, 0.95),
+            }
+            print(f"chat/{mode}: {results[f'chat/{mode}']}")
+    return results
+
+
+def higher_is_better(metric):
+    return metric.endswith(("_per_s", "letters_kept")) or metric in ("word_f1", "bigram_recall")
+
+
+def compare(baseline, current, threshold):
+    """Returns a list of human-readable regressions beyond `threshold` (a fraction)."""
+    regressions = []
+    for case, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            base = baseline["results"].get(case, {}).get(metric)
+            if not base:
+                continue
+            change = (base - value) / base if higher_is_better(metric) else (value - base) / base
+            if change > threshold:
+                regressions.append(
+                    f"{case} {metric}: {base:.4g} -> {value:.4g} ({change:+.1%} worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=["quick", "full"], default="quick")
+    parser.add_argument("--output", help="write results JSON to this path")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed regression as a fraction (default 0.10)")
+    parser.add_argument("--upload-repeats", type=int, default=3)
+    parser.add_argument("--upload-max-pages", type=int, default=500)
+    parser.add_argument("--chat-requests", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="pool size for the extract_pooled cases")
+    parser.add_argument("--backends", nargs="*", default=["pdfplumber", "pdfminer", "tables"],
+                        help="extraction backends to compare")
+    parser.add_argument("--normalize-pages", type=int, default=200,
+                        help="pages of generated text per normalization case")
+    parser.add_argument("--startup-repeats", type=int, default=5)
+    parser.add_argument("--skip", nargs="*", default=[],
+                        choices=["extract", "backends", "normalize", "startup", "upload", "chat"])
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.profile)
+    results = {}
+    if "extract" not in args.skip:
+        results.update(bench_extraction(corpus, args.workers))
+    if "backends" not in args.skip:
+        results.update(bench_backends(corpus, args.backends))
+    if "normalize" not in args.skip:
+        results.update(bench_normalization(args.normalize_pages))
+    if "startup" not in args.skip:
+        results.update(bench_startup(args.startup_repeats))
+    if "upload" not in args.skip:
+        results.update(bench_upload(corpus, args.upload_repeats, args.upload_max_pages))
+    if "chat" not in args.skip:
+        results.update(bench_chat(corpus, args.chat_requests))
+
+    report = {
+        "meta": {
+            "profile": args.profile,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,210 @@
+import sys
+import threading
 import time
+from collections import OrderedDict
 
-CACHE_EXPIRATION_TIME = 300  # Cache expiration time in seconds (5 minutes)
-cache = {}
+from config import (CACHE_EXPIRATION_TIME, CACHE_MAX_BYTES, CACHE_SWEEP_INTERVAL,
+                    GEMINI_MODEL, SIMILARITY_CACHE_ENABLED)
+from logging_config import logger
+from metrics import register, CallbackMetric, CACHE_LOOKUP_LATENCY
+from similarity_cache import SimilarityCache
 
-# Cache checking function
+ENTRY_OVERHEAD = 200  # approximate bytes of bookkeeping per cache entry
+
+
+def normalize_query(query: str):
+    return " ".join(query.lower().split())
+
+
+def make_cache_key(query: str, doc_key: str, model_name: str):
+    return (doc_key, normalize_query(query), model_name)
+
+
+class ResponseCache:
+    """LRU cache of model responses bounded by an approximate byte budget, with TTL expiry."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_EXPIRATION_TIME):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (response, expires_at, size)
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._removal_listeners = []
+
+    def add_removal_listener(self, listener):
+        """Calls `listener(key)` after an entry is evicted or expires."""
+        self._removal_listeners.append(listener)
 
+    def _notify_removed(self, keys):
+        for key in keys:
+            for listener in self._removal_listeners:
+                try:
+                    listener(key)
+                except Exception as e:
+                    logger.error("Error in cache removal listener for %s: %s", key, e)
 
-def get_cached_response(query: str):
-    current_time = time.time()
-    if query in cache:
-        response_data = cache[query]
-        if current_time - response_data['timestamp'] < CACHE_EXPIRATION_TIME:
-            return response_data['response']
+    @staticmethod
+    def _entry_size(key, response):
+        if isinstance(response, dict):
+            # An answer with its citations: count the text and each field
+            size = sys.getsizeof(response) + sum(sys.getsizeof(value) for value in response.values())
         else:
-            del cache[query]  # Remove expired cache entry
-    return None
+            size = sys.getsizeof(response)
+        return size + sum(sys.getsizeof(part) for part in key) + ENTRY_OVERHEAD
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes_used -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            response, expires_at, _ = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+        self._notify_removed([key])
+        return None
+
+    def set(self, key, response):
+        size = self._entry_size(key, response)
+        if size > self.max_bytes:
+            return
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, time.time() + self.ttl, size)
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                evicted.append(oldest)
+                self.evictions += 1
+        self._notify_removed(evicted)
+
+    def sweep(self):
+        """Drops every expired entry; returns how many were removed."""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at, _) in self._entries.items()
+                       if expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        self._notify_removed(expired)
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def start_sweeper(self, interval=CACHE_SWEEP_INTERVAL):
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                removed = self.sweep()
+                if removed:
+                    logger.debug("Cache sweep removed %s expired entries", removed)
+
+        self._sweeper = threading.Thread(target=run, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        self._sweeper = None
+
+
+response_cache = ResponseCache()
+similarity_cache = SimilarityCache()
+
+
+def _forget_similar(key):
+    # key is (doc_key, normalized query, model); the similarity scope is (doc_key, model)
+    similarity_cache.discard((key[0], key[2]), key)
+
+
+response_cache.add_removal_listener(_forget_similar)
+
+register(CallbackMetric("pdfchat_cache_hits_total", "Exact response cache hits.",
+                        lambda: response_cache.hits, type_name="counter"))
+register(CallbackMetric("pdfchat_cache_misses_total", "Exact response cache misses.",
+                        lambda: response_cache.misses, type_name="counter"))
+register(CallbackMetric("pdfchat_cache_similarity_hits_total", "Similarity cache hits.",
+                        lambda: similarity_cache.hits, type_name="counter"))
+register(CallbackMetric("pdfchat_cache_bytes", "Bytes held by the response cache.",
+                        lambda: response_cache.bytes_used))
+
+# Cache checking function
+
+
+@CACHE_LOOKUP_LATENCY.time()
+def get_cached_answer(query: str, doc_key: str, model_name: str = GEMINI_MODEL):
+    """Returns the cached answer as a dict with its "response" text and the
+    details it was cached with (e.g. chunk_ids and pages), or None."""
+    key = make_cache_key(query, doc_key, model_name)
+    answer = response_cache.get(key)
+    if answer is not None or not SIMILARITY_CACHE_ENABLED:
+        return answer
+
+    # Second tier: an earlier paraphrase of the same question on this document
+    similar_key, score = similarity_cache.lookup((doc_key, model_name), query)
+    logger.debug(
+        "Similarity cache lookup for %r on %s: best score %.3f", query, doc_key, score)
+    if similar_key is None:
+        return None
+    answer = response_cache.get(similar_key)
+    if answer is None:
+        # The exact entry expired or was evicted
+        similarity_cache.discard((doc_key, model_name), similar_key)
+        return None
+    logger.debug(
+        "Similarity cache hit: %r matched %r (score %.3f)", query, similar_key[1], score)
+    return answer
+
+
+def get_cached_response(query: str, doc_key: str, model_name: str = GEMINI_MODEL):
+    answer = get_cached_answer(query, doc_key, model_name)
+    return answer["response"] if answer is not None else None
 
 # Function to cache responses
 
 
-def cache_response(query: str, response: str):
-    cache[query] = {
-        "response": response,
-        "timestamp": time.time()
-    }
+def cache_response(query: str, response: str, doc_key: str, model_name: str = GEMINI_MODEL, **details):
+    """Caches the response text; `details` are returned with it on a hit."""
+    key = make_cache_key(query, doc_key, model_name)
+    response_cache.set(key, {"response": response, **details})
+    if SIMILARITY_CACHE_ENABLED:
+        similarity_cache.add((doc_key, model_name), query, key)
@@ -1,15 +1,89 @@
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 
-# Load environment variables from .env file
+# Load environment variables from .env file. Every module reads its settings
+# from here, so this is the only place the file is loaded.
 load_dotenv()
 
-# Configure Gemini API key
+# Logging settings
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records buffered for the writer thread
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))  # fraction of per-request INFO lines kept
 
+# Retrieval (RAG) settings
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true"
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "4000"))
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "200"))  # words per chunk
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "40"))  # words shared between chunks
 
-def configure_gemini_api():
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in environment variables.")
-    genai.configure(api_key=api_key)
+# Upload extraction pool settings
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACTION_QUEUE_DEPTH = int(os.getenv("EXTRACTION_QUEUE_DEPTH", "32"))  # running + waiting jobs
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "25"))  # pages per pool task
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND", "auto")  # "pdfplumber", "pdfminer", "tables" or "auto"
+EXTRACTION_FAST_PAGE_THRESHOLD = int(os.getenv("EXTRACTION_FAST_PAGE_THRESHOLD", "100"))  # pages; "auto" -> pdfminer
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))  # finished upload jobs are forgotten after this
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+TEXT_NORMALIZATION_FORM = os.getenv("TEXT_NORMALIZATION_FORM", "NFC")  # "NFC", "NFKC", "NFD", "NFKD" or "none"
+TEXT_REPAIR_LIGATURES = os.getenv("TEXT_REPAIR_LIGATURES", "true").lower() == "true"  # ligature glyphs -> letters
+TEXT_REPAIR_HYPHENATION = os.getenv("TEXT_REPAIR_HYPHENATION", "true").lower() == "true"  # "exam-\nple" -> "example"
+
+# Model client settings
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")  # "gemini" or "stub"
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "grpc")  # "grpc" (one multiplexed channel) or "rest"
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")  # e.g. http://127.0.0.1:8090 for the fake server (rest only)
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "32"))  # in-flight model calls
+MODEL_RPM_LIMIT = int(os.getenv("MODEL_RPM_LIMIT", "0"))  # requests per minute quota (0 = unlimited)
+MODEL_TPM_LIMIT = int(os.getenv("MODEL_TPM_LIMIT", "0"))  # input tokens per minute quota (0 = unlimited)
+MODEL_QUEUE_SIZE = int(os.getenv("MODEL_QUEUE_SIZE", "256"))  # calls waiting for capacity before 503
+MODEL_QUEUE_TIMEOUT = float(os.getenv("MODEL_QUEUE_TIMEOUT", "30"))  # seconds a call may wait for capacity
+MODEL_REQUEST_DEADLINE = float(os.getenv("MODEL_REQUEST_DEADLINE", "30"))  # seconds for all attempts of one call
+MODEL_RETRY_ATTEMPTS = int(os.getenv("MODEL_RETRY_ATTEMPTS", "3"))
+MODEL_RETRY_MAX_WAIT = float(os.getenv("MODEL_RETRY_MAX_WAIT", "8"))  # cap on one backoff sleep, seconds
+MODEL_RETRY_BUDGET_RATIO = float(os.getenv("MODEL_RETRY_BUDGET_RATIO", "0.1"))  # retries+hedges per call
+MODEL_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("MODEL_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+MODEL_HEDGE_ENABLED = os.getenv("MODEL_HEDGE_ENABLED", "false").lower() == "true"
+MODEL_HEDGE_PERCENTILE = float(os.getenv("MODEL_HEDGE_PERCENTILE", "0.95"))  # hedge after this latency
+MODEL_HEDGE_MIN_SAMPLES = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", "20"))  # latencies seen before hedging
+STUB_MODEL_LATENCY = float(os.getenv("STUB_MODEL_LATENCY", "0.5"))  # seconds
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"  # create the model client at startup
+
+# Context planning (map-reduce for documents that do not fit one model call)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "120000"))  # prompt tokens per model call
+MAP_WINDOW_TOKENS = int(os.getenv("MAP_WINDOW_TOKENS", "30000"))  # text tokens per map-step window
+MAP_WINDOW_OVERLAP_TOKENS = int(os.getenv("MAP_WINDOW_OVERLAP_TOKENS", "500"))  # shared by adjacent windows
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "4"))  # map-step model calls in flight per query
+
+# Cross-document (corpus) chat settings
+CORPUS_INDEX_ENABLED = os.getenv("CORPUS_INDEX_ENABLED", "true").lower() == "true"  # index uploads
+CORPUS_INDEX_PATH = os.getenv("CORPUS_INDEX_PATH", "corpus_index")  # directory for vectors and passages
+CORPUS_INDEX_DIMS = int(os.getenv("CORPUS_INDEX_DIMS", "1024"))  # hashed features per passage vector
+CORPUS_TOP_K = int(os.getenv("CORPUS_TOP_K", "12"))  # passages considered per cross-document query
+
+# Batch chat settings
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "200"))  # questions per batch request
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", "20"))  # questions per packed model call
+BATCH_PACK_TOKEN_BUDGET = int(os.getenv("BATCH_PACK_TOKEN_BUDGET", "16000"))  # context tokens per packed call
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # model calls in flight per batch
+
+# Response cache settings
+CACHE_EXPIRATION_TIME = int(os.getenv("CACHE_EXPIRATION_TIME", "300"))  # seconds (5 minutes)
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL", "30"))  # seconds between expiry sweeps
+
+# Similarity (paraphrase) cache settings
+SIMILARITY_CACHE_ENABLED = os.getenv("SIMILARITY_CACHE_ENABLED", "true").lower() == "true"
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.85"))  # cosine similarity
+SIMILARITY_DIMS = int(os.getenv("SIMILARITY_DIMS", "1024"))  # hashed feature dimensions
+SIMILARITY_MAX_ENTRIES = int(os.getenv("SIMILARITY_MAX_ENTRIES", "1000"))  # queries per document
+SIMILARITY_MAX_BYTES = int(os.getenv("SIMILARITY_MAX_BYTES", str(32 * 1024 * 1024)))  # all documents
+
+# Document storage settings
+DOCUMENT_STORE = os.getenv("DOCUMENT_STORE", "memory")  # "memory" or "sqlite"
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "pdfchat.db")
+HOT_DOCUMENT_CACHE_SIZE = int(os.getenv("HOT_DOCUMENT_CACHE_SIZE", "16"))  # documents kept decompressed
+DOCUMENT_COMPRESSION_LEVEL = int(os.getenv("DOCUMENT_COMPRESSION_LEVEL", "6"))  # zlib level, 0-9
+DOCUMENT_MEMORY_BUDGET = int(os.getenv("DOCUMENT_MEMORY_BUDGET", str(1024 * 1024 * 1024)))  # bytes
@@ -0,0 +1,63 @@
+from config import CONTEXT_TOKEN_BUDGET, MAP_WINDOW_TOKENS, MAP_WINDOW_OVERLAP_TOKENS
+from retrieval import estimate_tokens
+
+# Tokens reserved for the instructions wrapped around the text and the query
+PROMPT_OVERHEAD_TOKENS = 200
+CHARS_PER_TOKEN = 4  # matches estimate_tokens for ASCII text
+
+
+def fits_context(text, query="", budget=CONTEXT_TOKEN_BUDGET):
+    """True when `text` and `query` fit in one model call."""
+    return estimate_tokens(text) + estimate_tokens(query) + PROMPT_OVERHEAD_TOKENS <= budget
+
+
+def split_windows(text, window_tokens=MAP_WINDOW_TOKENS, overlap_tokens=MAP_WINDOW_OVERLAP_TOKENS):
+    """Splits text into windows of about `window_tokens` tokens, each sharing
+    `overlap_tokens` with the previous one so facts that straddle a boundary
+    are seen whole. Boundaries are moved back to whitespace where possible."""
+    # Non-ASCII text has more tokens per character; size windows by the same estimate
+    chars_per_token = max(1, len(text) // estimate_tokens(text)) if text else CHARS_PER_TOKEN
+    size = max(1, window_tokens * chars_per_token)
+    overlap = min(overlap_tokens * chars_per_token, size // 2)
+
+    windows = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            space = text.rfind(" ", start + size // 2, end)
+            if space != -1:
+                end = space
+        windows.append(text[start:end])
+        if end == len(text):
+            break
+        start = max(start + 1, end - overlap)
+        if text[start - 1] not in " \n":
+            # Start the overlap on a word boundary too
+            space = text.find(" ", start, end)
+            if space != -1:
+                start = space + 1
+    return windows
+
+
+def plan_context(text, query, budget=CONTEXT_TOKEN_BUDGET):
+    """Returns the text windows to ask about: [text] when the prompt fits in
+    `budget` tokens, otherwise overlapping windows for a map-reduce answer."""
+    if fits_context(text, query, budget):
+        return [text]
+    room = budget - estimate_tokens(query) - PROMPT_OVERHEAD_TOKENS
+    return split_windows(text, max(1, min(MAP_WINDOW_TOKENS, room)))
+
+
+def group_by_budget(texts, query, budget=CONTEXT_TOKEN_BUDGET):
+    """Groups consecutive texts so each group fits in one model call with the query."""
+    groups = [[]]
+    used = estimate_tokens(query) + PROMPT_OVERHEAD_TOKENS
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if groups[-1] and used + tokens > budget:
+            groups.append([])
+            used = estimate_tokens(query) + PROMPT_OVERHEAD_TOKENS
+        groups[-1].append(text)
+        used += tokens
+    return groups
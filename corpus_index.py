@@ -0,0 +1,287 @@
+import fcntl
+import json
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+from config import CORPUS_INDEX_PATH, CORPUS_INDEX_DIMS, CHUNK_SIZE, CHUNK_OVERLAP
+from similarity_cache import normalize_for_similarity
+from text_normalization import default_normalizer
+
+WORD_SPAN = re.compile(r"\S+")
+
+
+def iter_passages(text, page_offsets=None, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Yields (page, start, end) character ranges of overlapping `size`-word windows.
+
+    With `page_offsets` (page boundaries [0, end_1, ..., end_n] into `text`)
+    windows never cross a page and carry their 1-based page number; without
+    them the page is None.
+    """
+    if page_offsets:
+        pages = enumerate(zip(page_offsets, page_offsets[1:]), 1)
+    else:
+        pages = [(None, (0, len(text)))]
+
+    step = max(1, size - overlap)
+    for page, (page_start, page_end) in pages:
+        spans = [match.span() for match in WORD_SPAN.finditer(text, page_start, page_end)]
+        for first in range(0, len(spans), step):
+            window = spans[first:first + size]
+            yield page, window[0][0], window[-1][1]
+            if first + size >= len(spans):
+                break
+
+
+def embed_text(text, dims=CORPUS_INDEX_DIMS):
+    """Hashes words and word bigrams into an L2-normalized float32 vector with
+    sublinear (log) term frequencies."""
+    words = normalize_for_similarity(text)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = np.zeros(dims, dtype=np.float32)
+    if features:
+        buckets = [zlib.crc32(feature.encode()) % dims for feature in features]
+        vector += np.bincount(buckets, minlength=dims)
+        np.log1p(vector, out=vector)
+        vector /= np.linalg.norm(vector)
+    return vector
+
+
+def document_fingerprint(text_length, normalizer=None):
+    """Identifies the text an entry's character ranges point into: the
+    normalizer version that produced it (the current one by default) and its
+    length, both of which the document store keeps without loading the text."""
+    return "%s:%d" % (normalizer or default_normalizer.version, text_length)
+
+
+def text_fingerprint(text, normalizer=None):
+    return document_fingerprint(len(text), normalizer)
+
+
+class CorpusIndex:
+    """Passage index across every uploaded document, for cross-document chat.
+
+    Passage vectors are rows of one contiguous float32 matrix in
+    `vectors.f32`, memory-mapped for search; `passages.jsonl` holds one line
+    per document with its row range and each passage's page and character
+    range in the document text (the text itself stays in the document store).
+    Documents are appended as they are uploaded. Appends take a file lock, and
+    every process picks up rows appended by the others before it reads, so
+    workers on one host can share the directory.
+
+    Each entry records the fingerprint of the text it was built from; a
+    document whose stored text no longer matches is indexed again. Removed
+    and replaced documents leave dead rows behind until they outnumber the
+    live ones, when both files are rewritten with the live rows only.
+    """
+
+    def __init__(self, directory=CORPUS_INDEX_PATH, dims=CORPUS_INDEX_DIMS):
+        self.directory = directory
+        self.dims = dims
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._passages_path = os.path.join(directory, "passages.jsonl")
+        self._documents = {}  # doc_key -> {"rows": [start, end], "passages": [[page, start, end], ...],
+        #                               "fingerprint": ...}
+        self._rows = 0
+        self._loaded_bytes = 0  # how much of passages.jsonl has been read
+        self._inode = None  # changes when the files are compacted or cleared
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        # Readers take a shared lock so a compaction cannot swap the files
+        # between reading the metadata and mapping the vectors
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reset(self):
+        self._documents.clear()
+        self._rows = 0
+        self._loaded_bytes = 0
+        self._inode = None
+        self._matrix = None
+
+    def _sync(self):
+        """Loads documents appended or removed since the last sync (lock held)."""
+        try:
+            with open(self._passages_path, "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._inode:
+                    # Compacted or cleared by another process: reload from the start
+                    self._reset()
+                    self._inode = inode
+                f.seek(self._loaded_bytes)
+                data = f.read()
+        except FileNotFoundError:
+            self._reset()
+            return
+        complete = data[:data.rfind(b"\n") + 1]  # skip a line that is still being written
+        for line in complete.splitlines():
+            entry = json.loads(line)
+            if entry.get("removed"):
+                self._documents.pop(entry["doc"], None)
+                continue
+            self._documents[entry["doc"]] = entry
+            self._rows = max(self._rows, entry["rows"][1])
+            self._matrix = None
+        self._loaded_bytes += len(complete)
+
+    def _dead_rows(self):
+        return self._rows - sum(entry["rows"][1] - entry["rows"][0] for entry in self._documents.values())
+
+    def _compact(self):
+        """Rewrites both files with the live rows only (both locks held)."""
+        matrix = self._vectors()
+        vectors_tmp = self._vectors_path + ".tmp"
+        passages_tmp = self._passages_path + ".tmp"
+        row = 0
+        with open(vectors_tmp, "wb") as vectors_file, open(passages_tmp, "w") as passages_file:
+            for entry in sorted(self._documents.values(), key=lambda entry: entry["rows"][0]):
+                start, end = entry["rows"]
+                vectors_file.write(np.ascontiguousarray(matrix[start:end]).tobytes())
+                entry = dict(entry, rows=[row, row + end - start])
+                passages_file.write(json.dumps(entry) + "\n")
+                row += end - start
+        # Vectors first: readers map them only after seeing the new passages file
+        os.replace(vectors_tmp, self._vectors_path)
+        os.replace(passages_tmp, self._passages_path)
+        self._reset()
+        self._sync()
+
+    def _compact_if_sparse(self):
+        dead = self._dead_rows()
+        if dead and dead >= self._rows - dead:
+            self._compact()
+
+    def _vectors(self):
+        if self._matrix is None and self._rows:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                     shape=(self._rows, self.dims))
+        return self._matrix
+
+    def _is_current(self, doc_key, fingerprint):
+        entry = self._documents.get(doc_key)
+        return entry is not None and (fingerprint is None or entry.get("fingerprint") == fingerprint)
+
+    def has_document(self, doc_key, fingerprint=None):
+        """Whether `doc_key` is indexed; with a `fingerprint`, only if the entry
+        was built from that text."""
+        return not self.missing({doc_key: fingerprint})
+
+    def missing(self, fingerprints):
+        """Returns the keys of `fingerprints` ({doc_key: fingerprint or None})
+        that are not indexed from matching text, checked in one sync."""
+        with self._lock, self._file_lock(shared=True):
+            self._sync()
+            return [doc_key for doc_key, fingerprint in fingerprints.items()
+                    if not self._is_current(doc_key, fingerprint)]
+
+    def add_document(self, doc_key, text, page_offsets=None, fingerprint=None):
+        """Indexes a document's passages unless they are already indexed for
+        this text, replacing an entry built from other text; returns the number
+        of passages added. `fingerprint` defaults to the current normalizer's."""
+        fingerprint = fingerprint or text_fingerprint(text)
+        passages = list(iter_passages(text, page_offsets))
+        if not passages:
+            return 0
+        vectors = np.stack([embed_text(text[start:end], self.dims) for _, start, end in passages])
+
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._is_current(doc_key, fingerprint):
+                return 0
+            start = self._rows
+            with open(self._vectors_path, "ab") as f:
+                # Drops rows left behind by a writer that failed before its metadata line
+                f.truncate(start * self.dims * 4)
+                f.write(vectors.tobytes())
+            entry = {"doc": doc_key, "rows": [start, start + len(passages)],
+                     "passages": [list(passage) for passage in passages], "fingerprint": fingerprint}
+            with open(self._passages_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._sync()
+            self._compact_if_sparse()
+        return len(passages)
+
+    def remove_document(self, doc_key):
+        """Drops a document's passages; returns whether it was indexed."""
+        with self._lock, self._file_lock():
+            self._sync()
+            if doc_key not in self._documents:
+                return False
+            with open(self._passages_path, "a") as f:
+                f.write(json.dumps({"doc": doc_key, "removed": True}) + "\n")
+            self._sync()
+            self._compact_if_sparse()
+        return True
+
+    def search(self, query, doc_keys, top_k):
+        """Returns up to `top_k` (doc_key, page, start, end, score) passages from
+        `doc_keys`, best first. Passages that share no terms with the query are
+        left out."""
+        query_vector = embed_text(query, self.dims)
+        with self._lock, self._file_lock(shared=True):
+            self._sync()
+            documents = sorted((self._documents[key] for key in set(doc_keys) if key in self._documents),
+                               key=lambda entry: entry["rows"][0])
+            matrix = self._vectors()
+        if not documents or not query_vector.any():
+            return []
+
+        scores = np.concatenate([matrix[entry["rows"][0]:entry["rows"][1]] @ query_vector
+                                 for entry in documents])
+        owners = [(entry, i) for entry in documents for i in range(len(entry["passages"]))]
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        results = []
+        for position in best[np.argsort(-scores[best])]:
+            if scores[position] <= 0:
+                break
+            entry, i = owners[position]
+            page, start, end = entry["passages"][i]
+            results.append((entry["doc"], page, start, end, float(scores[position])))
+        return results
+
+    def leading_passages(self, doc_keys, count):
+        """The first passages of each document, for queries that match nothing."""
+        with self._lock, self._file_lock(shared=True):
+            self._sync()
+            entries = [self._documents[key] for key in doc_keys if key in self._documents]
+        results = []
+        for i in range(count):
+            for entry in entries:
+                if i < len(entry["passages"]) and len(results) < count:
+                    page, start, end = entry["passages"][i]
+                    results.append((entry["doc"], page, start, end, 0.0))
+        return results
+
+    def clear(self):
+        with self._lock, self._file_lock():
+            for path in (self._vectors_path, self._passages_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._reset()
+
+    def stats(self):
+        with self._lock, self._file_lock(shared=True):
+            self._sync()
+            return {
+                "documents": len(self._documents),
+                "passages": self._rows,
+                "dead_passages": self._dead_rows(),
+                "dims": self.dims,
+                "bytes": self._rows * self.dims * 4
+            }
+
+
+corpus_index = CorpusIndex()
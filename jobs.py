@@ -0,0 +1,145 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import EXTRACTION_WORKERS, EXTRACTION_QUEUE_DEPTH, EXTRACTION_BACKEND, JOB_RETENTION_SECONDS
+from logging_config import logger
+from pdf_processing import extract_pdf_document
+
+
+class ExtractionQueueFull(Exception):
+    """Raised when the extraction pool already holds EXTRACTION_QUEUE_DEPTH jobs."""
+
+
+_executor = None
+# Threads that split each document into page ranges and merge the pool results
+_coordinator = None
+_lock = threading.Lock()
+_pending = 0
+
+# Upload jobs submitted with ?async=true, keyed by pdf_id
+jobs = {}
+
+
+def get_executor():
+    global _executor, _coordinator
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+            _coordinator = ThreadPoolExecutor(
+                max_workers=EXTRACTION_WORKERS, thread_name_prefix="extraction")
+        return _executor
+
+
+def shutdown_executor():
+    global _executor, _coordinator
+    with _lock:
+        executor, _executor = _executor, None
+        coordinator, _coordinator = _coordinator, None
+    if coordinator is not None:
+        coordinator.shutdown(wait=False, cancel_futures=True)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _release(_future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def submit_extraction(path, on_progress=None, on_page=None, extractor=EXTRACTION_BACKEND):
+    """Queues page-parallel extraction of the PDF at `path`, refusing work when the queue is full.
+
+    `extractor` names the extraction backend, or "auto". The returned future
+    resolves to (cleaned_text, page_count).
+    """
+    global _pending
+    with _lock:
+        if _pending >= EXTRACTION_QUEUE_DEPTH:
+            raise ExtractionQueueFull()
+        _pending += 1
+    try:
+        executor = get_executor()
+        future = _coordinator.submit(
+            extract_pdf_document, path, executor, on_progress=on_progress, on_page=on_page,
+            extractor=extractor)
+    except Exception:
+        _release(None)
+        raise
+    future.add_done_callback(_release)
+    return future
+
+
+def pending_extractions():
+    return _pending
+
+
+def prune_jobs(retention=JOB_RETENTION_SECONDS):
+    """Forgets jobs that finished more than `retention` seconds ago; returns
+    how many were removed. Their documents stay in the store."""
+    cutoff = time.time() - retention
+    expired = [pdf_id for pdf_id, job in list(jobs.items())
+               if job["finished_at"] is not None and job["finished_at"] <= cutoff]
+    for pdf_id in expired:
+        jobs.pop(pdf_id, None)
+    return len(expired)
+
+
+def create_job(pdf_id, filename):
+    prune_jobs()
+    jobs[pdf_id] = {
+        "filename": filename,
+        "status": "queued",
+        "pages_done": 0,
+        "page_count": None,
+        "created_at": time.time(),
+        "finished_at": None,
+        "error": None,
+        "future": None
+    }
+
+
+def attach_job_future(pdf_id, future):
+    jobs[pdf_id]["future"] = future
+
+
+def update_job_progress(pdf_id, pages_done, page_count):
+    job = jobs.get(pdf_id)
+    if job is not None:
+        job.update(pages_done=pages_done, page_count=page_count)
+
+
+def complete_job(pdf_id, page_count):
+    job = jobs[pdf_id]
+    job.update(status="completed", page_count=page_count, pages_done=page_count,
+               finished_at=time.time(), future=None)
+    logger.info("Upload job completed for PDF ID: %s", pdf_id)
+
+
+def fail_job(pdf_id, error):
+    job = jobs[pdf_id]
+    job.update(status="failed", error=error,
+               finished_at=time.time(), future=None)
+    logger.error("Upload job failed for PDF ID %s: %s", pdf_id, error)
+
+
+def get_job_status(pdf_id):
+    """Returns the public status of an upload job, or None if there is no such job."""
+    job = jobs.get(pdf_id)
+    if job is None:
+        return None
+
+    status = job["status"]
+    future = job["future"]
+    if status == "queued" and future is not None and future.running():
+        status = "processing"
+
+    result = {"pdf_id": pdf_id, "filename": job["filename"], "status": status,
+              "pages_done": job["pages_done"], "page_count": job["page_count"],
+              "progress": (job["pages_done"] / job["page_count"]) if job["page_count"] else 0.0}
+    if status == "completed":
+        result["progress"] = 1.0
+    if status == "failed":
+        result["error"] = job["error"]
+    return result
@@ -1,22 +1,93 @@
 # logging_config.py
-import logging
-from logging.handlers import RotatingFileHandler
+import atexit
 import json
+import logging
+import queue
+import random
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+from config import LOG_LEVEL, LOG_FILE, LOG_QUEUE_SIZE, LOG_SAMPLE_RATE
+
+
+class JsonFormatter(logging.Formatter):
+    """Encodes each record as one JSON object, escaping quotes and newlines in messages."""
+
+    def format(self, record):
+        entry = {
+            "level": record.levelname,
+            "time": self.formatTime(record),
+            "message": record.getMessage(),
+            "path": record.pathname,
+            "line": record.lineno
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a `rate` fraction of INFO-and-below records logged with extra={"sampled": True}."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, "sampled", False) and record.levelno <= logging.INFO:
+            return self.rate >= 1.0 or random.random() < self.rate
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Enqueues records unformatted so message formatting happens on the listener thread.
+
+    Records are dropped (and counted) rather than blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """Waits for room for the stop sentinel so shutdown never fails on a full queue."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+log_handler = RotatingFileHandler(LOG_FILE, maxBytes=1000000, backupCount=3)
+log_handler.setFormatter(JsonFormatter())
+
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = DeferredQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+# File I/O happens on the listener's background thread, never on the request path
+log_listener = DrainingQueueListener(log_queue, log_handler, respect_handler_level=True)
+log_listener.start()
+_listener_running = True
+
+
+def stop_logging():
+    """Flushes queued records and stops the writer thread. Safe to call more than once."""
+    global _listener_running
+    if _listener_running:
+        _listener_running = False
+        log_listener.stop()
 
-# Configure logging
-log_formatter = logging.Formatter(
-    json.dumps({
-        "level": "%(levelname)s",
-        "time": "%(asctime)s",
-        "message": "%(message)s",
-        "path": "%(pathname)s",
-        "line": "%(lineno)d"
-    })
-)
 
-log_handler = RotatingFileHandler("app.log", maxBytes=1000000, backupCount=3)
-log_handler.setFormatter(log_formatter)
+atexit.register(stop_logging)
 
 logger = logging.getLogger("fastapi_app")
-logger.setLevel(logging.DEBUG)
-logger.addHandler(log_handler)
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(queue_handler)
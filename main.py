@@ -1,17 +1,35 @@
-import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from dotenv import load_dotenv
 from middleware import custom_error_handling_middleware
 from pdf_routes import pdf_router
+from ops_routes import ops_router
+from jobs import shutdown_executor
+from cache import response_cache
+from model_client import warm_up
+from config import MODEL_WARMUP
 
-load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    response_cache.start_sweeper()
+    if MODEL_WARMUP:
+        # Import the model SDK and create the client off the request path
+        warm_up.start()
+    yield
+    # Stop the extraction worker processes with the server
+    shutdown_executor()
+    response_cache.stop_sweeper()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.middleware("http")(custom_error_handling_middleware)
 
 # Include the PDF-related routes
 app.include_router(pdf_router)
+app.include_router(ops_router)
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,174 @@
+import functools
+import inspect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        # Unlabelled counters are exported as 0 before their first increment
+        self._values = {} if labelnames else {(): 0}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class CallbackMetric(Metric):
+    """Counter or gauge whose value is read from `fn()` at scrape time."""
+
+    def __init__(self, name, documentation, fn, type_name="gauge"):
+        super().__init__(name, documentation)
+        self.fn = fn
+        self.type_name = type_name
+
+    def _samples(self):
+        return [f"{self.name} {_format_value(self.fn())}"]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        """Decorator recording the duration of each call, for sync and async functions."""
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - start, **labels)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            series_items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in series_items:
+            for bound, bucket_count in zip(self.buckets, series):
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+registry = []
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+def render_metrics():
+    """Renders every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+# Per-stage latency histograms
+REQUEST_LATENCY = register(Histogram(
+    "pdfchat_request_seconds", "Total request latency.", labelnames=("method", "route", "status")))
+UPLOAD_READ_LATENCY = register(Histogram(
+    "pdfchat_upload_read_seconds", "Time to stream an upload to disk."))
+PAGE_EXTRACTION_LATENCY = register(Histogram(
+    "pdfchat_page_extraction_seconds", "Text extraction time per PDF page."))
+CLEAN_LATENCY = register(Histogram(
+    "pdfchat_clean_seconds", "Text normalization time per PDF page."))
+CACHE_LOOKUP_LATENCY = register(Histogram(
+    "pdfchat_cache_lookup_seconds", "Response cache lookup time."))
+CHAT_STAGE_LATENCY = register(Histogram(
+    "pdfchat_chat_stage_seconds", "Chat answer latency per stage (retrieve, plan, map, reduce).",
+    labelnames=("stage",)))
+MODEL_CALL_LATENCY = register(Histogram(
+    "pdfchat_model_call_seconds", "Model call latency per attempt."))
+
+MODEL_RETRIES = register(Counter(
+    "pdfchat_model_retries_total", "Retried model calls in generate_response_from_model."))
+MODEL_HEDGES = register(Counter(
+    "pdfchat_model_hedges_total", "Hedged (duplicate) model calls started after a slow attempt."))
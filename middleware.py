@@ -1,13 +1,28 @@
+import time
 from fastapi import Request, HTTPException
 from logging_config import logger
+from metrics import REQUEST_LATENCY
+
+# Per-request access lines are subject to LOG_SAMPLE_RATE
+SAMPLED = {"sampled": True}
+
 
 async def custom_error_handling_middleware(request: Request, call_next):
-    logger.info(f"Received request: {request.method} {request.url}")
+    logger.info("Received request: %s %s", request.method, request.url, extra=SAMPLED)
+    started = time.perf_counter()
+    status = 500
     try:
         response = await call_next(request)
+        status = response.status_code
         logger.info(
-            f"Completed request: {request.method} {request.url} with status {response.status_code}")
+            "Completed request: %s %s with status %s", request.method, request.url,
+            response.status_code, extra=SAMPLED)
         return response
     except Exception as e:
-        logger.error(f"Unhandled error: {str(e)}")
+        logger.error("Unhandled error: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        # Label by route template, not the raw path, to keep pdf_ids out of the series
+        route = request.scope.get("route")
+        REQUEST_LATENCY.observe(time.perf_counter() - started, method=request.method,
+                                route=route.path if route else "unmatched", status=status)
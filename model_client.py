@@ -0,0 +1,274 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from config import (MODEL_BACKEND, GEMINI_MODEL, GEMINI_TRANSPORT, GEMINI_API_ENDPOINT,
+                    MODEL_MAX_CONCURRENCY, STUB_MODEL_LATENCY)
+from logging_config import logger
+
+# Dedicated threads for blocking SDK calls, so model latency never occupies
+# the event loop or the default executor Starlette uses for file I/O.
+_executor = ThreadPoolExecutor(max_workers=MODEL_MAX_CONCURRENCY,
+                               thread_name_prefix="model-client")
+
+
+class ModelCall:
+    """One model call as seen by the backend: its deadline (a time.monotonic()
+    value, or None) and the executor threads still working on it.
+
+    Cancelling the awaiting task does not stop a thread blocked in the SDK,
+    so the caller uses `when_idle` to keep its limiter slot until they return.
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._pending = set()
+        self._on_idle = None
+        self._lock = threading.Lock()
+
+    def timeout(self):
+        """Seconds left before the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def track(self, future):
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            callback = None if self._pending else self._on_idle
+            if callback is not None:
+                self._on_idle = None
+        if callback is not None:
+            callback()
+
+    def when_idle(self, callback):
+        """Calls `callback` now, or from the executor thread once every
+        tracked thread has returned."""
+        with self._lock:
+            if self._pending:
+                self._on_idle = callback
+                return
+        callback()
+
+
+# The call being made in this context; set by retry_logic around each attempt
+current_model_call = ContextVar("current_model_call", default=None)
+
+
+async def run_blocking(fn):
+    """Runs `fn` on the model executor, tracked by the current ModelCall."""
+    future = _executor.submit(fn)
+    call = current_model_call.get()
+    if call is not None:
+        call.track(future)
+    return await asyncio.wrap_future(future)
+
+
+def _request_options():
+    # Bounds the SDK's own request so an abandoned thread returns at the deadline
+    call = current_model_call.get()
+    timeout = call.timeout() if call is not None else None
+    return {"timeout": max(timeout, 0.1)} if timeout is not None else None
+
+
+class ModelBackend(ABC):
+    """Awaitable text-generation client for a single model name."""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    @abstractmethod
+    async def generate(self, prompt: str, json_output: bool = False) -> str:
+        """Returns the response text. With `json_output` the model is asked
+        to answer with JSON only (used for packed batch questions)."""
+
+    async def stream(self, prompt: str):
+        """Yields the response text in pieces as the model produces it.
+
+        Backends without native streaming yield the whole response at once.
+        """
+        yield await self.generate(prompt)
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def gemini_sdk():
+    """Imports and configures the Gemini SDK on first use.
+
+    Importing google.generativeai takes most of a second and pulls in gRPC, so
+    it is deferred until the first Gemini client is created instead of
+    happening when the app is imported.
+    """
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+
+                genai.configure(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    transport=GEMINI_TRANSPORT,
+                    client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None,
+                )
+                _genai = genai
+    return _genai
+
+
+class GeminiBackend(ModelBackend):
+    """Gemini client. The GenerativeModel (and the SDK's underlying gRPC
+    channel) is created once and reused for every request."""
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.model = gemini_sdk().GenerativeModel(model_name=model_name)
+
+    async def generate(self, prompt: str, json_output: bool = False) -> str:
+        generation_config = {"response_mime_type": "application/json"} if json_output else None
+        request_options = _request_options()
+        response = await run_blocking(
+            lambda: self.model.generate_content(prompt, generation_config=generation_config,
+                                                request_options=request_options))
+        return response.text
+
+    async def stream(self, prompt: str):
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(
+            _executor, lambda: self.model.generate_content(prompt, stream=True))
+        chunks = iter(response)
+        completed = False
+        try:
+            while True:
+                chunk = await loop.run_in_executor(_executor, next, chunks, None)
+                if chunk is None:
+                    completed = True
+                    return
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            if not completed:
+                _cancel_stream(response)
+
+
+class StubBackend(ModelBackend):
+    """Local stand-in that answers after a fixed delay, for offline throughput tests."""
+
+    def __init__(self, model_name, latency=STUB_MODEL_LATENCY):
+        super().__init__(model_name)
+        self.latency = latency
+
+    def _answer(self, prompt):
+        query = prompt.rsplit("User query:", 1)[-1].strip()
+        return f"[{self.model_name} stub] {len(prompt)} prompt characters for: {query[:200]}"
+
+    def _batch_answer(self, prompt):
+        # One answer per numbered question, as a JSON array
+        questions = re.findall(r"^\d+\. (.*)$", prompt.rsplit("Questions:", 1)[-1], re.MULTILINE)
+        return json.dumps([f"[{self.model_name} stub] {len(prompt)} prompt characters for: {q[:200]}"
+                           for q in questions])
+
+    async def generate(self, prompt: str, json_output: bool = False) -> str:
+        await asyncio.sleep(self.latency)
+        return self._batch_answer(prompt) if json_output else self._answer(prompt)
+
+    async def stream(self, prompt: str):
+        # Spread the same total latency over the words, like a token stream
+        words = self._answer(prompt).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+
+def _cancel_stream(response):
+    """Stops an in-progress Gemini stream so the upstream generation is abandoned."""
+    iterator = getattr(response, "_iterator", None)
+    for method in ("cancel", "close"):
+        if hasattr(iterator, method):
+            try:
+                getattr(iterator, method)()
+            except Exception as e:
+                logger.warning("Error cancelling Gemini stream: %s", e)
+            return
+
+
+backends = {
+    "gemini": GeminiBackend,
+    "stub": StubBackend,
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def register_backend(name, backend_cls):
+    backends[name] = backend_cls
+
+
+def get_model_client(model_name=GEMINI_MODEL, backend=None):
+    """Returns the shared client for `model_name`, creating it on first use."""
+    backend = backend or MODEL_BACKEND
+    key = (backend, model_name)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                if backend not in backends:
+                    raise ValueError(f"Unknown model backend: {backend}")
+                logger.info("Creating %s model client for %s", backend, model_name)
+                client = backends[backend](model_name)
+                _clients[key] = client
+    return client
+
+
+class WarmUp:
+    """Creates the default model client in a background thread at startup, so
+    the first request does not pay for the SDK import. Its state backs the
+    readiness probe."""
+
+    def __init__(self):
+        self.state = "idle"  # idle, warming, ready or failed
+        self.error = None
+        self.seconds = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, model_name=GEMINI_MODEL, backend=None):
+        with self._lock:
+            if self._thread is None:
+                self.state = "warming"
+                self._thread = threading.Thread(target=self._run, args=(model_name, backend),
+                                                name="model-warm-up", daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def _run(self, model_name, backend):
+        started = time.perf_counter()
+        try:
+            get_model_client(model_name, backend)
+        except Exception as e:
+            logger.error("Model client warm-up failed: %s", e)
+            self.error = str(e)
+            self.state = "failed"
+        else:
+            self.state = "ready"
+        self.seconds = time.perf_counter() - started
+        logger.info("Model client warm-up %s in %.2fs", self.state, self.seconds)
+
+    def stats(self):
+        return {"state": self.state, "seconds": self.seconds, "error": self.error}
+
+
+warm_up = WarmUp()
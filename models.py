@@ -1,4 +1,22 @@
+from typing import List, Literal, Optional, Union
+
 from pydantic import BaseModel
 
 class ChatRequest(BaseModel):
     query: str
+    # Send the whole document instead of the retrieved chunks
+    full_context: bool = False
+    # Only ask about these pages, e.g. "12" or "3-5,9"
+    pages: Optional[str] = None
+
+
+class BatchChatRequest(BaseModel):
+    queries: List[ChatRequest]
+    # "fanout": one model call per question; "packed": compatible questions share a call
+    mode: Literal["fanout", "packed"] = "fanout"
+
+
+class CorpusChatRequest(BaseModel):
+    query: str
+    # Documents to search: a list of pdf_ids, or "all" for every stored document
+    pdf_ids: Union[Literal["all"], List[str]] = "all"
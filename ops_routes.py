@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from cache import response_cache, similarity_cache
+from pdf_routes import chat_flight, pdf_storage
+from metrics import render_metrics
+from rate_limiter import model_limiter
+from corpus_index import corpus_index
+from model_client import warm_up
+from config import MODEL_WARMUP
+
+ops_router = APIRouter()
+
+
+@ops_router.get("/v1/cache/stats")
+async def cache_stats():
+    return {**response_cache.stats(), "similarity": similarity_cache.stats()}
+
+
+@ops_router.get("/v1/chat/stats")
+async def chat_stats():
+    return {"single_flight": chat_flight.stats(), "model_limiter": model_limiter.stats()}
+
+
+@ops_router.get("/v1/storage/stats")
+async def storage_stats():
+    # Both read from disk (SQLite, the corpus index files)
+    storage, corpus = await asyncio.gather(asyncio.to_thread(pdf_storage.stats),
+                                           asyncio.to_thread(corpus_index.stats))
+    return {**storage, "corpus_index": corpus}
+
+
+@ops_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Document store gauges query the store
+    body = await asyncio.to_thread(render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@ops_router.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@ops_router.get("/readyz")
+async def readyz():
+    """Readiness: 503 until the model client is warmed up (when MODEL_WARMUP
+    is on) and while the document store cannot be read."""
+    checks = {"model_client": warm_up.stats()}
+    ready = warm_up.state == "ready" or not MODEL_WARMUP
+    try:
+        await asyncio.to_thread(len, pdf_storage)
+        checks["document_store"] = {"state": "ready"}
+    except Exception as e:
+        checks["document_store"] = {"state": "failed", "error": str(e)}
+        ready = False
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={"status": "ready" if ready else "not_ready", "checks": checks})
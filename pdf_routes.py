@@ -1,71 +1,703 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import aclosing
+from typing import Optional
+import asyncio
+import hashlib
+import json
+import os
+import time
 import uuid
-from pdf_processing import extract_pdf_text
 from logging_config import logger
-from retry_logic import generate_response_from_model
-from models import ChatRequest
-from cache import get_cached_response, cache_response
+from retry_logic import (generate_response_from_model, generate_planned_response,
+                         generate_batch_response_from_model, stream_response_from_model)
+from models import ChatRequest, BatchChatRequest, CorpusChatRequest
+from cache import get_cached_answer, cache_response, make_cache_key
+from singleflight import SingleFlight
+from storage import create_document_store
+from corpus_index import corpus_index, document_fingerprint
+from metrics import register, CallbackMetric, CHAT_STAGE_LATENCY
+from pdf_processing import spool_upload, extractors, offsets_for_pages, resolve_extractor
+from retrieval import build_document_index, select_chunks, build_context, estimate_tokens
+from context_planner import fits_context
+from text_normalization import default_normalizer
+from config import (RETRIEVAL_ENABLED, RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET, GEMINI_MODEL,
+                    BATCH_MAX_QUERIES, BATCH_PACK_SIZE, BATCH_PACK_TOKEN_BUDGET, BATCH_CONCURRENCY,
+                    CORPUS_INDEX_ENABLED, CORPUS_TOP_K, EXTRACTION_BACKEND)
+from jobs import (ExtractionQueueFull, submit_extraction, create_job, attach_job_future,
+                  update_job_progress, complete_job, fail_job, get_job_status, jobs)
 
 pdf_router = APIRouter()
 
-pdf_storage = {}
+pdf_storage = create_document_store()
+
+register(CallbackMetric("pdfchat_documents_stored", "Documents in the document store.",
+                        lambda: pdf_storage.stats()["documents"]))
+register(CallbackMetric("pdfchat_document_bytes_stored", "Compressed document bytes stored.",
+                        lambda: pdf_storage.stats()["compressed_bytes"]))
+
+
+def _remove_from_corpus(doc_key):
+    # The stored text is gone, so its passages' character ranges are meaningless
+    if corpus_index.remove_document(doc_key):
+        logger.info("Removed document %s from the corpus index", doc_key)
+
+
+if CORPUS_INDEX_ENABLED:
+    pdf_storage.add_removal_listener(_remove_from_corpus)
+
+# Identical chat requests that arrive while one is in flight share its model call
+chat_flight = SingleFlight()
+
+register(CallbackMetric("pdfchat_chat_coalesced_total", "Chat requests served by another in-flight call.",
+                        lambda: chat_flight.coalesced, type_name="counter"))
+
+
+def _remove_spooled(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _corpus_fingerprint(record):
+    """The corpus index fingerprint of a stored document's text, from its
+    metadata. Documents stored before the text length was recorded have none,
+    and are only checked for presence."""
+    if record.get("text_length") is None:
+        return None
+    return document_fingerprint(record["text_length"], record.get("normalizer"))
+
+
+def _index_for_corpus(doc_key, pdf_text, page_offsets=None, fingerprint=None):
+    """Adds a document's passages to the corpus-wide index unless they are
+    already there for this text."""
+    fingerprint = fingerprint or document_fingerprint(len(pdf_text))
+    if corpus_index.has_document(doc_key, fingerprint):
+        return
+    try:
+        count = corpus_index.add_document(doc_key, pdf_text, page_offsets, fingerprint)
+        logger.info("Indexed %d passages for cross-document chat: %s", count, doc_key)
+    except Exception as e:
+        # Cross-document chat is an extra; the upload itself has succeeded
+        logger.error("Error adding document %s to the corpus index: %s", doc_key, e)
+
+
+def _store_document(pdf_id, filename, content_hash, pdf_text=None, page_count=None, ttl=None,
+                    page_offsets=None):
+    """Stores a document entry; entries with the same content hash share one text blob.
+
+    `page_offsets` ([0, end_1, ..., end_n] into the text) are stored with the
+    text, for page filters and page citations.
+    """
+    existing = pdf_storage.find_by_hash(content_hash)
+    if existing is not None:
+        pdf_text, page_count = existing["text"], existing["page_count"]
+        page_offsets = existing.get("page_offsets")
+        index = existing["index"]
+        normalizer = existing.get("normalizer")
+    else:
+        index = build_document_index(pdf_text, page_offsets)
+        normalizer = default_normalizer.version
+
+    pdf_storage[pdf_id] = {
+        "filename": filename,
+        "text": pdf_text,
+        "page_count": page_count,
+        "page_offsets": page_offsets,
+        "index": index,
+        "content_hash": content_hash,
+        "normalizer": normalizer,
+        "ttl": ttl
+    }
+    if CORPUS_INDEX_ENABLED and pdf_text:
+        _index_for_corpus(content_hash or pdf_id, pdf_text, page_offsets,
+                          document_fingerprint(len(pdf_text), normalizer))
+
+
+def _finish_upload_job(pdf_id, filename, content_hash, ttl, path, future, page_lengths):
+    # Runs on the executor's callback thread once the pool worker is done
+    try:
+        pdf_text, page_count = future.result()
+        _store_document(pdf_id, filename, content_hash, pdf_text, page_count, ttl,
+                        offsets_for_pages(page_lengths))
+        complete_job(pdf_id, page_count)
+    except Exception as e:
+        fail_job(pdf_id, str(e))
+    finally:
+        _remove_spooled(path)
 
 
 @pdf_router.post("/v1/pdf")
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(file: UploadFile = File(...),
+                     async_mode: bool = Query(False, alias="async"),
+                     ttl: Optional[int] = Query(None, gt=0),
+                     extractor: str = Query(EXTRACTION_BACKEND)):
     logger.info("Received request to upload PDF.")
 
     # Log the details of the uploaded file
     logger.debug(
-        f"Uploaded file details: filename={file.filename}, content_type={file.content_type}")
+        "Uploaded file details: filename=%s, content_type=%s", file.filename, file.content_type)
 
     if file.content_type != "application/pdf":
         logger.warning("Invalid file type uploaded.")
         raise HTTPException(
             status_code=400, detail="Invalid file type. Only PDFs are allowed.")
 
+    if extractor != "auto" and extractor not in extractors:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown extractor. Choose one of: auto, {', '.join(extractors)}.")
+
+    pdf_id = str(uuid.uuid4())
+    path, content_hash = await spool_upload(file)
     try:
-        pdf_id = str(uuid.uuid4())
-        logger.info(f"Starting PDF text extraction for file: {file.filename}")
-        pdf_text, page_count = extract_pdf_text(file)
-        pdf_storage[pdf_id] = {
-            "filename": file.filename,
-            "text": pdf_text,
-            "page_count": page_count
-        }
-        logger.info(f"PDF successfully processed and stored with ID: {pdf_id}")
+        extractor = await asyncio.to_thread(resolve_extractor, extractor, path)
+    except Exception as e:
+        _remove_spooled(path)
+        logger.error("Error reading PDF: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid PDF file.")
+    # The same bytes extracted by another backend are a different document
+    content_hash = f"{content_hash}:{extractor}"
+
+    if await asyncio.to_thread(pdf_storage.find_by_hash, content_hash) is not None:
+        # Same bytes and backend were uploaded before: reuse the extracted text and index
+        _remove_spooled(path)
+        await asyncio.to_thread(_store_document, pdf_id, file.filename, content_hash, ttl=ttl)
+        logger.info("Duplicate upload stored as alias with ID: %s", pdf_id)
+        if async_mode:
+            return JSONResponse(status_code=202, content={"pdf_id": pdf_id, "status": "completed"})
+        return {"pdf_id": pdf_id}
+
+    on_progress = None
+    if async_mode:
+        create_job(pdf_id, file.filename)
+        on_progress = lambda done, total: update_job_progress(pdf_id, done, total)
+    page_lengths = []
+    try:
+        future = submit_extraction(path, on_progress=on_progress,
+                                   on_page=lambda text: page_lengths.append(len(text)),
+                                   extractor=extractor)
+    except ExtractionQueueFull:
+        _remove_spooled(path)
+        jobs.pop(pdf_id, None)
+        logger.warning("Extraction queue is full, rejecting upload.")
+        raise HTTPException(
+            status_code=503, detail="Server is busy processing other PDFs. Please retry later.")
+
+    if async_mode:
+        attach_job_future(pdf_id, future)
+        future.add_done_callback(
+            lambda f: _finish_upload_job(pdf_id, file.filename, content_hash, ttl, path, f, page_lengths))
+        logger.info("Queued PDF extraction job with ID: %s", pdf_id)
+        return JSONResponse(status_code=202, content={"pdf_id": pdf_id, "status": "queued"})
+
+    try:
+        logger.info("Starting PDF text extraction for file: %s", file.filename)
+        pdf_text, page_count = await asyncio.wrap_future(future)
+        # Indexing, compression and corpus embedding are CPU work; keep them off the event loop
+        await asyncio.to_thread(_store_document, pdf_id, file.filename, content_hash, pdf_text,
+                                page_count, ttl, offsets_for_pages(page_lengths))
+        logger.info("PDF successfully processed and stored with ID: %s", pdf_id)
         return {"pdf_id": pdf_id}
     except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}")
+        logger.error("Error processing PDF: %s", e)
         raise HTTPException(
             status_code=500, detail=f"Error processing PDF: {str(e)}")
+    finally:
+        _remove_spooled(path)
 
 
-@pdf_router.post("/v1/chat/{pdf_id}")
-async def chat_with_pdf(pdf_id: str, request: ChatRequest):
-    logger.info(f"Received chat request for PDF ID: {pdf_id}")
+@pdf_router.get("/v1/pdf/{pdf_id}/status")
+async def upload_status(pdf_id: str):
+    status = get_job_status(pdf_id)
+    if status is not None:
+        return status
+
+    record = await asyncio.to_thread(pdf_storage.get, pdf_id)
+    if record is not None:
+        return {"pdf_id": pdf_id, "filename": record["filename"],
+                "status": "completed", "page_count": record["page_count"]}
+
+    raise HTTPException(status_code=404, detail="PDF not found.")
+
 
-    if pdf_id not in pdf_storage:
-        logger.warning(f"PDF not found: {pdf_id}")
+async def _get_pdf_for_chat(pdf_id, request):
+    """Returns the stored record (metadata only; the text is not loaded yet)."""
+    record = await asyncio.to_thread(pdf_storage.get, pdf_id)
+    if record is None:
+        logger.warning("PDF not found: %s", pdf_id)
         raise HTTPException(status_code=404, detail="PDF not found.")
 
     if not request.query.strip():
-        logger.warning(f"Empty query received for PDF ID: {pdf_id}")
+        logger.warning("Empty query received for PDF ID: %s", pdf_id)
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+    return record
+
+
+def _needs_index(request):
+    return RETRIEVAL_ENABLED and not request.full_context and not request.pages
+
+
+async def _load_for_chat(record, request):
+    """Loads the text, and the retrieval index the request needs, in a thread:
+    a document whose hot copy was evicted is decompressed and re-indexed,
+    which takes about a second for a thousand pages. Then checks the
+    requested pages."""
+    pdf_data = await asyncio.to_thread(record.load, _needs_index(request))
+    _requested_pages(pdf_data, request)
+    return pdf_data
+
+
+def _requested_pages(pdf_data, request):
+    """Returns the sorted page numbers named by `request.pages` ("12", "3-5,9"),
+    or None when the request is not limited to pages."""
+    if not request.pages:
+        return None
+    page_offsets = pdf_data.get("page_offsets")
+    if not page_offsets:
+        raise HTTPException(
+            status_code=400,
+            detail="Page boundaries are not known for this document; upload it again to filter by page.")
+
+    page_count = len(page_offsets) - 1
+    pages = set()
+    for part in request.pages.split(","):
+        first, _, last = part.strip().partition("-")
+        try:
+            first, last = int(first), int(last or first)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid page range: {part.strip()!r}")
+        if not 1 <= first <= last <= page_count:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Page range {part.strip()} is outside the document's {page_count} pages.")
+        pages.update(range(first, last + 1))
+    return sorted(pages)
+
+
+def _cited_pages(pdf_data, request, chunk_ids):
+    """Pages the answer was drawn from: the requested pages, or the pages the
+    retrieved chunks span. None when the whole document was sent or page
+    boundaries are unknown."""
+    if request.pages:
+        return _requested_pages(pdf_data, request)
+    index = pdf_data.get("index") if chunk_ids else None
+    if index is None or index.chunk_pages is None:
+        return None
+    return sorted({page for chunk_id in chunk_ids
+                   for page in range(index.chunk_pages[chunk_id][0], index.chunk_pages[chunk_id][1] + 1)})
+
+
+def _document_key(pdf_id, pdf_data):
+    # Aliased uploads share a content hash, and so share cached answers
+    return pdf_data.get("content_hash") or pdf_id
+
+
+def _cache_scope(doc_key, request):
+    # Answers about selected pages, and full-context answers, are cached apart
+    # from answers built from retrieved chunks
+    if request.pages:
+        return f"{doc_key}:pages={''.join(request.pages.split())}"
+    return f"{doc_key}:full" if request.full_context else doc_key
+
+
+def _select_context(pdf_id, pdf_data, request):
+    """Returns (context, chunk_ids): the requested pages, the retrieved chunks,
+    or the whole text in full-context mode."""
+    pages = _requested_pages(pdf_data, request)
+    if pages is not None:
+        text, page_offsets = pdf_data["text"], pdf_data["page_offsets"]
+        logger.info("Using pages %s for PDF ID: %s", request.pages, pdf_id)
+        return "\n\n".join(f"[Page {page}]\n{text[page_offsets[page - 1]:page_offsets[page]]}"
+                            for page in pages), None
+
+    index = pdf_data.get("index")
+    if RETRIEVAL_ENABLED and index is not None and not request.full_context:
+        chunk_ids = select_chunks(
+            index, request.query, RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET)
+        logger.info(
+            "Retrieved chunks %s for PDF ID: %s", chunk_ids, pdf_id)
+        return build_context(index, chunk_ids), chunk_ids
+    return pdf_data["text"], None
+
+
+def _flight_key(request, doc_key):
+    # `doc_key` is the cache scope, which already separates the answer modes
+    return make_cache_key(request.query, doc_key, GEMINI_MODEL)
+
+
+def _response_metadata(plan, retrieve_seconds, started):
+    timings = {"retrieve": retrieve_seconds, **plan["timings"],
+               "total": time.perf_counter() - started}
+    return {"strategy": plan["strategy"], "windows": plan["windows"],
+            "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()}}
+
+
+async def _answer_query(pdf_id, pdf_data, doc_key, request):
+    """Returns (response, chunk_ids, pages, metadata) from the model. `pages`
+    are the cited pages. Identical requests that are already in flight share
+    that call instead of making another. Metadata holds the answer strategy
+    and per-stage seconds.
 
-    cached_response = get_cached_response(request.query)
-    if cached_response:
-        logger.info(f"Serving cached response for query: {request.query}")
-        return {"response": cached_response}
+    `doc_key` is the cache scope (see _cache_scope)."""
+    async def generate():
+        started = time.perf_counter()
+        context, chunk_ids = await asyncio.to_thread(_select_context, pdf_id, pdf_data, request)
+        retrieve_seconds = time.perf_counter() - started
+        CHAT_STAGE_LATENCY.observe(retrieve_seconds, stage="retrieve")
+        response_text, plan = await generate_planned_response(context, request.query)
+        pages = _cited_pages(pdf_data, request, chunk_ids)
+        metadata = _response_metadata(plan, retrieve_seconds, started)
+        cache_response(request.query, response_text, doc_key,
+                       chunk_ids=chunk_ids, pages=pages, metadata=metadata)
+        return response_text, chunk_ids, pages, metadata
 
+    return await chat_flight.do(_flight_key(request, doc_key), generate)
+
+
+def _cached_chat_response(cached):
+    # Same shape as a fresh answer; the metadata is that of the call that produced it
+    return {"response": cached["response"], "chunk_ids": cached.get("chunk_ids"),
+            "pages": cached.get("pages"), "metadata": {**(cached.get("metadata") or {}), "cached": True}}
+
+
+@pdf_router.post("/v1/chat/{pdf_id}")
+async def chat_with_pdf(pdf_id: str, request: ChatRequest):
+    logger.info("Received chat request for PDF ID: %s", pdf_id)
+
+    record = await _get_pdf_for_chat(pdf_id, request)
+    doc_key = _cache_scope(_document_key(pdf_id, record), request)
+
+    cached = get_cached_answer(request.query, doc_key)
+    if cached:
+        logger.info("Serving cached response for query: %s", request.query)
+        return _cached_chat_response(cached)
+
+    pdf_data = await _load_for_chat(record, request)
     try:
-        pdf_data = pdf_storage[pdf_id]
-        pdf_text = pdf_data["text"]
-        response_text = generate_response_from_model(pdf_text, request.query)
-        cache_response(request.query, response_text)
-        return {"response": response_text}
+        response_text, chunk_ids, pages, metadata = await _answer_query(pdf_id, pdf_data, doc_key, request)
+        return {"response": response_text, "chunk_ids": chunk_ids, "pages": pages, "metadata": metadata}
     except Exception as e:
+        if isinstance(e, HTTPException) and e.status_code in (429, 503):
+            raise  # keep the status and Retry-After so clients back off
         logger.error(
-            f"Error generating response for PDF ID {pdf_id}: {str(e)}")
+            "Error generating response for PDF ID %s: %s", pdf_id, e)
         raise HTTPException(
             status_code=500, detail=f"Error generating response: {str(e)}")
+
+
+def _resolve_documents(pdf_ids):
+    """Returns {doc_key: (pdf_id, record)} for the requested documents. Aliases
+    of the same upload collapse into the first pdf_id that names them."""
+    if pdf_ids == "all":
+        pdf_ids = pdf_storage.ids()
+    else:
+        missing = [pdf_id for pdf_id in pdf_ids if pdf_id not in pdf_storage]
+        if missing:
+            logger.warning("PDFs not found: %s", missing)
+            raise HTTPException(status_code=404, detail=f"PDF not found: {', '.join(missing)}")
+
+    documents = {}
+    for pdf_id in pdf_ids:
+        pdf_data = pdf_storage.get(pdf_id)
+        if pdf_data is not None:
+            documents.setdefault(_document_key(pdf_id, pdf_data), (pdf_id, pdf_data))
+    if not documents:
+        raise HTTPException(status_code=404, detail="No documents to search.")
+    return documents
+
+
+def _select_corpus_context(query, documents):
+    """Returns (context, sources): the best passages across `documents`, each
+    headed with its document and page, within the retrieval token budget.
+
+    Texts are read without touching the hot document LRU, so a question over
+    many documents does not push out the ones single-document chat is using.
+    """
+    doc_keys = list(documents)
+    ranked = (corpus_index.search(query, doc_keys, CORPUS_TOP_K)
+              or corpus_index.leading_passages(doc_keys, CORPUS_TOP_K))
+
+    parts = []
+    sources = []
+    texts = {}
+    used_tokens = 0
+    for doc_key, page, start, end, score in ranked:
+        pdf_id, pdf_data = documents[doc_key]
+        if doc_key not in texts:
+            texts[doc_key] = pdf_data.read_text()
+        passage = texts[doc_key][start:end]
+        passage_tokens = estimate_tokens(passage)
+        if used_tokens + passage_tokens > RETRIEVAL_TOKEN_BUDGET:
+            continue
+        used_tokens += passage_tokens
+        number = len(sources) + 1
+        location = f", page {page}" if page else ""
+        parts.append(f"[Source {number}: {pdf_data['filename']} (pdf_id {pdf_id}){location}]\n{passage}")
+        sources.append({"source": number, "pdf_id": pdf_id, "filename": pdf_data["filename"],
+                        "page": page, "score": round(score, 4)})
+    return "\n\n".join(parts), sources
+
+
+@pdf_router.post("/v1/chat")
+async def chat_with_corpus(request: CorpusChatRequest):
+    """Answers a question from the most relevant passages across several
+    documents (or all of them), citing the document and page of each passage."""
+    scope_size = "all" if request.pdf_ids == "all" else len(request.pdf_ids)
+    logger.info("Received cross-document chat request over %s documents", scope_size)
+
+    if not request.query.strip():
+        logger.warning("Empty query received for cross-document chat")
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    documents = await asyncio.to_thread(_resolve_documents, request.pdf_ids)
+    fingerprints = {doc_key: _corpus_fingerprint(record) for doc_key, (_, record) in documents.items()}
+    unindexed = await asyncio.to_thread(corpus_index.missing, fingerprints)
+    if unindexed:
+        # Documents stored before they could be indexed (e.g. from a persistent
+        # store), or indexed from text that has since been extracted again
+        await asyncio.to_thread(
+            lambda: [_index_for_corpus(doc_key, documents[doc_key][1].read_text(),
+                                       documents[doc_key][1]["page_offsets"], fingerprints[doc_key])
+                     for doc_key in unindexed])
+
+    scope = "corpus:" + hashlib.sha256("\n".join(sorted(documents)).encode()).hexdigest()[:16]
+    cached = get_cached_answer(request.query, scope)
+    if cached:
+        logger.info("Serving cached response for query: %s", request.query)
+        return {"response": cached["response"], "sources": cached.get("sources")}
+
+    async def generate():
+        context, sources = await asyncio.to_thread(_select_corpus_context, request.query, documents)
+        response_text = await generate_response_from_model(context, request.query)
+        cache_response(request.query, response_text, scope, sources=sources)
+        return response_text, sources
+
+    try:
+        flight_key = (make_cache_key(request.query, scope, GEMINI_MODEL), "corpus")
+        response_text, sources = await chat_flight.do(flight_key, generate)
+        return {"response": response_text, "sources": sources}
+    except Exception as e:
+        if isinstance(e, HTTPException) and e.status_code in (429, 503):
+            raise
+        logger.error("Error generating cross-document response: %s", e)
+        raise HTTPException(
+            status_code=500, detail=f"Error generating response: {str(e)}")
+
+
+def _batch_error(query, status_code, detail):
+    return {"query": query, "error": {"status_code": status_code, "detail": detail}}
+
+
+def _pack_queries(pdf_id, pdf_data, items):
+    """Groups (request, positions) items into packed model calls.
+
+    Full-context questions share the whole text, up to BATCH_PACK_SIZE per
+    call, unless the text is too large for one call. Retrieval questions are
+    packed in order while the union of their chunks stays within
+    BATCH_PACK_TOKEN_BUDGET. Page-filtered questions, and full-context ones
+    on oversized texts, get a group of their own and are answered one by one.
+    Returns a list of (context, [(request, chunk_ids, positions)]).
+    """
+    index = pdf_data.get("index")
+    groups = []
+    full_text = []
+    packed, packed_chunks = [], set()
+
+    def chunk_tokens(chunk_ids):
+        return sum(estimate_tokens(index.chunks[chunk_id]) for chunk_id in chunk_ids)
+
+    for request, positions in items:
+        if request.pages:
+            groups.append((None, [(request, None, positions)]))
+            continue
+        _, chunk_ids = _select_context(pdf_id, pdf_data, request)
+        if chunk_ids is None:
+            if not fits_context(pdf_data["text"], request.query):
+                groups.append((None, [(request, None, positions)]))
+                continue
+            full_text.append((request, None, positions))
+            if len(full_text) == BATCH_PACK_SIZE:
+                groups.append((pdf_data["text"], full_text))
+                full_text = []
+            continue
+        merged = packed_chunks | set(chunk_ids)
+        if packed and (len(packed) == BATCH_PACK_SIZE or chunk_tokens(merged) > BATCH_PACK_TOKEN_BUDGET):
+            groups.append((build_context(index, packed_chunks), packed))
+            packed, merged = [], set(chunk_ids)
+        packed.append((request, chunk_ids, positions))
+        packed_chunks = merged
+
+    if full_text:
+        groups.append((pdf_data["text"], full_text))
+    if packed:
+        groups.append((build_context(index, packed_chunks), packed))
+    return groups
+
+
+@pdf_router.post("/v1/chat/{pdf_id}/batch")
+async def chat_with_pdf_batch(pdf_id: str, batch: BatchChatRequest):
+    """Answers a list of questions about one document.
+
+    Cache hits are served without a model call. The remaining questions are
+    answered one model call each ("fanout") or with compatible questions
+    packed into shared calls ("packed"). Results come back in request order;
+    a failed question gets an "error" entry instead of failing the batch.
+    """
+    logger.info("Received batch of %d queries (%s) for PDF ID: %s",
+                len(batch.queries), batch.mode, pdf_id)
+
+    record = await asyncio.to_thread(pdf_storage.get, pdf_id)
+    if record is None:
+        logger.warning("PDF not found: %s", pdf_id)
+        raise HTTPException(status_code=404, detail="PDF not found.")
+    if not batch.queries:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one query.")
+    if len(batch.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400, detail=f"Batch cannot contain more than {BATCH_MAX_QUERIES} queries.")
+
+    pdf_data = await asyncio.to_thread(
+        record.load, any(_needs_index(request) for request in batch.queries))
+    doc_key = _document_key(pdf_id, pdf_data)
+    results = [None] * len(batch.queries)
+
+    # Repeated questions in a batch are answered once
+    misses = {}  # flight key -> (request, positions)
+    for position, request in enumerate(batch.queries):
+        if not request.query.strip():
+            results[position] = _batch_error(request.query, 400, "Query cannot be empty")
+            continue
+        try:
+            _requested_pages(pdf_data, request)
+        except HTTPException as e:
+            results[position] = _batch_error(request.query, e.status_code, e.detail)
+            continue
+        cached = get_cached_answer(request.query, _cache_scope(doc_key, request))
+        if cached:
+            results[position] = {"query": request.query, "response": cached["response"],
+                                 "chunk_ids": cached.get("chunk_ids"), "pages": cached.get("pages"),
+                                 "cached": True}
+            continue
+        misses.setdefault(_flight_key(request, _cache_scope(doc_key, request)),
+                          (request, []))[1].append(position)
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    def fill(request, positions, entry):
+        for position in positions:
+            results[position] = {"query": request.query, **entry}
+
+    async def answer_one(request, positions):
+        try:
+            async with semaphore:
+                response_text, chunk_ids, pages, _ = await _answer_query(
+                    pdf_id, pdf_data, _cache_scope(doc_key, request), request)
+        except HTTPException as e:
+            fill(request, positions, _batch_error(request.query, e.status_code, e.detail))
+        except Exception as e:
+            logger.error("Error generating batch response for PDF ID %s: %s", pdf_id, e)
+            fill(request, positions,
+                 _batch_error(request.query, 500, f"Error generating response: {str(e)}"))
+        else:
+            fill(request, positions, {"response": response_text, "chunk_ids": chunk_ids,
+                                      "pages": pages, "cached": False})
+
+    async def answer_packed(context, group):
+        if len(group) == 1:
+            request, _, positions = group[0]
+            return await answer_one(request, positions)
+        try:
+            async with semaphore:
+                answers = await generate_batch_response_from_model(
+                    context, [request.query for request, _, _ in group])
+        except ValueError as e:
+            logger.warning("Malformed packed response for PDF ID %s, answering individually: %s",
+                           pdf_id, e)
+            await asyncio.gather(*(answer_one(request, positions) for request, _, positions in group))
+            return
+        except HTTPException as e:
+            for request, _, positions in group:
+                fill(request, positions, _batch_error(request.query, e.status_code, e.detail))
+            return
+        for (request, chunk_ids, positions), answer in zip(group, answers):
+            pages = _cited_pages(pdf_data, request, chunk_ids)
+            cache_response(request.query, answer, _cache_scope(doc_key, request),
+                           chunk_ids=chunk_ids, pages=pages)
+            fill(request, positions, {"response": answer, "chunk_ids": chunk_ids,
+                                      "pages": pages, "cached": False})
+
+    if batch.mode == "packed":
+        groups = await asyncio.to_thread(_pack_queries, pdf_id, pdf_data, misses.values())
+        logger.info("Packed %d queries into %d model calls for PDF ID: %s",
+                    len(misses), len(groups), pdf_id)
+        await asyncio.gather(*(answer_packed(context, group) for context, group in groups))
+    else:
+        await asyncio.gather(*(answer_one(request, positions) for request, positions in misses.values()))
+
+    return {"results": results}
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@pdf_router.post("/v1/chat/{pdf_id}/stream")
+async def chat_with_pdf_stream(pdf_id: str, request: ChatRequest, http_request: Request):
+    logger.info("Received streaming chat request for PDF ID: %s", pdf_id)
+
+    record = await _get_pdf_for_chat(pdf_id, request)
+    doc_key = _cache_scope(_document_key(pdf_id, record), request)
+    cached = get_cached_answer(request.query, doc_key)
+    # Loaded before the response starts, so invalid pages still get a 400
+    pdf_data = None if cached else await _load_for_chat(record, request)
+
+    async def events():
+        if cached:
+            logger.info("Serving cached response for query: %s", request.query)
+            yield _sse_event("meta", {"chunk_ids": cached.get("chunk_ids"), "pages": cached.get("pages")})
+            yield _sse_event("token", {"text": cached["response"]})
+            yield _sse_event("done", {"response": cached["response"], "cached": True})
+            return
+
+        context, chunk_ids = await asyncio.to_thread(_select_context, pdf_id, pdf_data, request)
+        pages = _cited_pages(pdf_data, request, chunk_ids)
+        yield _sse_event("meta", {"chunk_ids": chunk_ids, "pages": pages})
+
+        if not fits_context(context, request.query):
+            # A map-reduce answer only exists once the reduce step is done, so it is sent whole
+            try:
+                response_text, _ = await generate_planned_response(context, request.query)
+            except Exception as e:
+                logger.error(
+                    "Error generating response for PDF ID %s: %s", pdf_id, e)
+                yield _sse_event("error", {"detail": f"Error generating response: {str(e)}"})
+                return
+            cache_response(request.query, response_text, doc_key, chunk_ids=chunk_ids, pages=pages)
+            yield _sse_event("token", {"text": response_text})
+            yield _sse_event("done", {"response": response_text})
+            return
+
+        pieces = []
+        try:
+            # aclosing() cancels the upstream generation if the client goes away
+            async with aclosing(stream_response_from_model(context, request.query)) as upstream:
+                async for piece in upstream:
+                    if await http_request.is_disconnected():
+                        logger.info("Client disconnected from stream for PDF ID: %s", pdf_id)
+                        return
+                    pieces.append(piece)
+                    yield _sse_event("token", {"text": piece})
+        except Exception as e:
+            logger.error(
+                "Error streaming response for PDF ID %s: %s", pdf_id, e)
+            yield _sse_event("error", {"detail": f"Error generating response: {str(e)}"})
+            return
+
+        response_text = "".join(pieces)
+        cache_response(request.query, response_text, doc_key, chunk_ids=chunk_ids, pages=pages)
+        yield _sse_event("done", {"response": response_text})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,267 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from config import (MODEL_RPM_LIMIT, MODEL_TPM_LIMIT, MODEL_MAX_CONCURRENCY, MODEL_QUEUE_SIZE,
+                    MODEL_QUEUE_TIMEOUT)
+from metrics import register, CallbackMetric
+
+# How the limiter reacts to upstream 429s: each one scales the request/token
+# rates and the concurrency limit down, and each success recovers a little.
+THROTTLE_DECREASE = 0.7
+SUCCESS_INCREASE = 0.02
+MIN_SCALE = 0.1
+
+
+class ModelOverloaded(Exception):
+    """Raised when a model call cannot be admitted: the wait queue is full, or
+    the caller's deadline passed while it was queued."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills continuously at `rate_per_minute` and holds at most
+    `burst_seconds` worth of tokens. A rate of 0 disables the bucket."""
+
+    def __init__(self, rate_per_minute, burst_seconds=10.0):
+        self.limit = rate_per_minute
+        self.rate = rate_per_minute  # current rate; lowered while upstream throttles
+        self.burst_seconds = burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self):
+        return self.limit > 0
+
+    @property
+    def capacity(self):
+        return max(1.0, self.rate * self.burst_seconds / 60)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Seconds until `amount` tokens can be taken (0 if they can be now).
+
+        Requests larger than the bucket only wait for a full bucket, then
+        leave it in debt, so they are admitted but still count in full.
+        """
+        if not self.enabled:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) * 60 / self.rate
+
+    def take(self, amount, now):
+        if self.enabled:
+            self._refill(now)
+            self.tokens -= amount
+
+    def set_scale(self, scale, now):
+        if self.enabled:
+            self._refill(now)
+            self.rate = self.limit * scale
+            self.tokens = min(self.tokens, self.capacity)
+
+
+class _Waiter:
+    """A queued acquire() call. It can be woken from any thread or event loop."""
+
+    __slots__ = ("loop", "future")
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class RateLimiter:
+    """Admission control for model calls.
+
+    A call is admitted when a concurrency slot is free and both the
+    requests-per-minute and input-tokens-per-minute buckets can pay for it.
+    Otherwise it waits in a FIFO queue of at most `max_queue` callers until
+    its deadline. Only a full queue or an expired deadline raises
+    ModelOverloaded, so under a steady overload throughput stays at the
+    quota instead of failing fast.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_concurrency=32,
+                 max_queue=256, queue_timeout=30.0, burst_seconds=10.0):
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(requests_per_minute, burst_seconds)
+        self._tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters = deque()
+        self._paused_until = 0.0
+        self._scale = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.throttled = 0
+
+    def _concurrency_limit(self):
+        return max(1, int(self.max_concurrency * self._scale))
+
+    def _try_admit(self, tokens, now):
+        """Admits the call if possible (lock held). Returns 0 when admitted, the
+        seconds until the buckets allow it, or None while no slot is free."""
+        if self._active >= self._concurrency_limit():
+            return None
+        delay = max(self._paused_until - now,
+                    self._requests.delay(1, now),
+                    self._tokens.delay(tokens, now))
+        if delay > 0:
+            return delay
+        self._requests.take(1, now)
+        self._tokens.take(tokens, now)
+        self._active += 1
+        self.admitted += 1
+        return 0
+
+    def _wake_head(self):
+        if self._waiters:
+            self._waiters[0].wake()
+
+    async def acquire(self, tokens=0, deadline=None):
+        """Waits for admission. `deadline` is a time.monotonic() value; the
+        limiter's own queue_timeout applies when it is sooner."""
+        now = time.monotonic()
+        own_deadline = now + self.queue_timeout
+        deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+        with self._lock:
+            if not self._waiters and self._try_admit(tokens, now) == 0:
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise ModelOverloaded("Model request queue is full.")
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    delay = None
+                    if self._waiters[0] is waiter:
+                        delay = self._try_admit(tokens, now)
+                        if delay == 0:
+                            self._waiters.popleft()
+                            self._wake_head()
+                            return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise ModelOverloaded("Timed out waiting for model capacity.",
+                                              retry_after=max(1.0, delay or 0.0))
+                    if waiter.future.done():
+                        waiter.future = waiter.loop.create_future()
+                    future = waiter.future
+                timeout = remaining if delay is None else min(delay, remaining)
+                try:
+                    await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    was_head = self._waiters[0] is waiter
+                    self._waiters.remove(waiter)
+                    if was_head:
+                        self._wake_head()
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            self._wake_head()
+
+    @asynccontextmanager
+    async def limit(self, tokens=0, deadline=None):
+        await self.acquire(tokens, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _set_scale(self, scale, now):
+        self._scale = scale
+        self._requests.set_scale(scale, now)
+        self._tokens.set_scale(scale, now)
+
+    def on_throttled(self, retry_after=None):
+        """Records an upstream 429: slows down, and pauses admissions for
+        `retry_after` seconds when upstream said how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self._set_scale(max(MIN_SCALE, self._scale * THROTTLE_DECREASE), now)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def on_success(self):
+        with self._lock:
+            if self._scale < 1.0:
+                self._set_scale(min(1.0, self._scale + SUCCESS_INCREASE), time.monotonic())
+                self._wake_head()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": len(self._waiters),
+                "concurrency_limit": self._concurrency_limit(),
+                "requests_per_minute": self._requests.rate,
+                "tokens_per_minute": self._tokens.rate,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "throttled": self.throttled,
+            }
+
+
+# Shared by every model call in the process
+model_limiter = RateLimiter(
+    requests_per_minute=MODEL_RPM_LIMIT,
+    tokens_per_minute=MODEL_TPM_LIMIT,
+    max_concurrency=MODEL_MAX_CONCURRENCY,
+    max_queue=MODEL_QUEUE_SIZE,
+    queue_timeout=MODEL_QUEUE_TIMEOUT,
+)
+
+register(CallbackMetric("pdfchat_model_queue_depth", "Model calls waiting for capacity.",
+                        lambda: model_limiter.stats()["queued"]))
+register(CallbackMetric("pdfchat_model_calls_active", "Model calls in flight.",
+                        lambda: model_limiter.stats()["active"]))
+register(CallbackMetric("pdfchat_model_shed_total", "Model calls rejected with 503.",
+                        lambda: model_limiter.rejected + model_limiter.timed_out, type_name="counter"))
+register(CallbackMetric("pdfchat_model_throttled_total", "Upstream 429 responses.",
+                        lambda: model_limiter.throttled, type_name="counter"))
+
+
+def retry_after_seconds(error):
+    """Returns the Retry-After delay carried by an upstream error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,133 @@
+import math
+import re
+import sys
+from bisect import bisect_right
+from collections import Counter, defaultdict
+
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# One (chunk_id, term_freq) posting: the tuple plus a chunk id past the small int cache
+POSTING_BYTES = sys.getsizeof((0, 0)) + sys.getsizeof(1000)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def estimate_tokens(text):
+    """Rough token estimate for Gemini prompts: ~4 characters per token for
+    ASCII text. Other scripts tokenize much finer, so non-ASCII text is
+    counted as ~3 UTF-8 bytes per token (about one token per CJK character)."""
+    if text.isascii():
+        return max(1, len(text) // 4)
+    return max(1, len(text.encode("utf-8")) // 3)
+
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Splits text into overlapping windows of `chunk_size` words."""
+    words = text.split()
+    if not words:
+        return []
+
+    step = max(1, chunk_size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(' '.join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+class BM25Index:
+    """Per-document inverted index over text chunks, scored with BM25."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.chunk_pages = None  # (first, last) page of each chunk, when page offsets are known
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(chunk_id, term_freq)]
+        self.chunk_lengths = []
+
+        for chunk_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            self.chunk_lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                self.postings[term].append((chunk_id, freq))
+
+        self.avg_length = (sum(self.chunk_lengths) / len(chunks)) if chunks else 0.0
+
+    def search(self, query, top_k):
+        """Returns up to `top_k` (chunk_id, score) pairs, best first."""
+        scores = defaultdict(float)
+        chunk_count = len(self.chunks)
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.chunk_lengths[chunk_id] / self.avg_length)
+                scores[chunk_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
+
+    def memory_bytes(self):
+        """Approximate heap size of the index: chunk strings, postings and lengths."""
+        size = sys.getsizeof(self.chunks) + sum(sys.getsizeof(chunk) for chunk in self.chunks)
+        size += sys.getsizeof(self.postings)
+        for term, postings in self.postings.items():
+            size += sys.getsizeof(term) + sys.getsizeof(postings) + len(postings) * POSTING_BYTES
+        size += sys.getsizeof(self.chunk_lengths) + len(self.chunk_lengths) * sys.getsizeof(1000)
+        if self.chunk_pages:
+            size += sys.getsizeof(self.chunk_pages) + len(self.chunk_pages) * sys.getsizeof((0, 0))
+        return size
+
+
+def chunk_pages(text, page_offsets, chunk_count, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Returns the (first, last) 1-based pages spanned by each chunk_text() chunk."""
+    words_before = [0]  # words before each page boundary
+    for start, end in zip(page_offsets, page_offsets[1:]):
+        words_before.append(words_before[-1] + len(text[start:end].split()))
+    last_word = max(0, words_before[-1] - 1)
+    step = max(1, chunk_size - overlap)
+    return [(min(len(page_offsets) - 1, bisect_right(words_before, i * step)),
+             min(len(page_offsets) - 1, bisect_right(words_before, min(i * step + chunk_size - 1, last_word))))
+            for i in range(chunk_count)]
+
+
+def build_document_index(text, page_offsets=None):
+    index = BM25Index(chunk_text(text))
+    if page_offsets:
+        index.chunk_pages = chunk_pages(text, page_offsets, len(index.chunks))
+    return index
+
+
+def select_chunks(index, query, top_k, token_budget):
+    """Picks the best-ranked chunk ids that fit within `token_budget`.
+
+    When nothing in the query matches the index, the leading chunks of the
+    document are used instead so the model still gets some context.
+    """
+    ranked = [chunk_id for chunk_id, _ in index.search(query, top_k)]
+    if not ranked:
+        ranked = list(range(min(top_k, len(index.chunks))))
+
+    selected = []
+    used_tokens = 0
+    for chunk_id in ranked:
+        chunk_tokens = estimate_tokens(index.chunks[chunk_id])
+        if used_tokens + chunk_tokens > token_budget:
+            continue
+        selected.append(chunk_id)
+        used_tokens += chunk_tokens
+    return selected
+
+
+def build_context(index, chunk_ids):
+    """Joins the selected chunks back together in document order."""
+    return "\n\n".join(index.chunks[chunk_id] for chunk_id in sorted(chunk_ids))
@@ -1,28 +1,310 @@
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import AsyncRetrying, stop_after_attempt, wait_random_exponential, retry_if_exception
+from tenacity.stop import stop_base
+from tenacity.wait import wait_base
 import requests
-import google.generativeai as genai
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+import asyncio
+import json
+import math
+import sys
+import threading
+import time
 from fastapi import HTTPException
 from logging_config import logger
-from dotenv import load_dotenv
-import os
+from model_client import get_model_client, ModelCall, current_model_call
+from config import (MODEL_REQUEST_DEADLINE, MODEL_RETRY_ATTEMPTS, MODEL_RETRY_MAX_WAIT,
+                    MODEL_RETRY_BUDGET_RATIO, MODEL_RETRY_BUDGET_MIN_PER_SECOND, MODEL_HEDGE_ENABLED,
+                    MODEL_HEDGE_PERCENTILE, MODEL_HEDGE_MIN_SAMPLES, MAP_CONCURRENCY)
+from metrics import (register, CallbackMetric, CHAT_STAGE_LATENCY, MODEL_CALL_LATENCY, MODEL_RETRIES,
+                     MODEL_HEDGES)
+from context_planner import plan_context, group_by_budget
+from rate_limiter import model_limiter, ModelOverloaded, retry_after_seconds
+from retrieval import estimate_tokens
 
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+def build_prompt(pdf_text: str, query: str):
+    return f"{pdf_text}\n\nUser query: {query}"
 
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=2, max=60),
-    retry=retry_if_exception_type(
-        (requests.exceptions.Timeout, requests.exceptions.ConnectionError)),
-)
-def generate_response_from_model(pdf_text: str, query: str):
-    model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+# What a map-step call answers when its part of the document is irrelevant
+NO_ANSWER = "NONE"
+
+
+def build_map_prompt(window: str, query: str, part: int, parts: int):
+    return (f"The text below is part {part} of {parts} of a longer document.\n\n{window}\n\n"
+            f"Answer the user query using only this part. Be concise, but keep the details needed "
+            f"to combine your answer with answers from the other parts. If this part has nothing "
+            f"relevant, reply with exactly {NO_ANSWER}.\n\nUser query: {query}")
+
+
+def build_reduce_prompt(partial_answers, query: str):
+    notes = "\n\n".join(f"[Part {i}]\n{answer}" for i, answer in enumerate(partial_answers, 1))
+    return (f"Each note below answers the same query from one part of a long document, in "
+            f"document order.\n\n{notes}\n\nCombine the notes into one complete answer to the user "
+            f"query. Merge repeated points and do not mention the parts.\n\nUser query: {query}")
+
+
+def build_batch_prompt(pdf_text: str, queries):
+    numbered = "\n".join(f"{i}. {' '.join(query.split())}" for i, query in enumerate(queries, 1))
+    return (f"{pdf_text}\n\n"
+            f"Answer each numbered question below using the document above. Respond with a JSON "
+            f"array of exactly {len(queries)} strings, where element i is the answer to question i."
+            f"\n\nQuestions:\n{numbered}")
+
+
+def parse_batch_response(text: str, count: int):
+    text = text.strip()
+    if text.startswith("```"):
+        # Tolerate a fenced code block around the JSON
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        answers = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Batch response is not valid JSON: {e}")
+    if (not isinstance(answers, list) or len(answers) != count
+            or not all(isinstance(answer, str) for answer in answers)):
+        raise ValueError(f"Batch response is not a list of {count} answers.")
+    return answers
+
+
+@asynccontextmanager
+async def model_slot(prompt: str, deadline=None, call=None):
+    """Holds a model_limiter slot for the call; sheds load with 503 when the
+    limiter's wait queue is full or the wait times out. With a ModelCall, the
+    slot is held until the call's executor threads have returned."""
+    try:
+        await model_limiter.acquire(estimate_tokens(prompt), deadline)
+    except ModelOverloaded as e:
+        logger.warning("Shedding model request: %s", e)
+        raise HTTPException(
+            status_code=503, detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    try:
+        yield
+    finally:
+        if call is None:
+            model_limiter.release()
+        else:
+            call.when_idle(model_limiter.release)
+
+
+class RetryBudget:
+    """Process-wide allowance for retries and hedges, so they cannot multiply
+    the load on Gemini during an outage.
+
+    Every call deposits `ratio` tokens and every retry or hedge spends one.
+    `min_per_second` tokens also accrue over time so a quiet process can still
+    retry. At most `max_tokens` are banked.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=1.0, max_tokens=10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.updated = time.monotonic()
+        self.spent = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def _deposit(self, amount):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens,
+                          self.tokens + amount + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def record_call(self):
+        with self._lock:
+            self._deposit(self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            self._deposit(0)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.spent += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {"tokens": round(self.tokens, 2), "spent": self.spent, "exhausted": self.exhausted}
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful model calls."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction, min_samples=1):
+        """Returns the `fraction` percentile, or None with fewer than `min_samples` samples."""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+retry_budget = RetryBudget(ratio=MODEL_RETRY_BUDGET_RATIO,
+                           min_per_second=MODEL_RETRY_BUDGET_MIN_PER_SECOND)
+model_latency = LatencyWindow()
+
+register(CallbackMetric("pdfchat_model_retry_budget_exhausted_total",
+                        "Retries or hedges skipped because the retry budget was spent.",
+                        lambda: retry_budget.exhausted, type_name="counter"))
+
+
+def _http_status(error):
+    # google.api_core.exceptions pulls in gRPC, so it is never imported here:
+    # an error can only be one of its types if something already imported it
+    google_exceptions = sys.modules.get("google.api_core.exceptions")
+    if google_exceptions is not None and isinstance(error, google_exceptions.GoogleAPICallError):
+        return error.code
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+def _is_transient(error):
+    """Errors worth another attempt: timeouts, dropped connections, 429 and 5xx."""
+    if isinstance(error, (asyncio.TimeoutError, requests.exceptions.Timeout,
+                          requests.exceptions.ConnectionError)):
+        return True
+    status = _http_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+class stop_at_deadline(stop_base):
+    """Stops when the next attempt could not start before `deadline` (time.monotonic())."""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def __call__(self, retry_state):
+        return time.monotonic() + retry_state.upcoming_sleep >= self.deadline
+
+
+class stop_when_budget_exhausted(stop_base):
+    """Stops when the retry budget cannot pay for another attempt. Combine it
+    last, so the budget is only spent on retries that actually happen."""
+
+    def __init__(self, budget):
+        self.budget = budget
+
+    def __call__(self, retry_state):
+        return not self.budget.try_spend()
+
+
+class wait_retry_after(wait_base):
+    """Waits as long as the upstream Retry-After header asks, else `fallback`."""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def __call__(self, retry_state):
+        retry_after = retry_after_seconds(retry_state.outcome.exception())
+        return retry_after if retry_after is not None else self.fallback(retry_state)
+
+
+async def _attempt(model, prompt, deadline, options):
+    """One model call, holding a limiter slot and bounded by the deadline.
+
+    The deadline also reaches the backend through `current_model_call`, so a
+    timed-out or losing hedge attempt does not leave an SDK call running
+    past it, and the slot is held until that call has returned.
+    """
+    call = ModelCall(deadline)
+    token = current_model_call.set(call)
+    try:
+        async with model_slot(prompt, deadline, call):
+            started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(model.generate(prompt, **options),
+                                                  deadline - time.monotonic())
+            except Exception as e:
+                if _http_status(e) == 429:
+                    model_limiter.on_throttled(retry_after_seconds(e))
+                raise
+            finally:
+                MODEL_CALL_LATENCY.observe(time.perf_counter() - started)
+            model_limiter.on_success()
+            model_latency.add(time.perf_counter() - started)
+            return response
+    finally:
+        current_model_call.reset(token)
+
+
+async def _hedged_attempt(model, prompt, deadline, options):
+    """Runs an attempt. With hedging enabled, a slow attempt gets a duplicate
+    after the recent p95 latency, and whichever succeeds first wins."""
+    delay = None
+    if MODEL_HEDGE_ENABLED:
+        delay = model_latency.percentile(MODEL_HEDGE_PERCENTILE, MODEL_HEDGE_MIN_SAMPLES)
+    if delay is None:
+        return await _attempt(model, prompt, deadline, options)
+
+    primary = asyncio.ensure_future(_attempt(model, prompt, deadline, options))
+    tasks = {primary}
     try:
-        response = model.generate_content(f"{pdf_text}\n\nUser query: {query}")
-        return response.text
-    except requests.exceptions.Timeout:
+        done, _ = await asyncio.wait(tasks, timeout=min(delay, deadline - time.monotonic()))
+        if done or not retry_budget.try_spend():
+            return await primary
+        MODEL_HEDGES.inc()
+        logger.info("Hedging model call after %.3fs", delay)
+        tasks.add(asyncio.ensure_future(_attempt(model, prompt, deadline, options)))
+
+        first_error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            errors = [task.exception() for task in done]
+            for task, error in zip(done, errors):
+                if error is None:
+                    return task.result()
+            first_error = first_error or errors[0]
+        raise first_error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _generate(prompt, deadline=None, **options):
+    """Runs the prompt, retrying transient upstream errors with jittered
+    exponential backoff (or the upstream Retry-After) while the deadline and
+    the process-wide retry budget allow.
+
+    `deadline` is a time.monotonic() value; it defaults to
+    MODEL_REQUEST_DEADLINE seconds from now and also bounds each attempt.
+    """
+    model = get_model_client()
+    if deadline is None:
+        deadline = time.monotonic() + MODEL_REQUEST_DEADLINE
+    retry_budget.record_call()
+
+    retrying = AsyncRetrying(
+        stop=(stop_after_attempt(MODEL_RETRY_ATTEMPTS)
+              | stop_at_deadline(deadline)
+              | stop_when_budget_exhausted(retry_budget)),
+        wait=wait_retry_after(wait_random_exponential(multiplier=0.5, max=MODEL_RETRY_MAX_WAIT)),
+        retry=retry_if_exception(_is_transient),
+        before_sleep=lambda retry_state: MODEL_RETRIES.inc(),
+        reraise=True,
+    )
+    try:
+        async for attempt in retrying:
+            with attempt:
+                return await _hedged_attempt(model, prompt, deadline, options)
+    except HTTPException:
+        raise
+    except (asyncio.TimeoutError, requests.exceptions.Timeout):
         logger.error("Timeout occurred while connecting to the Gemini API.")
         raise HTTPException(
             status_code=504, detail="Gemini API request timed out."
@@ -34,19 +316,123 @@ def generate_response_from_model(pdf_text: str, query: str):
         raise HTTPException(
             status_code=502, detail="Error connecting to Gemini API."
         )
-    except requests.HTTPError as e:
-        if e.response.status_code == 429:
+    except Exception as e:
+        status = _http_status(e)
+        if status == 504:  # DeadlineExceeded or GatewayTimeout from the SDK
+            logger.error("Timeout occurred while connecting to the Gemini API.")
+            raise HTTPException(
+                status_code=504, detail="Gemini API request timed out."
+            )
+        if status == 429:
             logger.error("Rate limit exceeded on Gemini API.")
             raise HTTPException(
                 status_code=429, detail="Rate limit exceeded, please try again later."
             )
-        else:
-            logger.error(f"HTTP error: {str(e)}")
+        elif status is not None and status >= 500:
+            logger.error("Gemini API unavailable: %s", e)
             raise HTTPException(
-                status_code=500, detail="Internal server error while processing the request."
+                status_code=502, detail="Gemini API is unavailable."
             )
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        logger.error("Unexpected error: %s", e)
         raise HTTPException(
             status_code=500, detail="Internal server error while processing the request."
         )
+
+
+async def generate_response_from_model(pdf_text: str, query: str, deadline=None):
+    return await _generate(build_prompt(pdf_text, query), deadline)
+
+
+async def _gather_or_cancel(coroutines):
+    """Like asyncio.gather, but cancels the remaining calls once one fails."""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def _reduce(partial_answers, query, deadline):
+    """Combines map-step answers into one. When the answers do not fit in one
+    call they are combined in groups, and the group answers in turn."""
+    async def combine(group):
+        if len(group) == 1:
+            return group[0]
+        return await _generate(build_reduce_prompt(group, query), deadline)
+
+    relevant = [answer for answer in partial_answers
+                if answer.strip().rstrip(".").upper() != NO_ANSWER] or partial_answers
+    while len(relevant) > 1:
+        groups = group_by_budget(relevant, query)
+        if len(groups) == len(relevant):
+            # Every answer is too long to share a call; pair them so each round halves the count
+            groups = [relevant[i:i + 2] for i in range(0, len(relevant), 2)]
+        relevant = await _gather_or_cancel(combine(group) for group in groups)
+    return relevant[0]
+
+
+async def generate_planned_response(pdf_text: str, query: str, deadline=None):
+    """Answers from the whole text in one call when it fits in
+    CONTEXT_TOKEN_BUDGET. Larger texts are split into overlapping windows
+    that are asked in parallel (map), and their answers are combined (reduce).
+
+    Returns (response, plan). The plan holds the strategy, the window count
+    and the seconds spent in each stage.
+    """
+    started = time.perf_counter()
+    windows = plan_context(pdf_text, query)
+    timings = {"plan": time.perf_counter() - started}
+    plan = {"strategy": "direct" if len(windows) == 1 else "map_reduce",
+            "windows": len(windows), "timings": timings}
+
+    stage_started = time.perf_counter()
+    if len(windows) == 1:
+        response = await _generate(build_prompt(pdf_text, query), deadline)
+        timings["generate"] = time.perf_counter() - stage_started
+    else:
+        logger.info("Text exceeds the context budget; answering from %d windows", len(windows))
+        semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+
+        async def map_window(part, window):
+            async with semaphore:
+                return await _generate(build_map_prompt(window, query, part, len(windows)), deadline)
+
+        partial_answers = await _gather_or_cancel(
+            map_window(part, window) for part, window in enumerate(windows, 1))
+        timings["map"] = time.perf_counter() - stage_started
+        stage_started = time.perf_counter()
+        response = await _reduce(partial_answers, query, deadline)
+        timings["reduce"] = time.perf_counter() - stage_started
+
+    for stage, seconds in timings.items():
+        CHAT_STAGE_LATENCY.observe(seconds, stage=stage)
+    return response, plan
+
+
+async def generate_batch_response_from_model(pdf_text: str, queries, deadline=None):
+    """Answers several questions about the same text with one model call.
+
+    Returns one answer per query, in order. Raises ValueError when the model's
+    output is not a JSON array with exactly one string per query.
+    """
+    response = await _generate(build_batch_prompt(pdf_text, queries), deadline, json_output=True)
+    return parse_batch_response(response, len(queries))
+
+
+async def stream_response_from_model(pdf_text: str, query: str):
+    """Yields response text as Gemini produces it. Streams are not retried:
+    part of the answer may already have been sent to the client."""
+    model = get_model_client()
+    prompt = build_prompt(pdf_text, query)
+    async with model_slot(prompt):
+        try:
+            async with aclosing(model.stream(prompt)) as pieces:
+                async for piece in pieces:
+                    yield piece
+        except Exception as e:
+            if _http_status(e) == 429:
+                model_limiter.on_throttled(retry_after_seconds(e))
+            raise
+    model_limiter.on_success()
@@ -0,0 +1,237 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from config import SIMILARITY_THRESHOLD, SIMILARITY_DIMS, SIMILARITY_MAX_ENTRIES, SIMILARITY_MAX_BYTES
+
+WORD_PATTERN = re.compile(r"[^\W_]+")  # letters and digits in any script
+
+# Function words that do not change what is being asked. Negations such as
+# "not" and "no" are deliberately kept.
+STOPWORDS = frozenset("""
+a an the is are was were be been being am do does did of in on at to for from by with
+about into over under and or but if then so than that this these those it its it's
+i me my we our you your he she they them their what whats what's which who whom whose
+when where why how can could would should will shall may might must please tell explain
+describe give show s
+""".split())
+
+# Contracted negations fold to "not", so "isn't" and "is not" agree
+NEGATIONS = frozenset("""
+not cannot cant isnt arent wasnt werent dont doesnt didnt wont wouldnt shouldnt couldnt
+mustnt hasnt havent hadnt
+""".split())
+
+WORD_WEIGHT = 1.0
+TRIGRAM_WEIGHT = 0.5
+STEM_LENGTH = 6  # content words agree when their first letters do ("terminate"/"termination")
+
+
+def _singular(word):
+    # Just enough folding for "policies"/"policy" and "costs"/"cost"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_for_similarity(query: str):
+    """Lower-cases the query, drops punctuation and stopwords and folds plurals;
+    returns the remaining words."""
+    return [_singular(word) for word in WORD_PATTERN.findall(query.lower().replace("'", ""))
+            if word not in STOPWORDS]
+
+
+def key_terms(words):
+    """The terms two queries must share to be the same question: numbers kept
+    whole, negations, and a short stem of every other content word.
+
+    A changed year, name or negation barely moves the cosine score of a long
+    question, so a score above the threshold alone is not enough.
+    """
+    terms = set()
+    for word in words:
+        if any(char.isdigit() for char in word):
+            terms.add(word)
+        elif word in NEGATIONS:
+            terms.add("not")
+        else:
+            terms.add(word[:STEM_LENGTH])
+    return frozenset(terms)
+
+
+def embed_query(words, dims=SIMILARITY_DIMS):
+    """Hashes words and their character trigrams into an L2-normalized float32 vector."""
+    vector = np.zeros(dims, dtype=np.float32)
+    for word in words:
+        vector[zlib.crc32(word.encode()) % dims] += WORD_WEIGHT
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode()) % dims] += TRIGRAM_WEIGHT
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
+
+
+class _ScopeVectors:
+    """The queries of one scope in a preallocated float32 buffer.
+
+    Rows are filled in place; the buffer doubles while it is below
+    `max_entries` and then works as a ring, overwriting the oldest query.
+    Discarded rows are zeroed and reused.
+    """
+
+    INITIAL_ROWS = 16
+
+    def __init__(self, dims, max_entries):
+        self.max_entries = max_entries
+        self.vectors = np.zeros((min(self.INITIAL_ROWS, max_entries), dims), dtype=np.float32)
+        self.keys = [None] * len(self.vectors)
+        self.terms = [None] * len(self.vectors)
+        self.rows = OrderedDict()  # cache_key -> row, oldest first
+        self.free = []
+        self.used = 0  # rows ever filled; rows past this are still zero
+
+    def add(self, vector, cache_key, terms):
+        if self.free:
+            row = self.free.pop()
+        elif self.used < len(self.vectors):
+            row = self.used
+            self.used += 1
+        elif len(self.vectors) < self.max_entries:
+            self._grow()
+            row = self.used
+            self.used += 1
+        else:
+            _, row = self.rows.popitem(last=False)
+        self.vectors[row] = vector
+        self.keys[row] = cache_key
+        self.terms[row] = terms
+        self.rows[cache_key] = row
+
+    def _grow(self):
+        rows = min(2 * len(self.vectors), self.max_entries)
+        vectors = np.zeros((rows, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:len(self.vectors)] = self.vectors
+        self.keys += [None] * (rows - len(self.vectors))
+        self.terms += [None] * (rows - len(self.vectors))
+        self.vectors = vectors
+
+    def discard(self, cache_key):
+        row = self.rows.pop(cache_key, None)
+        if row is None:
+            return
+        self.vectors[row] = 0
+        self.keys[row] = None
+        self.terms[row] = None
+        self.free.append(row)
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes
+
+
+class SimilarityCache:
+    """Second cache tier: maps paraphrased queries onto exact cache keys.
+
+    Vectors are kept per (document, model) so only questions about the same
+    document are compared. A candidate above the threshold is only a hit when
+    it also has the same key terms (numbers, negations and content words), so
+    paraphrases differ in wording, order, filler and plurals, never in what
+    they ask about. Responses themselves stay in the exact cache, which keeps
+    owning eviction and expiry and tells this tier when an entry goes.
+
+    Each scope holds at most `max_entries` queries, and the vector buffers of
+    all scopes together at most `max_bytes`; past that the least recently
+    used scopes are dropped.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, dims=SIMILARITY_DIMS,
+                 max_entries=SIMILARITY_MAX_ENTRIES, max_bytes=SIMILARITY_MAX_BYTES):
+        self.threshold = threshold
+        self.dims = dims
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._documents = OrderedDict()  # scope -> _ScopeVectors, least recently used first
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def add(self, scope, query, cache_key):
+        words = normalize_for_similarity(query)
+        if not words:
+            return
+        vector = embed_query(words, self.dims)
+        with self._lock:
+            document = self._documents.get(scope)
+            if document is None:
+                document = self._documents[scope] = _ScopeVectors(self.dims, self.max_entries)
+                self.bytes_used += document.nbytes
+            self._documents.move_to_end(scope)
+            if cache_key in document.rows:
+                return
+            before = document.nbytes
+            document.add(vector, cache_key, key_terms(words))
+            self.bytes_used += document.nbytes - before
+            while self.bytes_used > self.max_bytes and len(self._documents) > 1:
+                oldest = next(iter(self._documents))
+                if oldest == scope:
+                    self._documents.move_to_end(oldest)
+                    oldest = next(iter(self._documents))
+                self.bytes_used -= self._documents.pop(oldest).nbytes
+                self.evictions += 1
+
+    def lookup(self, scope, query):
+        """Returns (cache_key, score) of the most similar earlier query with the
+        same key terms, or (None, best_score)."""
+        words = normalize_for_similarity(query)
+        with self._lock:
+            document = self._documents.get(scope)
+            if not words or document is None or not document.rows:
+                self.misses += 1
+                return None, 0.0
+            self._documents.move_to_end(scope)
+            scores = document.vectors[:document.used] @ embed_query(words, self.dims)
+            terms = key_terms(words)
+            for i in np.argsort(-scores):
+                if scores[i] < self.threshold:
+                    break
+                if document.terms[i] == terms:
+                    self.hits += 1
+                    return document.keys[i], float(scores[i])
+            self.misses += 1
+            return None, float(scores.max())
+
+    def discard(self, scope, cache_key):
+        with self._lock:
+            document = self._documents.get(scope)
+            if document is None:
+                return
+            document.discard(cache_key)
+            if not document.rows:
+                self.bytes_used -= self._documents.pop(scope).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self.bytes_used = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "documents": len(self._documents),
+                "entries": sum(len(doc.rows) for doc in self._documents.values()),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,52 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the coroutine in a task of its own;
+    every caller for that key, the first included, awaits the task through
+    `asyncio.shield`. A caller that is cancelled only stops waiting, and the
+    task is cancelled once no caller is left waiting for it.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> {"task": asyncio.Task, "waiters": int}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key, fn):
+        loop = asyncio.get_running_loop()
+        call = self._calls.get(key)
+        if call is not None and call["task"].get_loop() is loop:
+            self.coalesced += 1
+        else:
+            call = {"task": loop.create_task(fn()), "waiters": 0}
+            self._calls[key] = call
+            self.executions += 1
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+
+        task = call["task"]
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not task.done():
+                # Every caller gave up; later callers start a fresh execution
+                self._forget(key, call)
+                task.cancel()
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight(),
+            "executions": self.executions,
+            "coalesced": self.coalesced
+        }
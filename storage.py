@@ -0,0 +1,625 @@
+import sqlite3
+import sys
+from abc import ABC, abstractmethod
+import threading
+from array import array
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from config import (DOCUMENT_STORE, DOCUMENT_STORE_PATH, HOT_DOCUMENT_CACHE_SIZE,
+                    DOCUMENT_COMPRESSION_LEVEL, DOCUMENT_MEMORY_BUDGET)
+from logging_config import logger
+from retrieval import build_document_index
+
+
+def _blob_key(pdf_id, record):
+    # Uploads with the same content hash share one stored text
+    return record.get("content_hash") or f"doc:{pdf_id}"
+
+
+def _expires_at(record):
+    ttl = record.get("ttl")
+    return time.time() + ttl if ttl else None
+
+
+def compress_text(text, level=DOCUMENT_COMPRESSION_LEVEL):
+    return zlib.compress(text.encode("utf-8"), level)
+
+
+def decompress_text(data):
+    return zlib.decompress(data).decode("utf-8")
+
+
+def pack_page_offsets(page_offsets):
+    """Packs [0, end_1, ..., end_n] page boundaries as 4 bytes per page."""
+    return array("I", page_offsets).tobytes() if page_offsets else None
+
+
+def unpack_page_offsets(data):
+    if not data:
+        return None
+    offsets = array("I")
+    offsets.frombytes(data)
+    return offsets.tolist()
+
+
+def _entry_bytes(text, index):
+    # Heap size of the text (1 to 4 bytes per character) plus its retrieval
+    # index, which is several times larger than the text it indexes
+    return sys.getsizeof(text) + (index.memory_bytes() if index is not None else 0)
+
+
+class HotDocumentCache:
+    """LRU of decompressed document text (and retrieval index), keyed by blob key.
+
+    `bytes_used` is the approximate memory held by the text and the indexes.
+    """
+
+    def __init__(self, max_documents=HOT_DOCUMENT_CACHE_SIZE):
+        self.max_documents = max_documents
+        self._entries = OrderedDict()  # blob_key -> {"text": ..., "index": ..., "bytes": ...}
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+
+    def get(self, blob_key):
+        with self._lock:
+            entry = self._entries.get(blob_key)
+            if entry is not None:
+                self._entries.move_to_end(blob_key)
+            return entry
+
+    def peek(self, blob_key):
+        """Like `get`, without marking the entry as recently used."""
+        with self._lock:
+            return self._entries.get(blob_key)
+
+    def put(self, blob_key, text, index=None):
+        with self._lock:
+            entry = self._entries.get(blob_key)
+            if entry is None:
+                entry = {"text": text, "index": index, "bytes": _entry_bytes(text, index)}
+                self._entries[blob_key] = entry
+                self.bytes_used += entry["bytes"]
+            elif index is not None and index is not entry["index"]:
+                entry["index"] = index
+                size = _entry_bytes(entry["text"], index)
+                self.bytes_used += size - entry["bytes"]
+                entry["bytes"] = size
+            self._entries.move_to_end(blob_key)
+            while len(self._entries) > self.max_documents:
+                self._pop_oldest()
+            return entry
+
+    def _pop_oldest(self):
+        _, entry = self._entries.popitem(last=False)
+        self.bytes_used -= entry["bytes"]
+
+    def shrink(self, target_bytes):
+        """Drops least recently used entries until at most `target_bytes` remain."""
+        with self._lock:
+            while self._entries and self.bytes_used > target_bytes:
+                self._pop_oldest()
+
+    def discard(self, blob_key):
+        with self._lock:
+            entry = self._entries.pop(blob_key, None)
+            if entry is not None:
+                self.bytes_used -= entry["bytes"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DocumentStore(ABC):
+    """Storage backend for uploaded documents, used like a dict keyed by pdf_id.
+
+    Records are mappings with `filename`, `text`, `page_count`, optional
+    `content_hash`, `ttl` (seconds), `page_offsets` (page boundaries
+    [0, end_1, ..., end_n] into the text) and `normalizer` (the version of the
+    normalizer that produced the text), and the retrieval `index`. Stored
+    records also report the `text_length` without loading the text. Text is
+    stored zlib-compressed; recently used documents are kept decompressed in a
+    hot LRU, and the decompressed copies with their indexes plus any in-memory
+    compressed text are held under DOCUMENT_MEMORY_BUDGET.
+    """
+
+    def __init__(self, hot_size=HOT_DOCUMENT_CACHE_SIZE, memory_budget=DOCUMENT_MEMORY_BUDGET):
+        self.hot = HotDocumentCache(hot_size)
+        self.memory_budget = memory_budget
+        self.evictions = 0
+        self.expirations = 0
+        self._removal_listeners = []
+
+    def add_removal_listener(self, listener):
+        """Calls `listener(doc_key)` once the last document sharing a text is
+        removed (deleted, expired or evicted). `doc_key` is the content hash,
+        or the pdf_id of a document stored without one."""
+        self._removal_listeners.append(listener)
+
+    def _notify_removed(self, blob_key):
+        doc_key = blob_key[len("doc:"):] if blob_key.startswith("doc:") else blob_key
+        for listener in self._removal_listeners:
+            try:
+                listener(doc_key)
+            except Exception as e:
+                logger.error("Error in removal listener for %s: %s", doc_key, e)
+
+    @abstractmethod
+    def __getitem__(self, pdf_id):
+        """Returns the live record for `pdf_id`; raises KeyError if missing or expired."""
+
+    @abstractmethod
+    def __setitem__(self, pdf_id, record):
+        """Stores `record`, sharing the text blob of records with the same content hash."""
+
+    @abstractmethod
+    def __delitem__(self, pdf_id):
+        """Removes the document; raises KeyError if it is not stored."""
+
+    @abstractmethod
+    def __contains__(self, pdf_id):
+        """Whether `pdf_id` is stored and unexpired."""
+
+    @abstractmethod
+    def __len__(self):
+        """Returns the number of stored documents."""
+
+    def get(self, pdf_id, default=None):
+        try:
+            return self[pdf_id]
+        except KeyError:
+            return default
+
+    @abstractmethod
+    def find_by_hash(self, content_hash):
+        """Returns a stored record with this content hash, or None."""
+
+    @abstractmethod
+    def ids(self):
+        """Returns the pdf_ids of every live (unexpired) document."""
+
+    @abstractmethod
+    def clear(self):
+        """Removes every document and text blob."""
+
+    @abstractmethod
+    def stats(self):
+        """Returns storage statistics for /v1/storage/stats."""
+
+    @abstractmethod
+    def _read_blob(self, blob_key):
+        """Returns the compressed text for `blob_key`."""
+
+    @abstractmethod
+    def _read_page_offsets(self, blob_key):
+        """Returns the page offsets stored with `blob_key`, or None."""
+
+    def _load_blob(self, blob_key, with_index=False):
+        entry = self.hot.get(blob_key)
+        if entry is None:
+            entry = self.hot.put(blob_key, decompress_text(self._read_blob(blob_key)))
+            self._enforce_budget()
+        if with_index and entry["index"] is None:
+            index = build_document_index(entry["text"], self._read_page_offsets(blob_key))
+            entry = self.hot.put(blob_key, entry["text"], index)
+            self._enforce_budget()
+        return entry
+
+    def _peek_text(self, blob_key):
+        entry = self.hot.peek(blob_key)
+        return entry["text"] if entry is not None else decompress_text(self._read_blob(blob_key))
+
+    def _enforce_budget(self):
+        self.hot.shrink(max(0, self.memory_budget - self._resident_compressed_bytes()))
+
+    def _resident_compressed_bytes(self):
+        return 0
+
+
+class StoredDocument(Mapping):
+    """A document record whose text and index are only decompressed when accessed."""
+
+    def __init__(self, store, pdf_id, metadata):
+        self._store = store
+        self.pdf_id = pdf_id
+        self._metadata = metadata
+
+    def __getitem__(self, key):
+        if key == "text":
+            return self._store._load_blob(self._metadata["blob_key"])["text"]
+        if key == "index":
+            return self._store._load_blob(self._metadata["blob_key"], with_index=True)["index"]
+        if key == "page_offsets":
+            return self._store._read_page_offsets(self._metadata["blob_key"])
+        if key in ("blob_key", "expires_at") or key not in self._metadata:
+            raise KeyError(key)
+        return self._metadata[key]
+
+    def __iter__(self):
+        yield from ("filename", "text", "page_count", "content_hash", "page_offsets", "index",
+                    "text_length", "normalizer")
+
+    def read_text(self):
+        """Returns the text without making it recently used in the hot LRU (or
+        adding it there), for reads that sweep many documents."""
+        return self._store._peek_text(self._metadata["blob_key"])
+
+    def load(self, with_index=False):
+        """Returns the record as a plain dict with the text and page offsets
+        loaded, and the retrieval index too with `with_index` (None otherwise,
+        unless the hot copy already has it).
+
+        Decompressing the text and rebuilding an evicted index are blocking
+        work, so async routes call this through asyncio.to_thread.
+        """
+        entry = self._store._load_blob(self._metadata["blob_key"], with_index=with_index)
+        return {"filename": self._metadata["filename"], "page_count": self._metadata["page_count"],
+                "content_hash": self._metadata["content_hash"], "text": entry["text"],
+                "page_offsets": self["page_offsets"], "index": entry["index"]}
+
+    def __len__(self):
+        return 8
+
+
+class MemoryDocumentStore(DocumentStore):
+    """Process-local store; every uvicorn worker has its own copy.
+
+    When the compressed text plus the hot decompressed copies exceed the
+    memory budget, the least recently used documents are evicted.
+    """
+
+    def __init__(self, hot_size=HOT_DOCUMENT_CACHE_SIZE, memory_budget=DOCUMENT_MEMORY_BUDGET):
+        super().__init__(hot_size, memory_budget)
+        self._documents = OrderedDict()  # pdf_id -> metadata, least recently used first
+        # blob_key -> {"data": compressed bytes, "raw_bytes": int, "page_offsets": packed bytes,
+        #              "text_length": int, "normalizer": str, "refs": int}
+        self._blobs = {}
+        self._by_hash = {}  # content_hash -> pdf_id
+        self._lock = threading.RLock()
+        self.compressed_bytes = 0
+        self.raw_bytes = 0
+
+    def _live_metadata(self, pdf_id):
+        with self._lock:
+            metadata = self._documents.get(pdf_id)
+            if metadata is None:
+                return None
+            if metadata["expires_at"] is not None and metadata["expires_at"] <= time.time():
+                self._remove(pdf_id)
+                self.expirations += 1
+                return None
+            self._documents.move_to_end(pdf_id)
+            return metadata
+
+    def __getitem__(self, pdf_id):
+        metadata = self._live_metadata(pdf_id)
+        if metadata is None:
+            raise KeyError(pdf_id)
+        return StoredDocument(self, pdf_id, metadata)
+
+    def __setitem__(self, pdf_id, record):
+        blob_key = _blob_key(pdf_id, record)
+        with self._lock:
+            if pdf_id in self._documents:
+                self._remove(pdf_id)
+            blob = self._blobs.get(blob_key)
+            if blob is None:
+                data = compress_text(record["text"])
+                blob = {"data": data, "raw_bytes": len(record["text"].encode("utf-8")),
+                        "page_offsets": pack_page_offsets(record.get("page_offsets")),
+                        "text_length": len(record["text"]), "normalizer": record.get("normalizer"),
+                        "refs": 0}
+                self._blobs[blob_key] = blob
+                self.compressed_bytes += len(data)
+                self.raw_bytes += blob["raw_bytes"]
+            blob["refs"] += 1
+            self._documents[pdf_id] = {
+                "filename": record["filename"],
+                "page_count": record["page_count"],
+                "content_hash": record.get("content_hash"),
+                "text_length": blob["text_length"],
+                "normalizer": blob["normalizer"],
+                "blob_key": blob_key,
+                "expires_at": _expires_at(record)
+            }
+            if record.get("content_hash"):
+                self._by_hash.setdefault(record["content_hash"], pdf_id)
+            self.hot.put(blob_key, record["text"], record.get("index"))
+            self._sweep_expired()
+            self._enforce_budget(keep=pdf_id)
+
+    def _remove(self, pdf_id):
+        metadata = self._documents.pop(pdf_id)
+        content_hash = metadata["content_hash"]
+        if self._by_hash.get(content_hash) == pdf_id:
+            del self._by_hash[content_hash]
+            for other_id, other in self._documents.items():
+                if other["content_hash"] == content_hash:
+                    self._by_hash[content_hash] = other_id
+                    break
+        blob = self._blobs[metadata["blob_key"]]
+        blob["refs"] -= 1
+        if blob["refs"] == 0:
+            del self._blobs[metadata["blob_key"]]
+            self._notify_removed(metadata["blob_key"])
+            self.compressed_bytes -= len(blob["data"])
+            self.raw_bytes -= blob["raw_bytes"]
+            self.hot.discard(metadata["blob_key"])
+
+    def __delitem__(self, pdf_id):
+        with self._lock:
+            if pdf_id not in self._documents:
+                raise KeyError(pdf_id)
+            self._remove(pdf_id)
+
+    def __contains__(self, pdf_id):
+        return self._live_metadata(pdf_id) is not None
+
+    def __len__(self):
+        return len(self._documents)
+
+    def find_by_hash(self, content_hash):
+        pdf_id = self._by_hash.get(content_hash)
+        return self.get(pdf_id) if pdf_id is not None else None
+
+    def ids(self):
+        with self._lock:
+            self._sweep_expired()
+            return list(self._documents)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self._blobs.clear()
+            self._by_hash.clear()
+            self.hot.clear()
+            self.compressed_bytes = 0
+            self.raw_bytes = 0
+
+    def _read_blob(self, blob_key):
+        blob = self._blobs.get(blob_key)
+        if blob is None:
+            raise KeyError(blob_key)
+        return blob["data"]
+
+    def _read_page_offsets(self, blob_key):
+        blob = self._blobs.get(blob_key)
+        return unpack_page_offsets(blob["page_offsets"]) if blob is not None else None
+
+    def _resident_compressed_bytes(self):
+        return self.compressed_bytes
+
+    def _sweep_expired(self):
+        now = time.time()
+        expired = [pdf_id for pdf_id, metadata in self._documents.items()
+                   if metadata["expires_at"] is not None and metadata["expires_at"] <= now]
+        for pdf_id in expired:
+            self._remove(pdf_id)
+        self.expirations += len(expired)
+
+    def _enforce_budget(self, keep=None):
+        with self._lock:
+            super()._enforce_budget()
+            # Hot copies are gone; evict cold documents until the compressed text fits
+            while self.compressed_bytes > self.memory_budget and len(self._documents) > 1:
+                pdf_id = next(iter(self._documents))
+                if pdf_id == keep:
+                    self._documents.move_to_end(pdf_id)
+                    pdf_id = next(iter(self._documents))
+                logger.warning("Memory budget exceeded, evicting PDF ID: %s", pdf_id)
+                self._remove(pdf_id)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "documents": len(self._documents),
+                "raw_bytes": self.raw_bytes,
+                "compressed_bytes": self.compressed_bytes,
+                "compression_ratio": (self.raw_bytes / self.compressed_bytes)
+                if self.compressed_bytes else 0.0,
+                "hot_documents": len(self.hot),
+                "hot_bytes": self.hot.bytes_used,
+                "bytes_used": self.compressed_bytes + self.hot.bytes_used,
+                "memory_budget": self.memory_budget,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+class SQLiteDocumentStore(DocumentStore):
+    """Document store shared by every worker on the host through one SQLite file.
+
+    The database runs in WAL mode so readers in other workers never block on a
+    writer. Lookups only read the small metadata row; compressed text is read
+    from disk the first time it is needed and kept decompressed in the hot
+    LRU, alongside its retrieval index. Over the memory budget, hot copies are
+    dropped (the text stays on disk). Reads skip expired documents; the next
+    write deletes them, so a read never waits on the write lock.
+
+    Every call can touch the disk: async routes call the store through
+    asyncio.to_thread.
+    """
+
+    def __init__(self, path=DOCUMENT_STORE_PATH, hot_size=HOT_DOCUMENT_CACHE_SIZE,
+                 memory_budget=DOCUMENT_MEMORY_BUDGET):
+        super().__init__(hot_size, memory_budget)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    pdf_id TEXT PRIMARY KEY,
+                    filename TEXT,
+                    page_count INTEGER,
+                    content_hash TEXT,
+                    blob_key TEXT NOT NULL,
+                    created_at REAL,
+                    expires_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash);
+                CREATE TABLE IF NOT EXISTS blobs (
+                    blob_key TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    raw_bytes INTEGER NOT NULL,
+                    page_offsets BLOB,
+                    text_length INTEGER,
+                    normalizer TEXT
+                );
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(blobs)")}
+            # Databases created before these were stored; old rows keep NULLs
+            for column, column_type in (("page_offsets", "BLOB"), ("text_length", "INTEGER"),
+                                        ("normalizer", "TEXT")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE blobs ADD COLUMN {column} {column_type}")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _metadata(self, pdf_id):
+        row = self._connection().execute(
+            "SELECT filename, page_count, content_hash, blob_key, expires_at, "
+            "text_length, normalizer FROM documents LEFT JOIN blobs USING (blob_key) "
+            "WHERE pdf_id = ?", (pdf_id,)).fetchone()
+        if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+            # Expired rows are deleted by the next write, never on the read path
+            return None
+        return dict(row)
+
+    def _read_blob(self, blob_key):
+        row = self._connection().execute(
+            "SELECT data FROM blobs WHERE blob_key = ?", (blob_key,)).fetchone()
+        if row is None:
+            raise KeyError(blob_key)
+        return row["data"]
+
+    def _read_page_offsets(self, blob_key):
+        row = self._connection().execute(
+            "SELECT page_offsets FROM blobs WHERE blob_key = ?", (blob_key,)).fetchone()
+        return unpack_page_offsets(row["page_offsets"]) if row is not None else None
+
+    def __getitem__(self, pdf_id):
+        metadata = self._metadata(pdf_id)
+        if metadata is None:
+            raise KeyError(pdf_id)
+        return StoredDocument(self, pdf_id, metadata)
+
+    def __setitem__(self, pdf_id, record):
+        blob_key = _blob_key(pdf_id, record)
+        conn = self._connection()
+        with conn:
+            if conn.execute("SELECT 1 FROM blobs WHERE blob_key = ?", (blob_key,)).fetchone() is None:
+                conn.execute("INSERT OR IGNORE INTO blobs "
+                             "(blob_key, data, raw_bytes, page_offsets, text_length, normalizer) "
+                             "VALUES (?, ?, ?, ?, ?, ?)",
+                             (blob_key, compress_text(record["text"]),
+                              len(record["text"].encode("utf-8")),
+                              pack_page_offsets(record.get("page_offsets")),
+                              len(record["text"]), record.get("normalizer")))
+            conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(pdf_id, filename, page_count, content_hash, blob_key, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (pdf_id, record["filename"], record["page_count"],
+                 record.get("content_hash"), blob_key, time.time(), _expires_at(record)))
+            self.expirations += conn.execute(
+                "DELETE FROM documents WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)).rowcount
+            orphans = [row["blob_key"] for row in conn.execute(
+                "SELECT blob_key FROM blobs WHERE blob_key NOT IN (SELECT blob_key FROM documents)")]
+            conn.executemany("DELETE FROM blobs WHERE blob_key = ?", [(key,) for key in orphans])
+        for orphan in orphans:
+            self.hot.discard(orphan)
+            self._notify_removed(orphan)
+        self.hot.put(blob_key, record["text"], record.get("index"))
+        self._enforce_budget()
+
+    def _delete(self, pdf_id, blob_key):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM documents WHERE pdf_id = ?", (pdf_id,))
+            removed = conn.execute(
+                "DELETE FROM blobs WHERE blob_key = ? AND NOT EXISTS "
+                "(SELECT 1 FROM documents WHERE blob_key = ?)",
+                (blob_key, blob_key)).rowcount
+        self.hot.discard(blob_key)
+        if removed:
+            self._notify_removed(blob_key)
+
+    def __delitem__(self, pdf_id):
+        metadata = self._metadata(pdf_id)
+        if metadata is None:
+            raise KeyError(pdf_id)
+        self._delete(pdf_id, metadata["blob_key"])
+
+    def __contains__(self, pdf_id):
+        return self._metadata(pdf_id) is not None
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM documents WHERE expires_at IS NULL OR expires_at > ?",
+            (time.time(),)).fetchone()[0]
+
+    def find_by_hash(self, content_hash):
+        row = self._connection().execute(
+            "SELECT pdf_id FROM documents WHERE content_hash = ? "
+            "AND (expires_at IS NULL OR expires_at > ?) LIMIT 1",
+            (content_hash, time.time())).fetchone()
+        return self.get(row["pdf_id"]) if row is not None else None
+
+    def ids(self):
+        rows = self._connection().execute(
+            "SELECT pdf_id FROM documents WHERE expires_at IS NULL OR expires_at > ?",
+            (time.time(),)).fetchall()
+        return [row["pdf_id"] for row in rows]
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM documents")
+            conn.execute("DELETE FROM blobs")
+        self.hot.clear()
+
+    def stats(self):
+        row = self._connection().execute(
+            "SELECT COUNT(*) AS blobs, COALESCE(SUM(LENGTH(data)), 0) AS compressed_bytes, "
+            "COALESCE(SUM(raw_bytes), 0) AS raw_bytes FROM blobs").fetchone()
+        return {
+            "backend": "sqlite",
+            "documents": len(self),
+            "raw_bytes": row["raw_bytes"],
+            "compressed_bytes": row["compressed_bytes"],
+            "compression_ratio": (row["raw_bytes"] / row["compressed_bytes"])
+            if row["compressed_bytes"] else 0.0,
+            "hot_documents": len(self.hot),
+            "hot_bytes": self.hot.bytes_used,
+            "bytes_used": self.hot.bytes_used,
+            "memory_budget": self.memory_budget,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+def create_document_store(backend=DOCUMENT_STORE):
+    if backend == "memory":
+        return MemoryDocumentStore()
+    if backend == "sqlite":
+        logger.info("Using SQLite document store at %s", DOCUMENT_STORE_PATH)
+        return SQLiteDocumentStore()
+    raise ValueError(f"Unknown document store backend: {backend}")
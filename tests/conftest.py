@@ -0,0 +1,12 @@
+import os
+import shutil
+import tempfile
+
+# Set before config is imported, so uploads indexed by any test land in a
+# throwaway directory instead of ./corpus_index
+CORPUS_INDEX_DIRECTORY = tempfile.mkdtemp(prefix="pdfchat-corpus-")
+os.environ["CORPUS_INDEX_PATH"] = CORPUS_INDEX_DIRECTORY
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(CORPUS_INDEX_DIRECTORY, ignore_errors=True)
@@ -0,0 +1,133 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from main import app
+from model_client import StubBackend
+from pdf_routes import pdf_storage
+from cache import cache_response, response_cache, similarity_cache
+from retrieval import build_document_index
+from retry_logic import parse_batch_response
+
+client = TestClient(app)
+
+
+class CountingStub(StubBackend):
+    """Stub model that records its calls and can fail chosen questions."""
+
+    def __init__(self, fail_on=None, malformed=False):
+        super().__init__("batch-test", latency=0)
+        self.calls = []
+        self.fail_on = fail_on
+        self.malformed = malformed
+
+    async def generate(self, prompt, json_output=False):
+        self.calls.append((prompt, json_output))
+        if self.fail_on and self.fail_on in prompt:
+            raise ValueError("model exploded")
+        if json_output and self.malformed:
+            return "not json"
+        return await super().generate(prompt, json_output)
+
+
+class TestBatchChat(unittest.TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        similarity_cache.clear()
+        self.pdf_id = "batch_pdf_id"
+        text = " ".join(f"Section {i} covers topic number {i} in detail." for i in range(300))
+        pdf_storage[self.pdf_id] = {
+            "filename": "batch.pdf",
+            "text": text,
+            "page_count": 1,
+            "index": build_document_index(text)
+        }
+
+    def post_batch(self, queries, mode="fanout", model=None):
+        model = model or CountingStub()
+        with patch("retry_logic.get_model_client", return_value=model):
+            response = client.post(f"/v1/chat/{self.pdf_id}/batch", json={"queries": queries, "mode": mode})
+        return response, model
+
+    def test_fanout_returns_results_in_order(self):
+        cache_response("What is cached already?", "From the cache.", self.pdf_id)
+        queries = [{"query": "What does section 3 cover?"},
+                   {"query": "   "},
+                   {"query": "What is cached already?"},
+                   {"query": "What does section 7 cover?"}]
+
+        response, model = self.post_batch(queries)
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["query"] for result in results], [q["query"] for q in queries])
+        self.assertIn("section 3", results[0]["response"])
+        self.assertEqual(results[1]["error"]["status_code"], 400)
+        self.assertEqual(results[2], {"query": "What is cached already?", "response": "From the cache.",
+                                      "chunk_ids": None, "pages": None, "cached": True})
+        self.assertIn("section 7", results[3]["response"])
+        self.assertEqual(len(model.calls), 2)
+
+    def test_repeated_questions_share_one_call(self):
+        queries = [{"query": "Which topic is in section 9?"}] * 3
+        response, model = self.post_batch(queries)
+
+        results = response.json()["results"]
+        self.assertEqual(len({result["response"] for result in results}), 1)
+        self.assertEqual(len(model.calls), 1)
+
+    def test_packed_mode_shares_model_calls(self):
+        queries = [{"query": f"What does section {i} cover?", "full_context": True} for i in range(5)]
+        response, model = self.post_batch(queries, mode="packed")
+
+        results = response.json()["results"]
+        self.assertEqual(len(model.calls), 1)
+        self.assertTrue(model.calls[0][1])
+        for i, result in enumerate(results):
+            self.assertIn(f"section {i} cover", result["response"])
+
+    def test_packed_retrieval_questions_respect_the_pack_size(self):
+        queries = [{"query": f"What does section {i} cover?"} for i in range(5)]
+        with patch("pdf_routes.BATCH_PACK_SIZE", 2):
+            response, model = self.post_batch(queries, mode="packed")
+
+        self.assertEqual(len(model.calls), 3)
+        results = response.json()["results"]
+        self.assertTrue(all(result["chunk_ids"] for result in results))
+
+    def test_malformed_packed_answer_falls_back_to_single_calls(self):
+        queries = [{"query": f"Where is topic {i}?", "full_context": True} for i in range(3)]
+        response, model = self.post_batch(queries, mode="packed", model=CountingStub(malformed=True))
+
+        results = response.json()["results"]
+        self.assertEqual(len(model.calls), 4)  # one packed attempt, then one call per question
+        self.assertTrue(all("response" in result for result in results))
+
+    def test_failed_item_does_not_fail_the_batch(self):
+        queries = [{"query": "Which section is first?"}, {"query": "Please explode now"}]
+        response, _ = self.post_batch(queries, model=CountingStub(fail_on="explode"))
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertIn("response", results[0])
+        self.assertEqual(results[1]["error"]["status_code"], 500)
+
+    def test_invalid_batches(self):
+        self.assertEqual(self.post_batch([])[0].status_code, 400)
+        with patch("pdf_routes.BATCH_MAX_QUERIES", 2):
+            self.assertEqual(self.post_batch([{"query": "q?"}] * 3)[0].status_code, 400)
+        response = client.post("/v1/chat/missing_pdf/batch", json={"queries": [{"query": "q?"}]})
+        self.assertEqual(response.status_code, 404)
+
+    def test_parse_batch_response(self):
+        self.assertEqual(parse_batch_response('```json\n["a", "b"]\n```', 2), ["a", "b"])
+        with self.assertRaises(ValueError):
+            parse_batch_response('["only one"]', 2)
+        with self.assertRaises(ValueError):
+            parse_batch_response("no json here", 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from cache import (ResponseCache, make_cache_key, get_cached_response, cache_response,
+                   response_cache, similarity_cache)
+from similarity_cache import SimilarityCache, normalize_for_similarity
+from main import app
+from config import GEMINI_MODEL
+
+client = TestClient(app)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_key_includes_document_and_model(self):
+        cache_response("What is this?", "Answer for A", "doc-a")
+
+        self.assertEqual(get_cached_response("what is  THIS?", "doc-a"), "Answer for A")
+        self.assertIsNone(get_cached_response("What is this?", "doc-b"))
+        self.assertIsNone(get_cached_response("What is this?", "doc-a", model_name="other-model"))
+
+    def test_lru_eviction_under_byte_budget(self):
+        cache = ResponseCache(max_bytes=2000, ttl=60)
+        keys = [make_cache_key(f"query {i}", "doc", "model") for i in range(3)]
+        cache.set(keys[0], "a" * 400)
+        cache.set(keys[1], "b" * 400)
+        cache.get(keys[0])  # keys[1] is now least recently used
+        cache.set(keys[2], "c" * 400)
+
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(cache.evictions, 1)
+        self.assertLessEqual(cache.bytes_used, 2000)
+
+    def test_oversized_response_is_not_cached(self):
+        cache = ResponseCache(max_bytes=100, ttl=60)
+        key = make_cache_key("query", "doc", "model")
+        cache.set(key, "x" * 1000)
+
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.bytes_used, 0)
+
+    def test_ttl_expiry_and_sweep(self):
+        cache = ResponseCache(max_bytes=10000, ttl=300)
+        key = make_cache_key("query", "doc", "model")
+        cache.set(key, "response")
+
+        with patch("cache.time.time", return_value=10 ** 12):
+            self.assertEqual(cache.sweep(), 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual(cache.bytes_used, 0)
+
+    def test_stats_endpoint(self):
+        response = client.get("/v1/cache/stats")
+
+        self.assertEqual(response.status_code, 200)
+        for field in ("hits", "misses", "evictions", "bytes_used", "entries"):
+            self.assertIn(field, response.json())
+
+
+class TestSimilarityCache(unittest.TestCase):
+
+    def test_normalization_drops_case_punctuation_and_stopwords(self):
+        self.assertEqual(normalize_for_similarity("What's the Refund policy?"),
+                         ["refund", "policy"])
+
+    def test_paraphrase_served_from_cache(self):
+        cache_response("What's the refund policy?", "30 days.", "doc-refunds")
+
+        self.assertEqual(get_cached_response("refund policy?", "doc-refunds"), "30 days.")
+        self.assertEqual(get_cached_response("Tell me about the refund policies",
+                                             "doc-refunds"), "30 days.")
+        self.assertIsNone(get_cached_response("refund policy?", "doc-other"))
+        self.assertIsNone(get_cached_response("Who signed the contract?", "doc-refunds"))
+
+    def test_threshold_and_scores(self):
+        cache = SimilarityCache(threshold=0.99, dims=256)
+        cache.add(("doc", "model"), "shipping cost to Canada", "key-1")
+
+        key, score = cache.lookup(("doc", "model"), "shipping fees Canada")
+        self.assertIsNone(key)
+        self.assertGreater(score, 0.5)
+
+        key, score = cache.lookup(("doc", "model"), "What is the shipping cost to Canada?")
+        self.assertEqual(key, "key-1")
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_near_misses_are_not_hits(self):
+        cache = SimilarityCache(threshold=0.85, dims=1024)
+        cache.add(("doc", "model"), "What was the revenue of the European division in fiscal year 2019?", "revenue")
+        cache.add(("doc", "model"), "Is the tenant allowed to sublet the apartment without written consent?", "sublet")
+
+        for query in ("What was the revenue of the European division in fiscal year 2020?",
+                      "What was the revenue of the Asian division in fiscal year 2019?",
+                      "Is the tenant not allowed to sublet the apartment without written consent?",
+                      "Isn't the tenant allowed to sublet the apartment without written consent?",
+                      "Is the landlord allowed to sublet the apartment without written consent?"):
+            self.assertIsNone(cache.lookup(("doc", "model"), query)[0], query)
+
+        # Rewording, order and plurals still match
+        self.assertEqual(cache.lookup(("doc", "model"),
+                                      "In fiscal year 2019, what was the European division's revenue?")[0],
+                         "revenue")
+
+    def test_discard(self):
+        cache = SimilarityCache(threshold=0.5, dims=256)
+        cache.add(("doc", "model"), "warranty length", "key-1")
+        cache.discard(("doc", "model"), "key-1")
+
+        self.assertIsNone(cache.lookup(("doc", "model"), "warranty length")[0])
+        self.assertEqual(cache.stats()["documents"], 0)
+
+    def test_full_scope_overwrites_its_oldest_query(self):
+        cache = SimilarityCache(threshold=0.9, dims=256, max_entries=20)
+        for i in range(25):
+            cache.add(("doc", "model"), f"clause {i} of the lease", f"key-{i}")
+
+        self.assertEqual(cache.stats()["entries"], 20)
+        self.assertIsNone(cache.lookup(("doc", "model"), "clause 4 of the lease")[0])
+        self.assertEqual(cache.lookup(("doc", "model"), "clause 5 of the lease")[0], "key-5")
+        self.assertEqual(cache.lookup(("doc", "model"), "clause 24 of the lease")[0], "key-24")
+
+    def test_least_recently_used_scopes_are_dropped_over_the_byte_cap(self):
+        # Each scope starts with a 16 x 256 float32 buffer (16 KB)
+        cache = SimilarityCache(threshold=0.9, dims=256, max_bytes=40 * 1024)
+        cache.add(("doc-a", "model"), "warranty length", "key-a")
+        cache.add(("doc-b", "model"), "warranty length", "key-b")
+        cache.lookup(("doc-a", "model"), "warranty length")  # doc-b is now least recently used
+        cache.add(("doc-c", "model"), "warranty length", "key-c")
+
+        self.assertEqual(cache.lookup(("doc-a", "model"), "warranty length")[0], "key-a")
+        self.assertIsNone(cache.lookup(("doc-b", "model"), "warranty length")[0])
+        self.assertEqual(cache.lookup(("doc-c", "model"), "warranty length")[0], "key-c")
+        self.assertLessEqual(cache.stats()["bytes_used"], 40 * 1024)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expired_exact_entries_leave_the_similarity_tier(self):
+        scope = ("doc-expiring", GEMINI_MODEL)
+        cache_response("How long is the warranty?", "Two years.", "doc-expiring")
+        self.assertIsNotNone(similarity_cache.lookup(scope, "how long is the warranty")[0])
+
+        with patch("cache.time.time", return_value=10 ** 12):
+            response_cache.sweep()
+
+        self.assertIsNone(similarity_cache.lookup(scope, "how long is the warranty")[0])
+        self.assertNotIn(scope, similarity_cache._documents)
+
+
+if __name__ == '__main__':
+    unittest.main()
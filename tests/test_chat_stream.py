@@ -0,0 +1,87 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from fastapi.testclient import TestClient
+
+from main import app
+from models import ChatRequest
+from pdf_routes import pdf_storage, chat_with_pdf_stream
+from cache import get_cached_response
+
+client = TestClient(app)
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestChatStream(unittest.TestCase):
+
+    def setUp(self):
+        self.pdf_id = "stream_pdf_id"
+        pdf_storage[self.pdf_id] = {
+            "filename": "test.pdf",
+            "text": "Sample PDF text.",
+            "page_count": 1
+        }
+
+    @patch("model_client.MODEL_BACKEND", "stub")
+    def test_stream_emits_tokens_and_caches_result(self):
+        query = "What does the streamed answer say?"
+        response = client.post(f"/v1/chat/{self.pdf_id}/stream", json={"query": query})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+
+        events = parse_events(response.text)
+        self.assertEqual(events[0][0], "meta")
+        tokens = [data["text"] for event, data in events if event == "token"]
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual(events[-1][0], "done")
+        self.assertEqual(events[-1][1]["response"], "".join(tokens))
+        self.assertEqual(get_cached_response(query, self.pdf_id), "".join(tokens))
+
+    def test_stream_pdf_not_found(self):
+        response = client.post("/v1/chat/missing_pdf/stream", json={"query": "Anything?"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_disconnect_cancels_upstream(self):
+        closed = []
+
+        async def fake_stream(pdf_text, query):
+            try:
+                for piece in ["one", " two", " three"]:
+                    yield piece
+            finally:
+                closed.append(True)
+
+        http_request = MagicMock()
+        disconnects = iter([False, True, True])
+
+        async def is_disconnected():
+            return next(disconnects)
+
+        http_request.is_disconnected = is_disconnected
+        query = "Will this disconnected answer be cached?"
+
+        async def consume():
+            response = await chat_with_pdf_stream(
+                self.pdf_id, ChatRequest(query=query, full_context=True), http_request)
+            return [chunk async for chunk in response.body_iterator]
+
+        with patch("pdf_routes.stream_response_from_model", fake_stream):
+            chunks = asyncio.run(consume())
+
+        self.assertEqual(closed, [True])
+        self.assertNotIn("done", "".join(chunks))
+        self.assertIsNone(get_cached_response(query, f"{self.pdf_id}:full"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from main import app
+from model_client import StubBackend
+from cache import response_cache, similarity_cache
+from context_planner import fits_context, split_windows, plan_context, group_by_budget
+from pdf_routes import pdf_storage
+from retrieval import estimate_tokens
+from retry_logic import generate_planned_response, NO_ANSWER
+
+client = TestClient(app)
+
+DOCUMENT = " ".join(f"Paragraph {i} says the value of item {i} is {i * 7}." for i in range(400))
+
+
+def small_budget(budget):
+    return (patch("retry_logic.plan_context", lambda text, query: plan_context(text, query, budget)),
+            patch("retry_logic.group_by_budget", lambda texts, query: group_by_budget(texts, query, budget)))
+
+
+class MapReduceStub(StubBackend):
+    """Answers map prompts that mention items 42 or 350, and NONE for the rest."""
+
+    def __init__(self):
+        super().__init__("map-reduce-test", latency=0)
+        self.prompts = []
+
+    async def generate(self, prompt, json_output=False):
+        self.prompts.append(prompt)
+        if prompt.startswith("The text below is part"):
+            found = [f"Item {i} is {i * 7}." for i in (42, 350) if f"item {i} is" in prompt]
+            return " ".join(found) or NO_ANSWER
+        return await super().generate(prompt, json_output)
+
+
+class TestContextPlanner(unittest.TestCase):
+
+    def test_token_estimate_counts_non_ascii_text_finer(self):
+        self.assertEqual(estimate_tokens("a" * 400), 100)
+        self.assertGreater(estimate_tokens("文" * 400), 300)
+
+    def test_windows_overlap_and_cover_the_text(self):
+        windows = split_windows(DOCUMENT, window_tokens=200, overlap_tokens=20)
+
+        self.assertGreater(len(windows), 1)
+        self.assertTrue(all(estimate_tokens(window) <= 200 for window in windows))
+        self.assertTrue(DOCUMENT.startswith(windows[0]))
+        self.assertTrue(DOCUMENT.endswith(windows[-1]))
+        for previous, window in zip(windows, windows[1:]):
+            first_word = window.split()[0]
+            self.assertIn(window[:40], previous)  # starts inside the previous window
+            self.assertTrue(previous.endswith(first_word) or f" {first_word} " in previous)
+        self.assertEqual(set(DOCUMENT.split()), set(" ".join(windows).split()))
+
+    def test_small_text_is_one_window(self):
+        self.assertTrue(fits_context("Short text.", "Question?"))
+        self.assertEqual(plan_context("Short text.", "Question?"), ["Short text."])
+        self.assertGreater(len(plan_context(DOCUMENT, "Question?", budget=1000)), 1)
+
+    def test_groups_fit_the_budget(self):
+        groups = group_by_budget(["a" * 400] * 5, "q", budget=450)
+        self.assertEqual([len(group) for group in groups], [2, 2, 1])
+
+
+class TestMapReduce(unittest.TestCase):
+
+    def test_direct_answer_when_the_text_fits(self):
+        model = MapReduceStub()
+        with patch("retry_logic.get_model_client", return_value=model):
+            response, plan = asyncio.run(generate_planned_response("Short text.", "Question?"))
+
+        self.assertEqual(plan["strategy"], "direct")
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn("generate", plan["timings"])
+
+    def test_large_text_is_mapped_and_reduced(self):
+        model = MapReduceStub()
+        plan_patch, group_patch = small_budget(1500)
+        with plan_patch, group_patch, patch("retry_logic.get_model_client", return_value=model):
+            response, plan = asyncio.run(generate_planned_response(DOCUMENT, "What are items 42 and 350?"))
+
+        self.assertEqual(plan["strategy"], "map_reduce")
+        self.assertEqual(len(model.prompts), plan["windows"] + 1)
+        reduce_prompt = model.prompts[-1]
+        self.assertIn("Item 42 is 294.", reduce_prompt)
+        self.assertIn("Item 350 is 2450.", reduce_prompt)
+        self.assertNotIn(f"\n{NO_ANSWER}\n", reduce_prompt)
+        self.assertEqual(set(plan["timings"]), {"plan", "map", "reduce"})
+
+    def test_chat_response_includes_stage_timings(self):
+        response_cache.clear()
+        similarity_cache.clear()
+        pdf_storage["map_reduce_pdf"] = {"filename": "big.pdf", "text": DOCUMENT, "page_count": 1}
+        plan_patch, group_patch = small_budget(1500)
+        with plan_patch, group_patch, patch("retry_logic.get_model_client", return_value=MapReduceStub()):
+            response = client.post("/v1/chat/map_reduce_pdf",
+                                   json={"query": "What is item 42?", "full_context": True})
+
+        self.assertEqual(response.status_code, 200)
+        metadata = response.json()["metadata"]
+        self.assertEqual(metadata["strategy"], "map_reduce")
+        self.assertEqual(set(metadata["timings"]), {"retrieve", "plan", "map", "reduce", "total"})
+
+
+if __name__ == "__main__":
+    unittest.main()
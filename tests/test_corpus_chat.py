@@ -0,0 +1,226 @@
+import io
+import shutil
+import tempfile
+import unittest
+import uuid
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from reportlab.pdfgen import canvas
+
+import pdf_routes
+from main import app
+from model_client import StubBackend
+from cache import response_cache, similarity_cache
+from corpus_index import CorpusIndex, iter_passages, text_fingerprint
+from storage import MemoryDocumentStore
+
+client = TestClient(app)
+
+
+class RecordingStub(StubBackend):
+
+    def __init__(self):
+        super().__init__("corpus-test", latency=0)
+        self.prompts = []
+
+    async def generate(self, prompt, json_output=False):
+        self.prompts.append(prompt)
+        return await super().generate(prompt, json_output)
+
+
+class TestCorpusIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_passages_stay_within_pages(self):
+        pages = ["alpha beta gamma delta", "epsilon zeta eta"]
+        text = "\n".join(pages)
+        offsets = [0, len(pages[0]) + 1, len(text)]
+
+        passages = list(iter_passages(text, offsets, size=3, overlap=1))
+
+        self.assertEqual([page for page, _, _ in passages], [1, 1, 2])
+        self.assertEqual(text[passages[0][1]:passages[0][2]], "alpha beta gamma")
+        self.assertEqual(text[passages[1][1]:passages[1][2]], "gamma delta")
+        self.assertEqual(text[passages[2][1]:passages[2][2]], "epsilon zeta eta")
+        self.assertEqual(list(iter_passages(text))[0][0], None)
+
+    def test_search_ranks_across_documents(self):
+        index = CorpusIndex(self.directory, dims=512)
+        index.add_document("solar", "Solar panels convert sunlight into electricity. " * 5)
+        index.add_document("bread", "Sourdough bread needs flour, water and a starter. " * 5)
+
+        results = index.search("How do solar panels make electricity?", ["solar", "bread"], top_k=3)
+
+        self.assertEqual(results[0][0], "solar")
+        self.assertNotIn("bread", [doc_key for doc_key, *_ in results])
+        self.assertEqual(index.search("sourdough", ["solar"], top_k=3), [])
+
+    def test_add_is_idempotent_and_shared_between_instances(self):
+        index = CorpusIndex(self.directory, dims=256)
+        self.assertGreater(index.add_document("doc", "some words to index here"), 0)
+        self.assertEqual(index.add_document("doc", "some words to index here"), 0)
+
+        other = CorpusIndex(self.directory, dims=256)
+        self.assertTrue(other.has_document("doc"))
+        self.assertEqual(other.stats()["documents"], 1)
+        self.assertEqual(other.search("index", ["doc"], top_k=1)[0][0], "doc")
+
+    def test_entry_from_other_text_is_replaced(self):
+        index = CorpusIndex(self.directory, dims=256)
+        old_text = "Tides follow the moon around the earth."
+        new_text = "Tides  follow the moon around the earth."  # extracted again, offsets shift
+        index.add_document("doc", old_text)
+
+        self.assertTrue(index.has_document("doc", text_fingerprint(old_text)))
+        self.assertFalse(index.has_document("doc", text_fingerprint(new_text)))
+        self.assertGreater(index.add_document("doc", new_text), 0)
+
+        _, _, start, end, _ = index.search("moon", ["doc"], top_k=1)[0]
+        self.assertEqual(new_text[start:end], new_text)
+        self.assertTrue(CorpusIndex(self.directory, dims=256).has_document("doc", text_fingerprint(new_text)))
+
+    def test_missing_checks_every_document_at_once(self):
+        index = CorpusIndex(self.directory, dims=256)
+        index.add_document("current", "Owls hunt at night.")
+        index.add_document("stale", "Bats sleep by day.")
+
+        missing = index.missing({"current": text_fingerprint("Owls hunt at night."),
+                                 "stale": text_fingerprint("Bats  sleep by day."),
+                                 "legacy": None, "new": text_fingerprint("Moths fly.")})
+
+        self.assertEqual(missing, ["stale", "legacy", "new"])
+
+    def test_removed_documents_are_compacted(self):
+        index = CorpusIndex(self.directory, dims=256)
+        other = CorpusIndex(self.directory, dims=256)
+        index.add_document("keep", "Rivers flow down to the sea. " * 40)
+        index.add_document("first", "Deserts receive little rain. " * 40)
+        index.add_document("second", "Forests shelter many animals. " * 40)
+        self.assertEqual(other.stats()["documents"], 3)
+
+        self.assertTrue(index.remove_document("first"))
+        self.assertFalse(index.remove_document("first"))
+        self.assertFalse(other.has_document("first"))
+        self.assertGreater(other.stats()["dead_passages"], 0)
+
+        index.remove_document("second")  # dead rows now outnumber live ones
+        stats = other.stats()
+        self.assertEqual((stats["documents"], stats["dead_passages"]), (1, 0))
+        self.assertEqual(stats["passages"], index.stats()["passages"])
+        self.assertEqual(other.search("rivers sea", ["keep", "first"], top_k=1)[0][0], "keep")
+
+
+class TestCorpusChat(unittest.TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        similarity_cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.storage = MemoryDocumentStore()
+        for patcher in (patch("pdf_routes.pdf_storage", self.storage),
+                        patch("pdf_routes.corpus_index", CorpusIndex(directory, dims=512))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.storage.add_removal_listener(pdf_routes._remove_from_corpus)
+
+        self.storage["solar_id"] = {"filename": "solar.pdf", "page_count": 1,
+                                    "text": "Solar panels convert sunlight into electricity. " * 20}
+        self.storage["bread_id"] = {"filename": "bread.pdf", "page_count": 1,
+                                    "text": "Sourdough bread needs flour, water and a starter. " * 20}
+        self.storage["other_id"] = {"filename": "other.pdf", "page_count": 1,
+                                    "text": "Glaciers carve valleys over thousands of years. " * 20}
+
+    def post_chat(self, body):
+        model = RecordingStub()
+        with patch("retry_logic.get_model_client", return_value=model):
+            response = client.post("/v1/chat", json=body)
+        return response, model
+
+    def test_selected_documents_only(self):
+        response, model = self.post_chat({"query": "What does sourdough bread need?",
+                                          "pdf_ids": ["bread_id", "solar_id"]})
+
+        self.assertEqual(response.status_code, 200)
+        sources = response.json()["sources"]
+        self.assertEqual(sources[0]["pdf_id"], "bread_id")
+        self.assertEqual(sources[0]["filename"], "bread.pdf")
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn("[Source 1: bread.pdf (pdf_id bread_id)]", model.prompts[0])
+        self.assertNotIn("Glaciers", model.prompts[0])
+
+    def test_all_documents(self):
+        response, model = self.post_chat({"query": "How do glaciers carve valleys?"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["sources"][0]["pdf_id"], "other_id")
+
+    def test_cached_answer_keeps_its_sources(self):
+        first, _ = self.post_chat({"query": "What does sourdough bread need?"})
+        cached, model = self.post_chat({"query": "What does sourdough bread need?"})
+
+        self.assertEqual(model.prompts, [])
+        self.assertEqual(cached.json(), first.json())
+
+    def test_unknown_document_is_404(self):
+        response, model = self.post_chat({"query": "Anything?", "pdf_ids": ["solar_id", "missing_id"]})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("missing_id", response.json()["detail"])
+        self.assertEqual(model.prompts, [])
+
+    def test_empty_query_is_400(self):
+        response, _ = self.post_chat({"query": "  ", "pdf_ids": "all"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_uploaded_pdf_is_indexed_with_pages(self):
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawString(100, 750, f"Volcanoes erupt molten rock. {uuid.uuid4()}")
+        c.showPage()
+        c.drawString(100, 750, "Penguins live in the southern hemisphere.")
+        c.save()
+        buffer.seek(0)
+        upload = client.post("/v1/pdf", files={"file": ("pages.pdf", buffer, "application/pdf")})
+        pdf_id = upload.json()["pdf_id"]
+
+        response, _ = self.post_chat({"query": "Where do penguins live?", "pdf_ids": [pdf_id]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["sources"][0]["page"], 2)
+
+    def test_passages_are_read_without_filling_the_hot_cache(self):
+        self.storage.hot.clear()
+
+        response, _ = self.post_chat({"query": "How do glaciers carve valleys?"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.storage.hot), 0)
+
+    def test_stale_entry_is_indexed_again(self):
+        # An entry left from an earlier extraction of the text, e.g. by another worker
+        pdf_routes.corpus_index.add_document("other_id", "Glaciers  carve valleys.")
+
+        response, model = self.post_chat({"query": "How do glaciers carve valleys?", "pdf_ids": ["other_id"]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Glaciers carve valleys", model.prompts[0])
+        self.assertTrue(pdf_routes.corpus_index.has_document(
+            "other_id", pdf_routes._corpus_fingerprint(self.storage["other_id"])))
+
+    def test_removed_document_leaves_the_index(self):
+        self.post_chat({"query": "How do glaciers carve valleys?"})
+        self.assertTrue(pdf_routes.corpus_index.has_document("other_id"))
+
+        del self.storage["other_id"]
+
+        self.assertFalse(pdf_routes.corpus_index.has_document("other_id"))
+        self.assertTrue(pdf_routes.corpus_index.has_document("solar_id"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,11 @@
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 from main import app
-from pdf_routes import pdf_storage 
+from pdf_routes import pdf_storage
+from corpus_index import CorpusIndex
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
@@ -72,6 +76,12 @@ class TestIntegration(unittest.TestCase):
     def setUp(self):
         # Clear PDF storage before each test
         pdf_storage.clear()
+        # Keep indexed uploads out of the working directory's corpus index
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = patch("pdf_routes.corpus_index", CorpusIndex(directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_pdf_upload_success(self):
         # Simulate uploading a valid PDF file
@@ -0,0 +1,61 @@
+import json
+import logging
+import queue
+import unittest
+
+from logging_config import JsonFormatter, SamplingFilter, DeferredQueueHandler
+
+
+def make_record(msg, args=(), level=logging.INFO, **extra):
+    record = logging.LogRecord("fastapi_app", level, "app.py", 10, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestJsonFormatter(unittest.TestCase):
+
+    def test_messages_with_quotes_stay_valid_json(self):
+        line = JsonFormatter().format(
+            make_record('Query was: %s', ('say "hi"\nand leave',)))
+
+        entry = json.loads(line)
+        self.assertEqual(entry["message"], 'Query was: say "hi"\nand leave')
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["line"], 10)
+
+
+class TestSamplingFilter(unittest.TestCase):
+
+    def test_drops_only_sampled_info_records(self):
+        sampling = SamplingFilter(rate=0.0)
+
+        self.assertFalse(sampling.filter(make_record("request", sampled=True)))
+        self.assertTrue(sampling.filter(make_record("request")))
+        self.assertTrue(sampling.filter(
+            make_record("request", level=logging.WARNING, sampled=True)))
+
+    def test_full_rate_keeps_everything(self):
+        self.assertTrue(SamplingFilter(rate=1.0).filter(make_record("request", sampled=True)))
+
+
+class TestDeferredQueueHandler(unittest.TestCase):
+
+    def test_records_are_enqueued_unformatted(self):
+        log_queue = queue.Queue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.handle(make_record("PDF ID: %s", ("abc",)))
+
+        record = log_queue.get_nowait()
+        self.assertEqual(record.msg, "PDF ID: %s")
+        self.assertEqual(record.args, ("abc",))
+
+    def test_full_queue_drops_records(self):
+        handler = DeferredQueueHandler(queue.Queue(maxsize=1))
+        handler.handle(make_record("first"))
+        handler.handle(make_record("second"))
+
+        self.assertEqual(handler.dropped, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
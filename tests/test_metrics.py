@@ -0,0 +1,73 @@
+import io
+import unittest
+import uuid
+
+from fastapi.testclient import TestClient
+from reportlab.pdfgen import canvas
+
+from main import app
+from metrics import Counter, Histogram
+
+client = TestClient(app)
+
+
+class TestMetricTypes(unittest.TestCase):
+
+    def test_histogram_rendering(self):
+        histogram = Histogram("test_seconds", "Test latency.", labelnames=("stage",),
+                              buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage="read")
+        histogram.observe(0.5, stage="read")
+
+        text = histogram.render()
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertIn('test_seconds_bucket{stage="read",le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{stage="read",le="1"} 2', text)
+        self.assertIn('test_seconds_bucket{stage="read",le="+Inf"} 2', text)
+        self.assertIn('test_seconds_count{stage="read"} 2', text)
+        self.assertIn('test_seconds_sum{stage="read"} 0.55', text)
+
+    def test_histogram_time_decorator(self):
+        histogram = Histogram("decorated_seconds", "Decorated.")
+
+        @histogram.time()
+        def work():
+            return 42
+
+        self.assertEqual(work(), 42)
+        self.assertEqual(histogram.count(), 1)
+
+    def test_counter_rendering(self):
+        counter = Counter("test_total", "Test counter.")
+        counter.inc()
+        counter.inc(2)
+        self.assertIn("test_total 3", counter.render())
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def test_stages_are_reported(self):
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawString(100, 750, f"Metrics test PDF {uuid.uuid4()}.")
+        c.save()
+        buffer.seek(0)
+        client.post("/v1/pdf", files={"file": ("metrics.pdf", buffer, "application/pdf")})
+
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        for name in ("pdfchat_upload_read_seconds_count",
+                     "pdfchat_page_extraction_seconds_count",
+                     "pdfchat_clean_seconds_count",
+                     "pdfchat_cache_hits_total",
+                     "pdfchat_model_retries_total 0",
+                     "pdfchat_documents_stored",
+                     "pdfchat_document_bytes_stored"):
+            self.assertIn(name, response.text)
+        self.assertIn('pdfchat_request_seconds_count{method="POST",route="/v1/pdf",status="200"}',
+                      response.text)
+
+
+if __name__ == '__main__':
+    unittest.main()
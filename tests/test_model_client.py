@@ -0,0 +1,114 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from fastapi.testclient import TestClient
+
+from main import app
+from model_client import (get_model_client, ModelBackend, StubBackend, GeminiBackend, WarmUp,
+                          ModelCall, current_model_call)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestModelClient(unittest.TestCase):
+
+    def test_client_is_reused_per_model_name(self):
+        first = get_model_client("gemini-1.5-flash", backend="gemini")
+        second = get_model_client("gemini-1.5-flash", backend="gemini")
+        other = get_model_client("gemini-1.5-pro", backend="gemini")
+
+        self.assertIsInstance(first, GeminiBackend)
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_model_client("gemini-1.5-flash", backend="missing")
+
+    def test_backends_must_implement_generate(self):
+        with self.assertRaises(TypeError):
+            ModelBackend("any-model")
+
+    def test_gemini_request_is_bounded_by_the_call_deadline(self):
+        backend = get_model_client("gemini-1.5-flash", backend="gemini")
+
+        async def run():
+            current_model_call.set(ModelCall(time.monotonic() + 5))
+            return await backend.generate("Prompt")
+
+        with patch.object(backend, "model", MagicMock()) as model:
+            model.generate_content.return_value.text = "answer"
+            self.assertEqual(asyncio.run(run()), "answer")
+            self.assertEqual(asyncio.run(backend.generate("No deadline")), "answer")
+
+        timeout = model.generate_content.call_args_list[0].kwargs["request_options"]["timeout"]
+        self.assertTrue(4 < timeout <= 5)
+        self.assertIsNone(model.generate_content.call_args_list[1].kwargs["request_options"])
+
+    def test_stub_calls_overlap(self):
+        stub = StubBackend("stub-model", latency=0.2)
+
+        async def run():
+            return await asyncio.gather(
+                *(stub.generate(f"text\n\nUser query: question {i}") for i in range(10)))
+
+        start = time.perf_counter()
+        responses = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(responses), 10)
+        self.assertIn("question 3", responses[3])
+        self.assertLess(elapsed, 1.0)
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_importing_the_app_does_not_import_the_sdk(self):
+        script = "import sys, main; print('google.generativeai' in sys.modules, 'grpc' in sys.modules)"
+        output = subprocess.run([sys.executable, "-W", "ignore", "-c", script], cwd=ROOT,
+                                check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.split(), ["False", "False"])
+
+    def test_warm_up_creates_the_client(self):
+        warm_up = WarmUp()
+        self.assertEqual(warm_up.state, "idle")
+        thread = warm_up.start("warm-up-model", backend="stub")
+        self.assertIs(warm_up.start("warm-up-model", backend="stub"), thread)  # started once
+        thread.join(5)
+
+        self.assertEqual(warm_up.state, "ready")
+        self.assertIsInstance(get_model_client("warm-up-model", backend="stub"), StubBackend)
+
+    def test_failed_warm_up_is_reported(self):
+        warm_up = WarmUp()
+        warm_up.start("warm-up-model", backend="missing").join(5)
+
+        self.assertEqual(warm_up.state, "failed")
+        self.assertIn("missing", warm_up.stats()["error"])
+
+    def test_probes(self):
+        client = TestClient(app)
+        warm_up = WarmUp()
+        self.assertEqual(client.get("/healthz").json(), {"status": "ok"})
+
+        with patch("ops_routes.warm_up", warm_up), patch("ops_routes.MODEL_WARMUP", True):
+            response = client.get("/readyz")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json()["checks"]["model_client"]["state"], "idle")
+
+            warm_up.start("probe-model", backend="stub").join(5)
+            response = client.get("/readyz")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["status"], "ready")
+
+        with patch("ops_routes.MODEL_WARMUP", False):
+            self.assertEqual(client.get("/readyz").status_code, 200)  # the client is created lazily
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import io
+import os
+import tempfile
+import unittest
+import uuid
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from reportlab.pdfgen import canvas
+
+from main import app
+from model_client import StubBackend
+from cache import response_cache, similarity_cache
+from pdf_routes import pdf_storage
+from pdf_processing import extract_pdf_document, offsets_for_pages
+from retrieval import build_document_index, chunk_pages
+
+client = TestClient(app)
+
+
+def extract_pages(pages):
+    """Renders `pages` (lists of lines) to a PDF and returns (text, page_offsets)
+    as the upload path stores them."""
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        c = canvas.Canvas(path)
+        for lines in pages:
+            for i, line in enumerate(lines):
+                c.drawString(40, 800 - i * 14, line)
+            c.showPage()
+        c.save()
+        page_lengths = []
+        text, _ = extract_pdf_document(path, on_page=lambda page: page_lengths.append(len(page)),
+                                       extractor="pdfplumber")
+    finally:
+        os.remove(path)
+    return text, offsets_for_pages(page_lengths)
+
+
+TEXT, OFFSETS = extract_pages([[f"Page {page} line {line} talks about subject {page}." for line in range(50)]
+                               for page in range(1, 6)])
+
+
+class RecordingStub(StubBackend):
+
+    def __init__(self):
+        super().__init__("pages-test", latency=0)
+        self.prompts = []
+
+    async def generate(self, prompt, json_output=False):
+        self.prompts.append(prompt)
+        return await super().generate(prompt, json_output)
+
+
+class TestChunkPages(unittest.TestCase):
+
+    def test_chunks_map_to_the_pages_they_span(self):
+        text = "a b c d\ne f g h\ni j k l\n"
+        pages = chunk_pages(text, [0, 8, 16, 24], chunk_count=3, chunk_size=4, overlap=0)
+        self.assertEqual(pages, [(1, 1), (2, 2), (3, 3)])
+
+        pages = chunk_pages(text, [0, 8, 16, 24], chunk_count=2, chunk_size=6, overlap=0)
+        self.assertEqual(pages, [(1, 2), (2, 3)])
+
+    def test_citations_do_not_drift_on_extracted_documents(self):
+        # Every word names its page, so each chunk's true page span is known
+        text, offsets = extract_pages([[" ".join(f"p{page}w{line}x{word}" for word in range(10))
+                                        for line in range(4)] for page in range(1, 41)])
+        index = build_document_index(text, offsets)
+
+        self.assertEqual(len(index.chunks), 10)
+        for chunk, (first, last) in zip(index.chunks, index.chunk_pages):
+            pages = [int(word[1:word.index("w")]) for word in chunk.split()]
+            self.assertEqual((first, last), (min(pages), max(pages)))
+
+    def test_empty_pages_are_skipped(self):
+        text = "a b\nc d\n"
+        self.assertEqual(chunk_pages(text, [0, 4, 4, 8], chunk_count=2, chunk_size=2, overlap=0),
+                         [(1, 1), (3, 3)])
+
+
+class TestPageFilters(unittest.TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        similarity_cache.clear()
+        pdf_storage["paged_pdf"] = {
+            "filename": "paged.pdf",
+            "text": TEXT,
+            "page_count": len(OFFSETS) - 1,
+            "page_offsets": OFFSETS,
+            "index": build_document_index(TEXT, OFFSETS)
+        }
+
+    def chat(self, body):
+        model = RecordingStub()
+        with patch("retry_logic.get_model_client", return_value=model):
+            response = client.post("/v1/chat/paged_pdf", json=body)
+        return response, model
+
+    def test_only_requested_pages_are_sent(self):
+        response, model = self.chat({"query": "What is discussed?", "pages": "2-3, 5"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["pages"], [2, 3, 5])
+        prompt = model.prompts[0]
+        self.assertIn("[Page 2]\nPage 2 line 0", prompt)
+        self.assertIn("[Page 5]", prompt)
+        self.assertNotIn("Page 1 line", prompt)
+        self.assertNotIn("Page 4 line", prompt)
+
+    def test_retrieved_chunks_cite_their_pages(self):
+        response, _ = self.chat({"query": "subject 4"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(4, response.json()["pages"])
+
+    def test_cache_hits_keep_their_citations(self):
+        first, _ = self.chat({"query": "subject 4"})
+        cached, model = self.chat({"query": "subject 4"})
+        stream = client.post("/v1/chat/paged_pdf/stream", json={"query": "subject 4"})
+
+        self.assertEqual(model.prompts, [])
+        for field in ("response", "chunk_ids", "pages"):
+            self.assertEqual(cached.json()[field], first.json()[field], field)
+        self.assertEqual(cached.json()["metadata"]["strategy"], first.json()["metadata"]["strategy"])
+        self.assertTrue(cached.json()["metadata"]["cached"])
+        self.assertIn('event: meta\ndata: {"chunk_ids": %s' % first.json()["chunk_ids"], stream.text)
+
+    def test_page_answers_are_cached_separately(self):
+        self.chat({"query": "What is discussed?", "pages": "1"})
+        response, model = self.chat({"query": "What is discussed?", "pages": "4"})
+
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn("[Page 4]", model.prompts[0])
+
+    def test_invalid_page_ranges_are_rejected(self):
+        for pages in ("0", "4-9", "two", "3-1"):
+            response, model = self.chat({"query": "Anything?", "pages": pages})
+            self.assertEqual(response.status_code, 400, pages)
+            self.assertEqual(model.prompts, [])
+
+    def test_uploads_record_page_offsets(self):
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawString(100, 750, f"First page. {uuid.uuid4()}")
+        c.showPage()
+        c.drawString(100, 750, "Second page.")
+        c.save()
+        buffer.seek(0)
+        pdf_id = client.post("/v1/pdf", files={"file": ("two.pdf", buffer, "application/pdf")}).json()["pdf_id"]
+
+        offsets = pdf_storage[pdf_id]["page_offsets"]
+        self.assertEqual(len(offsets), 3)
+        self.assertIn("Second page.", pdf_storage[pdf_id]["text"][offsets[1]:offsets[2]])
+
+    def test_documents_without_page_offsets(self):
+        pdf_storage["unpaged_pdf"] = {"filename": "old.pdf", "text": TEXT, "page_count": 5}
+        with patch("retry_logic.get_model_client", return_value=RecordingStub()):
+            response = client.post("/v1/chat/unpaged_pdf", json={"query": "Anything?", "pages": "1"})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,20 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from unittest.mock import patch, MagicMock
 
 from fastapi import HTTPException
-from pdf_processing import extract_pdf_text
+from fastapi import UploadFile
+from reportlab.pdfgen import canvas
+from reportlab.platypus import SimpleDocTemplate, Table
+import pdf_processing
+from pdf_processing import (extract_pdf_text, extract_pdf_pages, extract_pdf_document,
+                            split_page_ranges, spool_upload, iter_page_texts, choose_extractor,
+                            get_extractor, offsets_for_pages, Extractor)
 
 
 class TestPDFProcessing(unittest.TestCase):
@@ -20,7 +32,7 @@ class TestPDFProcessing(unittest.TestCase):
         text, page_count = extract_pdf_text(mock_pdf)
 
         # Assert the results
-        self.assertEqual(text, "Page 1 text.Page 2 text.")
+        self.assertEqual(text, "Page 1 text. Page 2 text.")  # pages never run together
         self.assertEqual(page_count, 2)
 
     @patch("pdfplumber.open")
@@ -51,5 +63,177 @@ class TestPDFProcessing(unittest.TestCase):
         self.assertEqual(page_count, 0)
 
 
+    @patch("pdfplumber.open")
+    def test_extract_pdf_text_extracts_each_page_once(self, mock_pdf_open):
+        mock_pdf = MagicMock()
+        mock_pdf.pages = [MagicMock(), MagicMock()]
+        mock_pdf.pages[0].extract_text.return_value = "Page 1 text."
+        mock_pdf.pages[1].extract_text.return_value = None
+        mock_pdf_open.return_value.__enter__.return_value = mock_pdf
+
+        text, page_count = extract_pdf_text(mock_pdf)
+
+        self.assertEqual(text, "Page 1 text.")
+        for page in mock_pdf.pages:
+            page.extract_text.assert_called_once()
+
+
+class TestPageParallelExtraction(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.file_path = "test_pages.pdf"
+        c = canvas.Canvas(cls.file_path)
+        for i in range(7):
+            c.drawString(100, 750, f"Page number {i + 1}.")
+            c.showPage()
+        c.save()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.file_path)
+
+    def test_split_page_ranges(self):
+        self.assertEqual(split_page_ranges(7, 3), [(0, 3), (3, 6), (6, 7)])
+        self.assertEqual(split_page_ranges(0, 3), [])
+
+    def test_serial_extraction(self):
+        progress = []
+        pages, text = extract_pdf_pages(
+            self.file_path, pages_per_task=3,
+            on_progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(len(pages), 7)
+        self.assertEqual(pages[0], "Page number 1.")
+        self.assertEqual(text, "\n".join(pages))
+        self.assertEqual(progress[-1], (7, 7))
+
+    def test_parallel_extraction_preserves_page_order(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            pages, text = extract_pdf_pages(
+                self.file_path, executor=executor, pages_per_task=2)
+
+        self.assertEqual(pages, [f"Page number {i + 1}." for i in range(7)])
+        self.assertTrue(text.startswith("Page number 1.\nPage number 2."))
+
+    def test_missing_file_raises(self):
+        with self.assertRaises(RuntimeError):
+            extract_pdf_pages("does_not_exist.pdf")
+
+    def test_streamed_document_matches_page_list(self):
+        pages, text = extract_pdf_pages(self.file_path)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            streamed_text, page_count = extract_pdf_document(
+                self.file_path, executor=executor, pages_per_task=3)
+
+        self.assertEqual(streamed_text, text)
+        self.assertEqual(page_count, 7)
+
+    def test_page_offsets_include_the_separator(self):
+        pages, text = extract_pdf_pages(self.file_path)
+        offsets = offsets_for_pages([len(page) for page in pages])
+
+        self.assertEqual(offsets[-1], len(text))
+        for i, page in enumerate(pages):
+            self.assertEqual(text[offsets[i]:offsets[i + 1]].strip(), page)
+        self.assertEqual(offsets_for_pages([]), [0])
+
+
+class TestExtractionBackends(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.file_path = "test_backends.pdf"
+        c = canvas.Canvas(cls.file_path)
+        for i in range(5):
+            c.drawString(100, 750, f"Page number {i + 1}.")
+            c.showPage()
+        c.save()
+
+        cls.table_path = "test_backends_table.pdf"
+        SimpleDocTemplate(cls.table_path).build([Table(
+            [["Item", "Qty"], ["Apples", "3"], ["Pears", "5"]],
+            style=[("GRID", (0, 0), (-1, -1), 0.5, "black")])])
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.file_path)
+        os.remove(cls.table_path)
+
+    def test_every_backend_extracts_the_page_text(self):
+        for backend in ("pdfplumber", "pdfminer", "tables"):
+            pages = list(iter_page_texts(self.file_path, 1, 3, extractor=backend))
+            self.assertEqual(pages, ["Page number 2.", "Page number 3."], backend)
+
+    def test_parallel_extraction_with_pdfminer(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            pages, _ = extract_pdf_pages(self.file_path, executor=executor, pages_per_task=2,
+                                         extractor="pdfminer")
+        self.assertEqual(pages, [f"Page number {i + 1}." for i in range(5)])
+
+    def test_tables_keep_rows_together(self):
+        text = list(iter_page_texts(self.table_path, extractor="tables"))[0]
+        self.assertIn("[Item | Qty] [Apples | 3] [Pears | 5]", text)
+
+    def test_auto_chooses_by_page_count(self):
+        self.assertEqual(choose_extractor("auto", 10, fast_page_threshold=100), "pdfplumber")
+        self.assertEqual(choose_extractor("auto", 100, fast_page_threshold=100), "pdfminer")
+        self.assertEqual(choose_extractor("tables", 1000, fast_page_threshold=100), "tables")
+        with self.assertRaises(ValueError):
+            get_extractor("ocr")
+
+    def test_extractors_must_implement_iter_pages(self):
+        class Unfinished(Extractor):
+            name = "unfinished"
+
+        with self.assertRaises(TypeError):
+            Unfinished()
+
+
+class TestSpoolUpload(unittest.TestCase):
+
+    def _spool(self, data, **kwargs):
+        return asyncio.run(spool_upload(UploadFile(io.BytesIO(data)), **kwargs))
+
+    def test_spools_pdf_to_disk(self):
+        path, content_hash = self._spool(b"%PDF-1.4 body")
+        self.assertEqual(content_hash, hashlib.sha256(b"%PDF-1.4 body").hexdigest())
+        try:
+            with open(path, "rb") as spooled:
+                self.assertEqual(spooled.read(), b"%PDF-1.4 body")
+        finally:
+            os.remove(path)
+
+    def test_chunks_are_written_off_the_event_loop(self):
+        threads = []
+        write = pdf_processing._spool_chunk
+
+        def record_thread(*args):
+            threads.append(threading.current_thread())
+            write(*args)
+
+        with patch("pdf_processing._spool_chunk", side_effect=record_thread):
+            path, _ = self._spool(b"%PDF-1.4 body")
+        os.remove(path)
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_rejects_missing_magic_bytes(self):
+        with self.assertRaises(HTTPException) as context:
+            self._spool(b"This is not a valid PDF format")
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_rejects_empty_upload(self):
+        with self.assertRaises(HTTPException) as context:
+            self._spool(b"")
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_rejects_oversized_upload(self):
+        with self.assertRaises(HTTPException) as context:
+            self._spool(b"%PDF-1.4" + b"x" * 100, max_bytes=50)
+        self.assertEqual(context.exception.status_code, 413)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,14 +1,32 @@
+import asyncio
+import io
+import shutil
+import tempfile
 import unittest
+import uuid
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 from main import app
+import pdf_routes
+from pdf_routes import pdf_storage
+from corpus_index import CorpusIndex
 import os
 from reportlab.pdfgen import canvas
+from reportlab.platypus import SimpleDocTemplate, Table
 
 client = TestClient(app)
 
 
 class TestPDFUpload(unittest.TestCase):
 
+    def setUp(self):
+        # Keep indexed uploads out of the working directory's corpus index
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = patch("pdf_routes.corpus_index", CorpusIndex(directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_invalid_file_type_upload(self):
         # Simulate uploading a non-PDF file (txt file)
         file_path = "test_file.txt"
@@ -54,6 +72,112 @@ class TestPDFUpload(unittest.TestCase):
             if os.path.exists(file_path):
                 os.remove(file_path)
 
+    def test_duplicate_upload_shares_extracted_text(self):
+        file_path = "test_duplicate.pdf"
+        try:
+            c = canvas.Canvas(file_path)
+            c.drawString(100, 750, "This PDF is uploaded twice.")
+            c.save()
+
+            with open(file_path, "rb") as file:
+                first = client.post("/v1/pdf", files={"file": file}).json()["pdf_id"]
+
+            # The second upload must not run extraction again
+            with patch("pdf_routes.submit_extraction") as mock_submit:
+                with open(file_path, "rb") as file:
+                    response = client.post("/v1/pdf", files={"file": file})
+                mock_submit.assert_not_called()
+
+            self.assertEqual(response.status_code, 200)
+            second = response.json()["pdf_id"]
+            self.assertNotEqual(first, second)
+            self.assertIs(pdf_storage[first]["text"], pdf_storage[second]["text"])
+            self.assertEqual(pdf_storage[first]["content_hash"],
+                             pdf_storage[second]["content_hash"])
+
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def test_extractor_can_be_chosen_per_upload(self):
+        file_path = "test_extractor.pdf"
+        try:
+            c = canvas.Canvas(file_path)
+            c.drawString(100, 750, "Extracted with pdfminer.")
+            c.save()
+
+            with open(file_path, "rb") as file:
+                response = client.post("/v1/pdf?extractor=pdfminer", files={"file": file})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(pdf_storage[response.json()["pdf_id"]]["text"], "Extracted with pdfminer.")
+
+            with open(file_path, "rb") as file:
+                response = client.post("/v1/pdf?extractor=ocr", files={"file": file})
+            self.assertEqual(response.status_code, 400)
+
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def test_duplicate_with_another_extractor_is_extracted_again(self):
+        buffer = io.BytesIO()
+        SimpleDocTemplate(buffer).build([Table(
+            [["Item", "Qty"], ["Apples", str(uuid.uuid4())]],
+            style=[("GRID", (0, 0), (-1, -1), 0.5, "black")])])
+
+        first = client.post("/v1/pdf?extractor=pdfplumber",
+                            files={"file": ("table.pdf", buffer.getvalue(), "application/pdf")}).json()["pdf_id"]
+        second = client.post("/v1/pdf?extractor=tables",
+                             files={"file": ("table.pdf", buffer.getvalue(), "application/pdf")}).json()["pdf_id"]
+        again = client.post("/v1/pdf?extractor=tables",
+                            files={"file": ("table.pdf", buffer.getvalue(), "application/pdf")}).json()["pdf_id"]
+
+        self.assertNotIn("[Item | Qty]", pdf_storage[first]["text"])
+        self.assertIn("[Item | Qty]", pdf_storage[second]["text"])
+        self.assertNotEqual(pdf_storage[first]["content_hash"], pdf_storage[second]["content_hash"])
+        self.assertEqual(pdf_storage[second]["content_hash"], pdf_storage[again]["content_hash"])
+
+    def test_document_is_stored_off_the_event_loop(self):
+        on_loop = []
+
+        def store_document(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return store(*args, **kwargs)
+
+        store = pdf_routes._store_document
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawString(100, 750, f"Indexed in a worker thread. {uuid.uuid4()}")
+        c.save()
+        with patch("pdf_routes._store_document", side_effect=store_document):
+            for _ in range(2):  # the second upload is a duplicate
+                response = client.post("/v1/pdf", files={"file": ("thread.pdf", buffer.getvalue(),
+                                                                  "application/pdf")})
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(on_loop, [False, False])
+
+    def test_invalid_pdf_content_rejected(self):
+        file_path = "test_fake.pdf"
+        try:
+            with open(file_path, "wb") as f:
+                f.write(b"This is not a valid PDF format")
+
+            with open(file_path, "rb") as file:
+                response = client.post(
+                    "/v1/pdf", files={"file": ("test_fake.pdf", file, "application/pdf")})
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["detail"], "Invalid PDF file.")
+
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,161 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+from google.api_core import exceptions as google_exceptions
+
+from rate_limiter import RateLimiter, ModelOverloaded, TokenBucket
+from retry_logic import generate_response_from_model
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_delay_until_refilled(self):
+        bucket = TokenBucket(rate_per_minute=60, burst_seconds=1)  # one token per second
+        now = time.monotonic()
+        self.assertEqual(bucket.delay(1, now), 0)
+        bucket.take(1, now)
+        self.assertAlmostEqual(bucket.delay(1, now), 1.0, places=2)
+
+    def test_oversized_request_waits_for_a_full_bucket_only(self):
+        bucket = TokenBucket(rate_per_minute=600, burst_seconds=1)  # capacity 10
+        now = time.monotonic()
+        self.assertEqual(bucket.delay(50, now), 0)
+        bucket.take(50, now)
+        self.assertGreater(bucket.delay(1, now), 4)  # the debt is paid back first
+
+    def test_zero_rate_disables_the_bucket(self):
+        bucket = TokenBucket(rate_per_minute=0)
+        self.assertEqual(bucket.delay(10 ** 9, time.monotonic()), 0)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_concurrency_is_capped(self):
+        limiter = RateLimiter(max_concurrency=2)
+        active = []
+        peak = []
+
+        async def call():
+            async with limiter.limit():
+                active.append(1)
+                peak.append(len(active))
+                await asyncio.sleep(0.02)
+                active.pop()
+
+        async def run():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(limiter.admitted, 6)
+        self.assertEqual(limiter.stats()["active"], 0)
+
+    def test_requests_per_minute_paces_calls(self):
+        # 1200 rpm with a 0.05s burst = 1 request up front, then one every 0.05s
+        limiter = RateLimiter(requests_per_minute=1200, burst_seconds=0.05)
+
+        async def run():
+            started = time.monotonic()
+            for _ in range(4):
+                async with limiter.limit():
+                    pass
+            return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.14)
+
+    def test_full_queue_is_rejected(self):
+        limiter = RateLimiter(max_concurrency=1, max_queue=1, queue_timeout=5)
+
+        async def run():
+            await limiter.acquire()
+            waiting = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0.01)
+            with self.assertRaises(ModelOverloaded):
+                await limiter.acquire()
+            limiter.release()
+            await waiting
+            limiter.release()
+
+        asyncio.run(run())
+        self.assertEqual(limiter.rejected, 1)
+        self.assertEqual(limiter.stats()["queued"], 0)
+
+    def test_queue_wait_times_out(self):
+        limiter = RateLimiter(max_concurrency=1, queue_timeout=0.05)
+
+        async def run():
+            await limiter.acquire()
+            with self.assertRaises(ModelOverloaded):
+                await limiter.acquire()
+
+        asyncio.run(run())
+        self.assertEqual(limiter.timed_out, 1)
+        self.assertEqual(limiter.stats()["queued"], 0)
+
+    def test_throttling_slows_down_and_success_recovers(self):
+        limiter = RateLimiter(requests_per_minute=600, max_concurrency=10)
+        limiter.on_throttled()
+        throttled = limiter.stats()
+        self.assertLess(throttled["requests_per_minute"], 600)
+        self.assertLess(throttled["concurrency_limit"], 10)
+
+        for _ in range(100):
+            limiter.on_success()
+        self.assertEqual(limiter.stats()["requests_per_minute"], 600)
+        self.assertEqual(limiter.stats()["concurrency_limit"], 10)
+
+    def test_retry_after_pauses_admission(self):
+        limiter = RateLimiter()
+        limiter.on_throttled(retry_after=0.1)
+
+        async def run():
+            started = time.monotonic()
+            async with limiter.limit():
+                return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.09)
+
+
+class TestModelCallLimiting(unittest.TestCase):
+
+    @patch("retry_logic.MODEL_RETRY_ATTEMPTS", 1)
+    @patch("retry_logic.model_limiter")
+    @patch("retry_logic.get_model_client")
+    def test_upstream_429_is_reported_to_the_limiter(self, mock_client, mock_limiter):
+        mock_limiter.acquire.side_effect = lambda *args: asyncio.sleep(0)
+        mock_client.return_value.generate.side_effect = google_exceptions.TooManyRequests("quota")
+
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(generate_response_from_model("Document text.", "Question?"))
+
+        self.assertEqual(context.exception.status_code, 429)
+        mock_limiter.on_throttled.assert_called_once()
+        mock_limiter.release.assert_called_once()
+
+    @patch("retry_logic.model_limiter", RateLimiter(max_concurrency=1, max_queue=0))
+    @patch("retry_logic.get_model_client")
+    def test_overload_is_shed_with_503(self, mock_client):
+        async def slow_generate(prompt):
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        mock_client.return_value.generate.side_effect = slow_generate
+
+        async def run():
+            return await asyncio.gather(
+                generate_response_from_model("Document text.", "First?"),
+                generate_response_from_model("Document text.", "Second?"),
+                return_exceptions=True)
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, "answer")
+        self.assertIsInstance(second, HTTPException)
+        self.assertEqual(second.status_code, 503)
+        self.assertIn("Retry-After", second.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import asyncio
+import threading
+import uuid
+from unittest.mock import patch, MagicMock
+
+from retrieval import chunk_text, BM25Index, select_chunks, build_context
+from pdf_routes import chat_with_pdf, pdf_storage
+from retrieval import build_document_index
+from models import ChatRequest
+
+
+class TestChunking(unittest.TestCase):
+
+    def test_chunks_overlap(self):
+        text = " ".join(f"w{i}" for i in range(10))
+        chunks = chunk_text(text, chunk_size=4, overlap=2)
+
+        self.assertEqual(chunks[0], "w0 w1 w2 w3")
+        self.assertEqual(chunks[1], "w2 w3 w4 w5")
+        self.assertTrue(chunks[-1].endswith("w9"))
+
+    def test_empty_text(self):
+        self.assertEqual(chunk_text(""), [])
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BM25Index([
+            "The refund policy allows returns within 30 days.",
+            "Shipping is free for orders over 50 dollars.",
+            "Contact support for refund questions.",
+        ])
+
+    def test_search_ranks_matching_chunks(self):
+        ranked = self.index.search("refund policy", top_k=3)
+        self.assertEqual(ranked[0][0], 0)
+        self.assertIn(2, [chunk_id for chunk_id, _ in ranked])
+        self.assertNotIn(1, [chunk_id for chunk_id, _ in ranked])
+
+    def test_select_chunks_respects_token_budget(self):
+        selected = select_chunks(self.index, "refund", top_k=3, token_budget=12)
+        self.assertEqual(len(selected), 1)
+
+    def test_select_chunks_falls_back_to_leading_chunks(self):
+        selected = select_chunks(self.index, "unrelated", top_k=2, token_budget=1000)
+        self.assertEqual(selected, [0, 1])
+
+    def test_build_context_in_document_order(self):
+        context = build_context(self.index, [2, 0])
+        self.assertTrue(context.startswith("The refund policy"))
+
+
+class TestRetrievalChat(unittest.TestCase):
+
+    def setUp(self):
+        text = "Shipping is free. " * 3000 + "The warranty lasts two years."
+        self.pdf_id = "retrieval_pdf_id"
+        pdf_storage[self.pdf_id] = {
+            "filename": "test.pdf",
+            "text": text,
+            "page_count": 1,
+            "index": build_document_index(text)
+        }
+
+    @patch('google.generativeai.GenerativeModel.generate_content')
+    def test_chat_sends_only_selected_chunks(self, mock_generate_content):
+        mock_response = MagicMock()
+        mock_response.text = "Two years."
+        mock_generate_content.return_value = mock_response
+
+        response = asyncio.run(chat_with_pdf(
+            self.pdf_id, ChatRequest(query="How long is the warranty term?")))
+
+        self.assertEqual(response["response"], "Two years.")
+        self.assertTrue(response["chunk_ids"])
+        prompt = mock_generate_content.call_args[0][0]
+        self.assertIn("warranty", prompt)
+        self.assertLess(len(prompt), len(pdf_storage[self.pdf_id]["text"]))
+
+    @patch('google.generativeai.GenerativeModel.generate_content')
+    def test_chat_full_context_mode(self, mock_generate_content):
+        mock_response = MagicMock()
+        mock_response.text = "Full answer."
+        mock_generate_content.return_value = mock_response
+
+        response = asyncio.run(chat_with_pdf(
+            self.pdf_id, ChatRequest(query="Summarize everything", full_context=True)))
+
+        self.assertIsNone(response["chunk_ids"])
+        prompt = mock_generate_content.call_args[0][0]
+        self.assertIn(pdf_storage[self.pdf_id]["text"], prompt)
+
+    @patch('google.generativeai.GenerativeModel.generate_content')
+    def test_full_context_answers_are_cached_apart(self, mock_generate_content):
+        mock_generate_content.side_effect = lambda *args, **kwargs: MagicMock(
+            text=f"Answer {mock_generate_content.call_count}.")
+        query = f"What does the warranty cover? {uuid.uuid4()}"
+
+        retrieved = asyncio.run(chat_with_pdf(self.pdf_id, ChatRequest(query=query)))
+        full = asyncio.run(chat_with_pdf(self.pdf_id, ChatRequest(query=query, full_context=True)))
+        full_again = asyncio.run(chat_with_pdf(self.pdf_id, ChatRequest(query=query, full_context=True)))
+
+        self.assertEqual(mock_generate_content.call_count, 2)
+        self.assertEqual(retrieved["response"], "Answer 1.")
+        self.assertEqual(full["response"], "Answer 2.")
+        self.assertEqual(full_again["response"], "Answer 2.")
+
+
+    @patch('google.generativeai.GenerativeModel.generate_content')
+    def test_evicted_index_is_rebuilt_off_the_event_loop(self, mock_generate_content):
+        mock_generate_content.return_value = MagicMock(text="Two years.")
+        pdf_storage.hot.clear()
+        threads = []
+
+        def record_thread(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return build_document_index(*args, **kwargs)
+
+        with patch("storage.build_document_index", side_effect=record_thread):
+            asyncio.run(chat_with_pdf(
+                self.pdf_id, ChatRequest(query=f"How long is the warranty? {uuid.uuid4()}")))
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import asyncio
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+from fastapi import HTTPException
+from google.api_core import exceptions as google_exceptions
+
+from rate_limiter import RateLimiter
+from retry_logic import (generate_response_from_model, RetryBudget, LatencyWindow,
+                         wait_retry_after, _is_transient)
+from metrics import MODEL_RETRIES, MODEL_HEDGES
+from model_client import run_blocking
+
+
+def fake_model(*outcomes):
+    """A model client whose generate() plays `outcomes` in order: an exception
+    is raised, a (seconds, text) pair answers after a delay, a string at once."""
+    client = MagicMock()
+    calls = []
+
+    async def generate(prompt):
+        outcome = outcomes[min(len(calls), len(outcomes) - 1)]
+        calls.append(prompt)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, tuple):
+            await asyncio.sleep(outcome[0])
+            return outcome[1]
+        return outcome
+
+    client.generate.side_effect = generate
+    return client, calls
+
+
+@patch("retry_logic.MODEL_RETRY_MAX_WAIT", 0.01)
+@patch("retry_logic.model_limiter", RateLimiter())
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        budget = patch("retry_logic.retry_budget", RetryBudget())
+        budget.start()
+        self.addCleanup(budget.stop)
+
+    @patch("retry_logic.get_model_client")
+    def test_transient_errors_are_retried(self, mock_client):
+        client, calls = fake_model(google_exceptions.ServiceUnavailable("down"),
+                                   requests.exceptions.ConnectionError("reset"),
+                                   "answer")
+        mock_client.return_value = client
+        retries = MODEL_RETRIES.value()
+
+        self.assertEqual(asyncio.run(generate_response_from_model("Doc.", "Q?")), "answer")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(MODEL_RETRIES.value() - retries, 2)
+
+    @patch("retry_logic.get_model_client")
+    def test_permanent_errors_are_not_retried(self, mock_client):
+        client, calls = fake_model(google_exceptions.InvalidArgument("bad prompt"), "answer")
+        mock_client.return_value = client
+
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(generate_response_from_model("Doc.", "Q?"))
+        self.assertEqual(context.exception.status_code, 500)
+        self.assertEqual(len(calls), 1)
+
+    @patch("retry_logic.get_model_client")
+    def test_exhausted_retries_map_to_upstream_status(self, mock_client):
+        client, calls = fake_model(google_exceptions.TooManyRequests("quota"))
+        mock_client.return_value = client
+
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(generate_response_from_model("Doc.", "Q?"))
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(len(calls), 3)
+
+    @patch("retry_logic.get_model_client")
+    def test_deadline_bounds_the_whole_call(self, mock_client):
+        client, calls = fake_model((5, "too late"))
+        mock_client.return_value = client
+
+        started = time.monotonic()
+        with self.assertRaises(HTTPException) as context:
+            asyncio.run(generate_response_from_model("Doc.", "Q?", deadline=time.monotonic() + 0.2))
+        self.assertEqual(context.exception.status_code, 504)
+        self.assertLess(time.monotonic() - started, 1)
+
+    @patch("retry_logic.get_model_client")
+    def test_timed_out_thread_keeps_its_limiter_slot(self, mock_client):
+        unblock = threading.Event()
+        finished = threading.Event()
+
+        def blocking_sdk_call():
+            unblock.wait(5)
+            finished.set()
+            return "too late"
+
+        async def generate(prompt):
+            return await run_blocking(blocking_sdk_call)
+
+        mock_client.return_value.generate.side_effect = generate
+        limiter = RateLimiter()
+        with patch("retry_logic.model_limiter", limiter):
+            with self.assertRaises(HTTPException) as context:
+                asyncio.run(generate_response_from_model("Doc.", "Q?", deadline=time.monotonic() + 0.2))
+            self.assertEqual(context.exception.status_code, 504)
+            # The executor thread is still blocked, so its slot is not free yet
+            self.assertEqual(limiter.stats()["active"], 1)
+            unblock.set()
+            finished.wait(1)
+            for _ in range(100):
+                if limiter.stats()["active"] == 0:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(limiter.stats()["active"], 0)
+
+    @patch("retry_logic.get_model_client")
+    def test_spent_budget_stops_retries(self, mock_client):
+        client, calls = fake_model(google_exceptions.ServiceUnavailable("down"), "answer")
+        mock_client.return_value = client
+
+        with patch("retry_logic.retry_budget", RetryBudget(min_per_second=0, max_tokens=0)) as budget:
+            with self.assertRaises(HTTPException) as context:
+                asyncio.run(generate_response_from_model("Doc.", "Q?"))
+        self.assertEqual(context.exception.status_code, 502)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(budget.exhausted, 1)
+
+    @patch("retry_logic.MODEL_HEDGE_ENABLED", True)
+    @patch("retry_logic.get_model_client")
+    def test_slow_call_is_hedged(self, mock_client):
+        client, calls = fake_model((2, "slow"), (0.01, "fast"))
+        mock_client.return_value = client
+        window = LatencyWindow()
+        for _ in range(20):
+            window.add(0.05)
+        hedges = MODEL_HEDGES.value()
+
+        with patch("retry_logic.model_latency", window):
+            started = time.monotonic()
+            self.assertEqual(asyncio.run(generate_response_from_model("Doc.", "Q?")), "fast")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(MODEL_HEDGES.value() - hedges, 1)
+
+
+class TestRetryHelpers(unittest.TestCase):
+
+    def test_transient_classification(self):
+        self.assertTrue(_is_transient(asyncio.TimeoutError()))
+        self.assertTrue(_is_transient(google_exceptions.TooManyRequests("quota")))
+        self.assertTrue(_is_transient(google_exceptions.InternalServerError("oops")))
+        self.assertFalse(_is_transient(google_exceptions.PermissionDenied("no")))
+        self.assertFalse(_is_transient(ValueError("bug")))
+
+    def test_classification_does_not_import_the_sdk(self):
+        with patch.dict(sys.modules):
+            del sys.modules["google.api_core.exceptions"]
+            self.assertFalse(_is_transient(ValueError("bug")))
+            self.assertNotIn("google.api_core.exceptions", sys.modules)
+
+    def test_retry_after_header_sets_the_wait(self):
+        response = MagicMock(headers={"Retry-After": "7"})
+        error = requests.HTTPError(response=response)
+        retry_state = MagicMock()
+        retry_state.outcome.exception.return_value = error
+
+        self.assertEqual(wait_retry_after(lambda state: 0.5)(retry_state), 7.0)
+        retry_state.outcome.exception.return_value = ValueError()
+        self.assertEqual(wait_retry_after(lambda state: 0.5)(retry_state), 0.5)
+
+    def test_budget_refills_from_calls(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        budget.record_call()
+        budget.record_call()
+        self.assertTrue(budget.try_spend())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from models import ChatRequest
+from pdf_routes import chat_with_pdf, chat_flight, pdf_storage
+from singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), ["result"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.coalesced, 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_errors_propagate_to_followers(self):
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def run():
+            return await asyncio.gather(*(flight.do("key", failing) for _ in range(3)),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flight.executions, 1)
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def run():
+            leader = asyncio.create_task(flight.do("key", work))
+            await asyncio.sleep(0)
+            followers = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            results = await asyncio.gather(*followers)
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return results
+
+        self.assertEqual(asyncio.run(run()), ["result"] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_call_is_cancelled_when_nobody_waits(self):
+        flight = SingleFlight()
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.05)
+            finished.append(1)
+            return "result"
+
+        async def run():
+            callers = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for caller in callers:
+                caller.cancel()
+            await asyncio.gather(*callers, return_exceptions=True)
+            self.assertEqual(flight.in_flight(), 0)
+            # A later caller starts a new execution instead of joining the cancelled one
+            result = await flight.do("key", work)
+            await asyncio.sleep(0.06)
+            return result
+
+        self.assertEqual(asyncio.run(run()), "result")
+        self.assertEqual(finished, [1])
+        self.assertEqual(flight.executions, 2)
+
+    def test_identical_chats_coalesce_into_one_model_call(self):
+        pdf_id = "single_flight_pdf"
+        pdf_storage[pdf_id] = {
+            "filename": "test.pdf",
+            "text": "Meeting notes.",
+            "page_count": 1
+        }
+        calls = []
+
+        async def fake_generate(pdf_text, query):
+            calls.append(query)
+            await asyncio.sleep(0.05)
+            return "Shared answer.", {"strategy": "direct", "windows": 1, "timings": {}}
+
+        async def run():
+            request = ChatRequest(query="What was decided in the meeting?")
+            return await asyncio.gather(*(chat_with_pdf(pdf_id, request) for _ in range(10)))
+
+        coalesced_before = chat_flight.coalesced
+        with patch("pdf_routes.generate_planned_response", fake_generate):
+            responses = asyncio.run(run())
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r["response"] == "Shared answer." for r in responses))
+        self.assertEqual(chat_flight.coalesced - coalesced_before, 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
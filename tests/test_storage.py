@@ -0,0 +1,263 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from retrieval import BM25Index
+from main import app
+from storage import DocumentStore, MemoryDocumentStore, SQLiteDocumentStore, compress_text
+
+client = TestClient(app)
+
+
+def make_record(text, content_hash=None, filename="test.pdf", ttl=None):
+    return {"filename": filename, "text": text, "page_count": 1,
+            "content_hash": content_hash, "ttl": ttl}
+
+
+class TestMemoryDocumentStore(unittest.TestCase):
+
+    def test_backends_must_implement_the_store(self):
+        class ReadOnly(DocumentStore):
+            def __getitem__(self, pdf_id):
+                raise KeyError(pdf_id)
+
+        with self.assertRaises(TypeError):
+            ReadOnly()
+
+    def test_find_by_hash(self):
+        store = MemoryDocumentStore()
+        store["a"] = make_record("Shared text.", content_hash="hash-1")
+        store["b"] = make_record("Shared text.", content_hash="hash-1")
+
+        self.assertEqual(store.find_by_hash("hash-1")["text"], "Shared text.")
+        del store["a"]
+        self.assertEqual(store.find_by_hash("hash-1").pdf_id, "b")
+        del store["b"]
+        self.assertIsNone(store.find_by_hash("hash-1"))
+
+    def test_text_is_stored_compressed(self):
+        store = MemoryDocumentStore(hot_size=1)
+        text = "The quick brown fox jumps over the lazy dog. " * 500
+        store["a"] = make_record(text)
+        store["b"] = make_record("Another document.")  # pushes "a" out of the hot LRU
+
+        stats = store.stats()
+        self.assertGreater(stats["compression_ratio"], 10)
+        self.assertLess(stats["compressed_bytes"], stats["raw_bytes"])
+        self.assertEqual(stats["hot_documents"], 1)
+        self.assertEqual(store["a"]["text"], text)
+
+    def test_memory_budget_evicts_cold_documents(self):
+        store = MemoryDocumentStore(memory_budget=2500)
+        for i in range(5):
+            store[f"pdf-{i}"] = make_record(os.urandom(500).hex())
+        store["pdf-4"]["text"]
+
+        self.assertLessEqual(store.stats()["compressed_bytes"], 2500)
+        self.assertGreater(store.evictions, 0)
+        self.assertNotIn("pdf-0", store)
+        self.assertIn("pdf-4", store)
+
+    def test_hot_bytes_count_the_index(self):
+        text = " ".join(f"term{i}" for i in range(5000))
+        store = MemoryDocumentStore()
+        store["a"] = make_record(text)
+        text_bytes = store.stats()["hot_bytes"]
+        self.assertGreaterEqual(text_bytes, len(text))
+
+        index = store["a"]["index"]
+        self.assertEqual(store.stats()["hot_bytes"], text_bytes + index.memory_bytes())
+        self.assertGreater(index.memory_bytes(), 3 * text_bytes)
+
+        # Room for the text but not for its index: the hot copy is dropped, the document kept
+        budget = store.stats()["compressed_bytes"] + text_bytes + 1000
+        store = MemoryDocumentStore(memory_budget=budget)
+        store["a"] = make_record(text)
+        self.assertEqual(store.stats()["hot_documents"], 1)
+        self.assertIsNotNone(store["a"]["index"])
+        self.assertEqual(store.stats()["hot_documents"], 0)
+        self.assertLessEqual(store.stats()["bytes_used"], budget)
+        self.assertIn("a", store)
+
+    def test_per_document_ttl(self):
+        store = MemoryDocumentStore()
+        store["short"] = make_record("Short lived.", ttl=60)
+        store["forever"] = make_record("Kept.")
+
+        with patch("storage.time.time", return_value=10 ** 12):
+            self.assertNotIn("short", store)
+            self.assertIn("forever", store)
+        self.assertEqual(store.expirations, 1)
+        self.assertEqual(len(store), 1)
+
+    def test_removal_listeners_see_the_last_shared_text_go(self):
+        store = MemoryDocumentStore(memory_budget=2500)
+        removed = []
+        store.add_removal_listener(removed.append)
+        store["a"] = make_record("Shared text.", content_hash="hash-1")
+        store["b"] = make_record("Shared text.", content_hash="hash-1")
+        store["short"] = make_record("Short lived.", ttl=60)
+
+        del store["a"]
+        self.assertEqual(removed, [])
+        del store["b"]
+        with patch("storage.time.time", return_value=10 ** 12):
+            self.assertNotIn("short", store)
+        for i in range(5):
+            store[f"pdf-{i}"] = make_record(os.urandom(500).hex())
+        self.assertEqual(removed[:3], ["hash-1", "short", "pdf-0"])
+
+    def test_page_offsets_are_kept_with_the_text(self):
+        store = MemoryDocumentStore(hot_size=1)
+        record = make_record("Page one. Page two.")
+        record["page_offsets"] = [0, 10, 19]
+        store["a"] = record
+        store["b"] = make_record("No pages recorded.")
+
+        self.assertEqual(store["a"]["page_offsets"], [0, 10, 19])
+        self.assertEqual(store["a"]["index"].chunk_pages, [(1, 2)])
+        self.assertIsNone(store["b"]["page_offsets"])
+
+    def test_stats_endpoint(self):
+        response = client.get("/v1/storage/stats")
+
+        self.assertEqual(response.status_code, 200)
+        for field in ("documents", "bytes_used", "compressed_bytes", "compression_ratio"):
+            self.assertIn(field, response.json())
+
+
+class TestSQLiteDocumentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "documents.db")
+        self.store = SQLiteDocumentStore(self.path, hot_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_documents_visible_to_other_workers_and_after_restart(self):
+        self.store["pdf-1"] = make_record("Persistent text.")
+
+        other_worker = SQLiteDocumentStore(self.path)
+        self.assertIn("pdf-1", other_worker)
+        self.assertEqual(other_worker["pdf-1"]["text"], "Persistent text.")
+        self.assertEqual(other_worker["pdf-1"]["filename"], "test.pdf")
+        self.assertNotIn("pdf-2", other_worker)
+        with self.assertRaises(KeyError):
+            other_worker["pdf-2"]
+
+    def test_text_is_loaded_lazily(self):
+        self.store["pdf-1"] = make_record("Lazy text.")
+        other_worker = SQLiteDocumentStore(self.path)
+
+        document = other_worker["pdf-1"]
+        self.assertEqual(document["page_count"], 1)
+        self.assertEqual(len(other_worker.hot), 0)
+
+        self.assertEqual(document["text"], "Lazy text.")
+        self.assertIsInstance(document["index"], BM25Index)
+        self.assertEqual(len(other_worker.hot), 1)
+
+    def test_hot_cache_is_bounded(self):
+        for i in range(4):
+            self.store[f"pdf-{i}"] = make_record(f"Text {i}.")
+            self.store[f"pdf-{i}"]["text"]
+
+        self.assertEqual(len(self.store.hot), 2)
+        self.assertEqual(self.store["pdf-0"]["text"], "Text 0.")
+
+    def test_same_content_shares_one_blob(self):
+        self.store["pdf-1"] = make_record("Same bytes.", content_hash="hash-1")
+        self.store["pdf-2"] = make_record("Same bytes.", content_hash="hash-1")
+
+        blobs = self.store._connection().execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        self.assertEqual(blobs, 1)
+        self.assertEqual(self.store.find_by_hash("hash-1")["text"], "Same bytes.")
+
+        del self.store["pdf-1"]
+        self.assertEqual(self.store["pdf-2"]["text"], "Same bytes.")
+        del self.store["pdf-2"]
+        self.assertIsNone(self.store.find_by_hash("hash-1"))
+        self.assertEqual(len(self.store), 0)
+
+    def test_page_offsets_persist(self):
+        record = make_record("Page one. Page two.")
+        record["page_offsets"] = [0, 10, 19]
+        self.store["pdf-1"] = record
+
+        other_worker = SQLiteDocumentStore(self.path)
+        self.assertEqual(other_worker["pdf-1"]["page_offsets"], [0, 10, 19])
+        self.assertEqual(other_worker["pdf-1"]["index"].chunk_pages, [(1, 2)])
+
+    def test_text_length_and_normalizer_are_read_without_the_text(self):
+        record = make_record("Grüße aus Köln.")
+        record["normalizer"] = "1:NFC:11"
+        self.store["pdf-1"] = record
+
+        other_worker = SQLiteDocumentStore(self.path)
+        document = other_worker["pdf-1"]
+        self.assertEqual((document["text_length"], document["normalizer"]), (15, "1:NFC:11"))
+        self.assertEqual(document.read_text(), "Grüße aus Köln.")
+        self.assertEqual(len(other_worker.hot), 0)
+
+    def test_databases_without_page_offsets_are_upgraded(self):
+        path = os.path.join(self.directory, "old.db")
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE blobs (blob_key TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                         "raw_bytes INTEGER NOT NULL)")
+
+        store = SQLiteDocumentStore(path)
+        store["pdf-1"] = make_record("Old database.")
+        self.assertIsNone(store["pdf-1"]["page_offsets"])
+        self.assertEqual(store["pdf-1"]["text_length"], 13)
+
+    def test_ttl_and_compression(self):
+        self.store["short"] = make_record("Expiring text. " * 100, ttl=60)
+
+        stats = self.store.stats()
+        self.assertGreater(stats["compression_ratio"], 1)
+        with patch("storage.time.time", return_value=10 ** 12):
+            self.assertNotIn("short", self.store)
+            self.assertEqual(len(self.store), 0)
+            # Reads leave the row alone; the next write deletes it
+            self.assertGreater(self.store.stats()["compressed_bytes"], 0)
+            self.store["later"] = make_record("Later text.")
+        self.assertEqual(self.store.ids(), ["later"])
+        self.assertEqual(self.store.expirations, 1)
+        self.assertEqual(self.store.stats()["compressed_bytes"],
+                         len(compress_text("Later text.")))
+
+    def test_expired_reads_do_not_wait_for_writers(self):
+        self.store["short"] = make_record("Expiring text.", ttl=60)
+        writer = sqlite3.connect(self.path)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")  # another worker holds the write lock
+
+        with patch("storage.time.time", return_value=10 ** 12):
+            self.assertNotIn("short", self.store)
+            self.assertIsNone(self.store.get("short"))
+        writer.rollback()
+
+    def test_removal_listeners(self):
+        removed = []
+        self.store.add_removal_listener(removed.append)
+        self.store["pdf-1"] = make_record("Same bytes.", content_hash="hash-1")
+        self.store["pdf-2"] = make_record("Same bytes.", content_hash="hash-1")
+        self.store["short"] = make_record("Expiring text.", ttl=60)
+
+        del self.store["pdf-1"]
+        del self.store["pdf-2"]
+        self.assertEqual(removed, ["hash-1"])
+        with patch("storage.time.time", return_value=10 ** 12):
+            self.store["pdf-3"] = make_record("Stored after the expiry.")
+        self.assertEqual(removed, ["hash-1", "short"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import unittest
+
+from reportlab.pdfgen import canvas
+
+from pdf_processing import iter_page_texts
+from similarity_cache import normalize_for_similarity
+from text_normalization import TextNormalizer, normalize_text
+
+
+class TestTextNormalization(unittest.TestCase):
+
+    def test_non_ascii_text_is_kept(self):
+        self.assertEqual(normalize_text("Die Kündigung  der\nGeschäftsbedingungen"),
+                         "Die Kündigung der Geschäftsbedingungen")
+        self.assertEqual(normalize_text("Sözleşme ışık ağaç\tşartları"), "Sözleşme ışık ağaç şartları")
+
+    def test_whitespace_is_collapsed(self):
+        self.assertEqual(normalize_text("  Page 1\n\nline  one\t\ttwo \n"), "Page 1 line one two")
+        self.assertEqual(normalize_text("a\u00a0b\u2003c"), "a b c")
+
+    def test_ligatures_and_invisible_characters(self):
+        self.assertEqual(normalize_text("ﬁnanziell oﬀen"), "finanziell offen")
+        self.assertEqual(normalize_text("Zah\u200blungs\u00adfrist\ufeff"), "Zahlungsfrist")
+        # Without a compatibility form, ligatures are still expanded by the table
+        self.assertEqual(TextNormalizer(form="NFC")("ﬂow"), "flow")
+        self.assertEqual(TextNormalizer(form="none", repair_ligatures=False)("ﬂow"), "ﬂow")
+
+    def test_unicode_normalization_form(self):
+        decomposed = "Ku\u0308ndigung"
+        self.assertEqual(normalize_text(decomposed), "Kündigung")
+        # NFC (the default) keeps compatibility characters as printed
+        self.assertEqual(normalize_text("Fläche 20 m² ½ ＡＢＣ"), "Fläche 20 m² ½ ＡＢＣ")
+        nfkc = TextNormalizer(form="NFKC")
+        self.assertEqual(nfkc("ＡＢＣ ①"), "ABC 1")  # NFKC folds width and circles
+        self.assertEqual(nfkc("20 m²"), "20 m2")
+        self.assertEqual(TextNormalizer(form="none")(decomposed), decomposed)
+        with self.assertRaises(ValueError):
+            TextNormalizer(form="NFX")
+
+    def test_hyphenation_is_repaired(self):
+        self.assertEqual(normalize_text("the exam-\nple shows Rück-\n  erstattung"),
+                         "the example shows Rückerstattung")
+        # A capital after the break is a compound, so the hyphen stays
+        self.assertEqual(normalize_text("Baden-\nWürttemberg"), "Baden-Württemberg")
+        self.assertEqual(normalize_text("soft\u00ad\nhyphen"), "softhyphen")
+        # Numbers, list dashes and hyphens within a line are left alone
+        self.assertEqual(normalize_text("pages 3-\n5 and\n- item well-known"),
+                         "pages 3- 5 and - item well-known")
+        self.assertEqual(TextNormalizer(repair_hyphenation=False)("exam-\nple"), "exam- ple")
+
+    def test_similarity_words_keep_non_ascii_letters(self):
+        self.assertEqual(normalize_for_similarity("Kündigung für Müşteri"), ["kündigung", "für", "müşteri"])
+
+    def test_extracted_pages_keep_accented_text(self):
+        path = "test_normalization.pdf"
+        c = canvas.Canvas(path)
+        c.drawString(100, 750, "Die Kündigung der Straße ist gültig.")
+        c.save()
+        self.addCleanup(os.remove, path)
+
+        for backend in ("pdfplumber", "pdfminer"):
+            self.assertEqual(list(iter_page_texts(path, extractor=backend)),
+                             ["Die Kündigung der Straße ist gültig."], backend)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import io
+import shutil
+import tempfile
+import time
+import unittest
+import uuid
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from reportlab.pdfgen import canvas
+
+from main import app
+from pdf_routes import pdf_storage
+from corpus_index import CorpusIndex
+from jobs import jobs, create_job, complete_job, fail_job, prune_jobs
+
+client = TestClient(app)
+
+
+class TestAsyncUploadJobs(unittest.TestCase):
+
+    def setUp(self):
+        # Keep indexed uploads out of the working directory's corpus index
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = patch("pdf_routes.corpus_index", CorpusIndex(directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _upload(self, params=None):
+        # Unique content per upload so duplicate detection doesn't short-circuit the job
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer)
+        c.drawString(100, 750, f"This is an async upload test PDF {uuid.uuid4()}.")
+        c.save()
+        buffer.seek(0)
+        return client.post("/v1/pdf", params=params,
+                           files={"file": ("test_job.pdf", buffer, "application/pdf")})
+
+    def test_async_upload_returns_202_and_completes(self):
+        response = self._upload({"async": "true"})
+        self.assertEqual(response.status_code, 202)
+        pdf_id = response.json()["pdf_id"]
+
+        deadline = time.time() + 30
+        status = None
+        while time.time() < deadline:
+            status = client.get(f"/v1/pdf/{pdf_id}/status").json()
+            if status["status"] in ("completed", "failed"):
+                break
+            time.sleep(0.05)
+
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual(status["page_count"], 1)
+        self.assertIn("async upload test", pdf_storage[pdf_id]["text"])
+
+    def test_status_of_sync_upload(self):
+        pdf_id = self._upload().json()["pdf_id"]
+
+        status = client.get(f"/v1/pdf/{pdf_id}/status").json()
+        self.assertEqual(status["status"], "completed")
+
+    def test_finished_jobs_are_pruned(self):
+        create_job("running_job", "running.pdf")
+        create_job("old_job", "old.pdf")
+        fail_job("old_job", "broken")
+        create_job("recent_job", "recent.pdf")
+        complete_job("recent_job", 1)
+        jobs["old_job"]["finished_at"] -= 7200
+
+        self.assertEqual(prune_jobs(retention=3600), 1)
+        self.assertNotIn("old_job", jobs)
+        self.assertIn("running_job", jobs)
+        self.assertIn("recent_job", jobs)
+        self.assertEqual(client.get("/v1/pdf/old_job/status").status_code, 404)
+        for pdf_id in ("running_job", "recent_job"):
+            jobs.pop(pdf_id)
+
+    def test_status_unknown_pdf(self):
+        response = client.get("/v1/pdf/unknown_pdf_id/status")
+        self.assertEqual(response.status_code, 404)
+
+    @patch("jobs.EXTRACTION_QUEUE_DEPTH", 0)
+    def test_full_queue_returns_503(self):
+        response = self._upload({"async": "true"})
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import re
+import unicodedata
+
+from config import TEXT_NORMALIZATION_FORM, TEXT_REPAIR_LIGATURES, TEXT_REPAIR_HYPHENATION
+
+UNICODE_FORMS = ("NFC", "NFKC", "NFD", "NFKD")
+
+# Bump when a change to the steps below changes the normalized text
+NORMALIZER_REVISION = 1
+
+# Latin ligatures PDF fonts emit as single glyphs (NFKC expands these too)
+LIGATURES = {
+    "\ufb00": "ff", "\ufb01": "fi", "\ufb02": "fl", "\ufb03": "ffi",
+    "\ufb04": "ffl", "\ufb05": "st", "\ufb06": "st",
+}
+
+# Invisible characters that split words: zero-width space, word joiner, BOM, soft hyphen
+INVISIBLE = "\u200b\u2060\ufeff\u00ad"
+
+# A word broken over a line with a hyphen, a Unicode hyphen or a soft hyphen.
+# Group 1 is the hyphen, group 2 the first letter after the line break. The
+# pattern starts with the hyphen (the letter before it is a lookbehind) so the
+# regex engine can skip ahead to hyphen characters.
+HYPHENATED_LINE_BREAK = re.compile(r"([-\u2010\u00ad])(?<=[^\W\d_].)[ \t]*\n\s*(?=([^\W\d_]))")
+
+
+def _join_hyphenated(match):
+    # "exam-\nple" -> "example"; "Baden-\nWürttemberg" keeps its hyphen
+    if match.group(1) == "\u00ad" or match.group(2).islower():
+        return ""
+    return match.group(1)
+
+
+class TextNormalizer:
+    """Normalizes extracted page text, keeping every script intact.
+
+    Each step is a C-level scan of the page: a compiled pattern rejoins words
+    hyphenated across lines, a second one drops invisible characters and
+    expands ligatures through a replacement table, `unicodedata` applies the
+    Unicode normalization form and `str.split` collapses whitespace. ASCII
+    pages skip the Unicode steps.
+    """
+
+    def __init__(self, form=TEXT_NORMALIZATION_FORM, repair_ligatures=TEXT_REPAIR_LIGATURES,
+                 repair_hyphenation=TEXT_REPAIR_HYPHENATION):
+        form = form.upper() if form else "NONE"
+        if form != "NONE" and form not in UNICODE_FORMS:
+            raise ValueError(f"Unknown Unicode normalization form: {form}")
+        self.form = None if form == "NONE" else form
+        self.repair_hyphenation = repair_hyphenation
+        # Identifies the output, so offsets stored against older text are not reused
+        self.version = "%d:%s:%d%d" % (NORMALIZER_REVISION, form, bool(repair_ligatures),
+                                       bool(repair_hyphenation))
+        self._replacements = dict.fromkeys(INVISIBLE, "")
+        if repair_ligatures:
+            self._replacements.update(LIGATURES)
+        self._pattern = re.compile("[%s]" % "".join(self._replacements))
+
+    def _replace(self, match):
+        return self._replacements[match.group()]
+
+    def __call__(self, text):
+        if self.repair_hyphenation:
+            text = HYPHENATED_LINE_BREAK.sub(_join_hyphenated, text)
+        if not text.isascii():
+            text = self._pattern.sub(self._replace, text)
+            if self.form:
+                # Ligatures are already expanded, so most pages pass the quick check
+                text = unicodedata.normalize(self.form, text)
+        return " ".join(text.split())
+
+
+default_normalizer = TextNormalizer()
+
+
+def normalize_text(text):
+    """Normalizes one page (or any text) with the configured settings."""
+    return default_normalizer(text)